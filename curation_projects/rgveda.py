@@ -1,8 +1,9 @@
+import argparse
 import logging
 
 import regex
 
-from video_curation import youtube_client, video_repo
+from video_curation import youtube_client, video_repo, upload_pool, upload_sessions, bandwidth, sync_engine, request_scheduler, channel_runner
 
 # Remove all handlers associated with the root logger object.
 for handler in logging.root.handlers[:]:
@@ -21,50 +22,81 @@ description = "This was produced by an IGNCA project (http://vedicheritage.gov.i
 
 video_tags = ["RIGSSK", "Veda", "वेदाः"]
 
+
+def get_mandala_id(item):
+    """Eg. "RIGSS 01", for videos as well as playlists."""
+    match = regex.search(r'(RIGSS \d\d)', item.title or "")
+    return None if match is None else match.group(1)
+
+
+def get_mandala_sukta_id(item):
+    """Eg. "RIGSS 01 001"."""
+    match = regex.search('(RIGSS .. ...)', item.title or "")
+    return None if match is None else match.group(1)
+
+
+index_keys = {"mandala": get_mandala_id, "sukta": get_mandala_sukta_id}
+
+
+def add_index_keys(yt_channel):
+    for name, key_function in index_keys.items():
+        yt_channel.add_index_key(name=name, key_function=key_function)
+
+
 class RgvedaRepo(video_repo.VideoRepo):
     
     def get_mandala_videos_map(self, mandala_id):
-        return dict(filter(lambda item: "RIGSS %02d" % (mandala_id) in item[0], self.title_to_path.items()))
+        return dict(self.get_titles_and_paths(title_substring="RIGSS %02d" % (mandala_id)))
 
-    def upload_mandala_videos(self, mandala_id, yt_channel, dry_run=False):
-        yt_mandala_videos = sorted(list(filter(lambda vid: "RIGSS %02d" % (mandala_id) in vid.title, yt_channel.uploaded_vids)))
-        yt_mandala_video_titles = list(map(lambda video: video.title, yt_mandala_videos))
-        yt_mandala_video_ids =  list(map(lambda title: regex.search('(RIGSS .. ...)', title).group(1), yt_mandala_video_titles))
+    def upload_mandala_videos(self, mandala_id, yt_channel, dry_run=False, num_workers=4, session_store=None, bandwidth_limiter=None, priority=0):
+        add_index_keys(yt_channel)
+        yt_mandala_videos = sorted(yt_channel.video_index.get("mandala", "RIGSS %02d" % (mandala_id)))
+        yt_mandala_video_ids = [yt_channel.video_index.get_key("sukta", video) for video in yt_mandala_videos]
         logging.info("Got %d vids: %s ", len(yt_mandala_videos), yt_mandala_videos)
         local_mandala_videos_map = self.get_mandala_videos_map(mandala_id=mandala_id)
         missing_mandala_video_titles = sorted(set(local_mandala_videos_map.keys()) - set(yt_mandala_video_ids))
+        # Skip malformed files, and files byte-identical to uploaded or earlier files.
+        self.update_content_index()
+        self.update_probe_index()
+        uploaded_checksums = [self.content_index.get_checksum(local_mandala_videos_map[title]) for title in set(local_mandala_videos_map.keys()).intersection(yt_mandala_video_ids)]
+        unique_paths = set(self.get_unique_paths(paths=self.get_sound_paths([local_mandala_videos_map[title] for title in missing_mandala_video_titles]), known_checksums=uploaded_checksums))
+        missing_mandala_video_titles = [title for title in missing_mandala_video_titles if local_mandala_videos_map[title] in unique_paths]
         logging.info("Missing videos: %s", missing_mandala_video_titles)
+        jobs = []
         for title in missing_mandala_video_titles:
             video = youtube_client.YtVideo(title=title, description=description, api_service=yt_channel.api_service, privacy='public', tags=video_tags)
             if dry_run:
                 logging.info("Would have uploaded: %s", video)
             else:
-                video.initialize_upload(filepath=local_mandala_videos_map[title])
+                jobs.append(upload_pool.UploadJob(video=video, filepath=local_mandala_videos_map[title], priority=priority))
+        upload_pool.UploadPool(http_factory=yt_channel.new_http, num_workers=num_workers, session_store=session_store, bandwidth_limiter=bandwidth_limiter).upload(jobs=jobs)
+        for job in jobs:
+            if job.status == 'done':
+                yt_channel.index_video(job.video)
 
-    def upload_videos(self):
+    def upload_videos(self, yt_channel):
         for mandala_id in range(1, 11):
-            self.upload_mandala_videos(mandala_id=mandala_id, yt_channel=channel, dry_run=False)
+            self.upload_mandala_videos(mandala_id=mandala_id, yt_channel=yt_channel, dry_run=False)
 
 
     def update_video_metadatas(self, yt_channel):
-        yt_mandala_videos = sorted(list(filter(lambda vid: "RIGSS " in vid.title, yt_channel.uploaded_vids)))
-        for video in yt_mandala_videos:
-            video.title = get_video_title(video.title[:len("RIGSS 10 048")])
-            video.description = description
-            video.tags = video_tags
-            video.category_id = 27
-            video.sync_metadata_to_youtube()
+        """Apply the title, description and tags templates to all sukta videos. Only videos differing from the templates are updated."""
+        add_index_keys(yt_channel)
+        video_metadatas = {}
+        for video in yt_channel.video_index.get_all("sukta"):
+            video_metadatas[video.id] = {"title": get_video_title(yt_channel.video_index.get_key("sukta", video)), "description": description,
+                                         "tags": video_tags, "category_id": 27}
+        yt_channel.set_video_metadatas(video_metadatas=video_metadatas)
 
     def update_video_privacy(self, yt_channel):
-        yt_mandala_videos = sorted(list(filter(lambda vid: "RIGSS " in vid.title, yt_channel.uploaded_vids)))
-        for video in yt_mandala_videos:
-            video.privacy = 'public'
-            video.set_youtube_privacy()
+        add_index_keys(yt_channel)
+        yt_channel.set_video_metadatas(video_metadatas=dict([(video.id, {"privacy": "public"}) for video in yt_channel.video_index.get_all("sukta")]))
 
     def set_mandala_videos_in_playlist(self, mandala_id, yt_channel):
+        add_index_keys(yt_channel)
         mandala_id_str = "RIGSS %02d" % (mandala_id)
-        yt_mandala_videos = sorted(list(filter(lambda vid: mandala_id_str in vid.title, yt_channel.uploaded_vids)))
-        possible_playlists = list(filter(lambda plist: mandala_id_str in plist.title,  yt_channel.playlists))
+        yt_mandala_videos = sorted(yt_channel.video_index.get("mandala", mandala_id_str))
+        possible_playlists = yt_channel.playlist_index.get("mandala", mandala_id_str)
         playlist = None
         if len(possible_playlists) > 0:
             playlist = possible_playlists[0]
@@ -72,26 +104,81 @@ class RgvedaRepo(video_repo.VideoRepo):
         else:
             playlist = youtube_client.Playlist(title=get_playlist_title(mandala_id=mandala_id_str), description=description, tags=video_tags, api_service=yt_channel.api_service, privacy='public')
             playlist.add_to_youtube()
+            yt_channel.index_playlist(playlist)
         video_ids = [video.id for video in yt_mandala_videos]
-        playlist.set_videos(video_ids=video_ids)
+        playlist.set_videos(video_ids=video_ids, batch_size=youtube_client.DEFAULT_BATCH_SIZE)
+
+    def get_desired_state(self, yt_channel, mandala_ids):
+        """Sukta videos (from local files, or already at YouTube) with the templated metadata, and a playlist per mandala holding its suktas in order.
+
+        Keys are as from get_mandala_sukta_id and get_mandala_id - see :py:meth:get_sync_engine .
+        """
+        add_index_keys(yt_channel)
+        self.update_content_index()
+        self.update_probe_index()
+        videos = []
+        playlists = []
+        for mandala_id in mandala_ids:
+            mandala_id_str = "RIGSS %02d" % (mandala_id)
+            local_mandala_videos_map = self.get_mandala_videos_map(mandala_id=mandala_id)
+            yt_sukta_ids = set(yt_channel.video_index.get_key("sukta", video) for video in yt_channel.video_index.get("mandala", mandala_id_str))
+            # Skip malformed files, and files byte-identical to uploaded or earlier files.
+            uploaded_checksums = [self.content_index.get_checksum(local_mandala_videos_map[sukta_id]) for sukta_id in yt_sukta_ids.intersection(local_mandala_videos_map.keys())]
+            unique_paths = set(self.get_unique_paths(paths=self.get_sound_paths([local_mandala_videos_map[sukta_id] for sukta_id in sorted(set(local_mandala_videos_map.keys()) - yt_sukta_ids)]), known_checksums=uploaded_checksums))
+            sukta_ids = sorted(yt_sukta_ids.union([sukta_id for (sukta_id, path) in local_mandala_videos_map.items() if sukta_id in yt_sukta_ids or path in unique_paths]) - {None})
+            for sukta_id in sukta_ids:
+                videos.append(sync_engine.DesiredVideo(key=sukta_id, title=get_video_title(sukta_id), description=description, tags=video_tags, category_id=27,
+                                                       privacy="public", filepath=local_mandala_videos_map.get(sukta_id)))
+            playlists.append(sync_engine.DesiredPlaylist(key=mandala_id_str, title=get_playlist_title(mandala_id=mandala_id_str), video_keys=sukta_ids,
+                                                         description=description, tags=video_tags))
+        return sync_engine.DesiredState(videos=videos, playlists=playlists)
+
+    def get_sync_engine(self, yt_channel, **kwargs):
+        return sync_engine.SyncEngine(channel=yt_channel, video_key_function=get_mandala_sukta_id, playlist_key_function=get_mandala_id, **kwargs)
+
+
+def sync_channel(channel, repo_paths, manifest_path, session_store_path, mandala_ids=range(1, 11), apply=False, bandwidth_windows=()):
+    """Plan (and, if apply, carry out) the sync of channel with the local repo. A job for :py:class:video_curation.channel_runner.ChannelRunner .
+
+    :param bandwidth_windows: Upload bandwidth limits by time of day - see :py:class:video_curation.bandwidth.BandwidthSchedule . Unlimited by default.
+    :return: The plan, as described for humans.
+    """
+    local_repo = RgvedaRepo(repo_paths=repo_paths, manifest_path=manifest_path)
+    # channel.delete_rejected_videos(dry_run=True)
+    engine = local_repo.get_sync_engine(yt_channel=channel, session_store=upload_sessions.UploadSessionStore(path=session_store_path), bandwidth_limiter=bandwidth.BandwidthLimiter(schedule=bandwidth.BandwidthSchedule(windows=list(bandwidth_windows))))
+    logging.info("Retrieving uploaded videos and playlists.")
+    engine.read()
+    plan = engine.plan(desired_state=local_repo.get_desired_state(yt_channel=channel, mandala_ids=mandala_ids))
+    if apply:
+        engine.apply(plan)
+    return plan.describe()
 
 
 if __name__ == "__main__":
-    local_repo = RgvedaRepo(repo_paths=["/home/vvasuki/Videos/Rgveda/"]) 
+    parser = argparse.ArgumentParser(description="Sync the Rgveda channels with the local repo. Only prints the plan, unless --apply is given.")
+    parser.add_argument("--apply", action="store_true", help="Carry out the plan: upload, update metadata and set up the mandala playlists.")
+    parser.add_argument("--bandwidth-hours", default="9-21", help="Local hours START-END (eg. 9-21, or 22-6 around midnight) during which uploads are limited to --bandwidth-limit. Empty for no limit.")
+    parser.add_argument("--bandwidth-limit", type=float, default=1e6, help="Upload bytes per second within --bandwidth-hours; 0 pauses uploads then.")
+    args = parser.parse_args()
+    bandwidth_windows = []
+    if args.bandwidth_hours != "":
+        start_hour, end_hour = [float(hour) for hour in args.bandwidth_hours.split("-")]
+        bandwidth_windows.append((start_hour, end_hour, args.bandwidth_limit))
     # Passing service_account_file does not seem to work as intended.
-    channel = youtube_client.Channel(token_file_path='/home/vvasuki/sysconf/kunchikA/google/kashcit/yt_access_token.json', client_secret_file='/home/vvasuki/sysconf/kunchikA/google/kashcit/native_client_id.json')
-    logging.info("Retrieving uploaded videos.")
-    channel.set_uploaded_videos()
-    channel.set_playlists()
-    # channel.delete_rejected_videos(dry_run=True)
-    # for mandala_id in range(10, 11):
-    #     local_repo.upload_mandala_videos(mandala_id=mandala_id, yt_channel=channel, dry_run=False)
-    # local_repo.update_video_metadatas(channel)
-    # local_repo.update_video_privacy(channel)
-    for mandala_id in range(10, 11):
-        local_repo.set_mandala_videos_in_playlist(mandala_id=mandala_id, yt_channel=channel)
+    # Each channel gets a worker process, credentials, caches and quota budget of its own; more channels may be listed here (or loaded via channel_runner.load_channel_configs).
+    configs = [channel_runner.ChannelConfig(name="kashcit", token_file_path='/home/vvasuki/sysconf/kunchikA/google/kashcit/yt_access_token.json', client_secret_file='/home/vvasuki/sysconf/kunchikA/google/kashcit/native_client_id.json',
+                                            cache_dir='/home/vvasuki/.cache/video_curation', daily_quota=request_scheduler.DEFAULT_DAILY_QUOTA, channel_kwargs={"max_concurrency": 8},
+                                            job_kwargs={"repo_paths": ["/home/vvasuki/Videos/Rgveda/"], "manifest_path": '/home/vvasuki/.cache/video_curation/rgveda_manifest.sqlite',
+                                                        "session_store_path": '/home/vvasuki/.cache/video_curation/kashcit_upload_sessions.json', "apply": args.apply,
+                                                        "bandwidth_windows": bandwidth_windows})]
+    report = channel_runner.ChannelRunner(configs=configs, job=sync_channel).run()
+    report.dump(path='/home/vvasuki/.cache/video_curation/rgveda_run_report.json')
+    for result in report.results:
+        print(result.name, result.result or result.traceback)
+    print(report.describe())
     # logging.info(pprint.pformat(uploaded_vids))
 
-    # archive_item = audio_curation.archive_utility.ArchiveItem(archive_id="shAkhala-rig-veda-kerala")
-    # archive_item.update_archive_item(file_paths=glob.glob("/home/vvasuki/Videos/Rgveda/*"))
+    # local_repo = RgvedaRepo(repo_paths=["/home/vvasuki/Videos/Rgveda/"], manifest_path='/home/vvasuki/.cache/video_curation/rgveda_manifest.sqlite')
+    # local_repo.archive_item = archive_mirror.ArchiveItem.from_config_file(identifier="shAkhala-rig-veda-kerala")
+    # local_repo.mirror_to_archive(state_path='/home/vvasuki/.cache/video_curation/rgveda_archive_uploads.json', dry_run=True)
 
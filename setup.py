@@ -70,9 +70,12 @@ setup(
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.9',
     ],
 
+    # zoneinfo, used for quota windows, is new in Python 3.9.
+    python_requires='>=3.9',
+
     # What does your project relate to?
     keywords='video internet-archive',
 
@@ -0,0 +1,53 @@
+import os
+
+from tests.fake_archive import FakeArchive
+from tests.helpers import get_mp4_bytes, get_sukta_file_name, write_sukta_files
+from video_curation import archive_mirror, video_repo
+
+
+def test_mirror_to_archive(tmp_path):
+    """Mirroring files to a new archive.org item (over a flaky connection), and again after changing one file."""
+    repo_path = str(tmp_path)
+    with FakeArchive(error_rate=0.1) as fake:
+        paths = write_sukta_files(repo_path=repo_path, size=20)
+        item = archive_mirror.ArchiveItem(identifier="test", access_key="key", secret_key="secret", metadata_url=fake.metadata_url, s3_url=fake.s3_url, backoff_seconds=0)
+        repo = video_repo.VideoRepo(repo_paths=[repo_path], archive_item=item)
+        assert repo.mirror_to_archive() == {}
+        contents = {}
+        for path in paths:
+            with open(path, "rb") as f:
+                contents[os.path.basename(path)] = f.read()
+        assert fake.items["test"] == contents
+
+        with open(os.path.join(repo_path, get_sukta_file_name(0)), "wb") as f:
+            f.write(os.urandom(2048))
+        bytes_received = fake.bytes_received
+        assert repo.mirror_to_archive() == {}
+        # Retries aside, just the changed file is sent.
+        assert fake.bytes_received - bytes_received in [2048, 2 * 2048]
+        assert len(fake.items["test"][get_sukta_file_name(0)]) == 2048
+
+        # New files are found by the (incremental) rescan; a full one finds nothing more.
+        with open(os.path.join(repo_path, get_sukta_file_name(20)), "wb") as f:
+            f.write(get_mp4_bytes())
+        assert repo.mirror_to_archive() == {}
+        assert get_sukta_file_name(20) in fake.items["test"]
+        bytes_received = fake.bytes_received
+        assert repo.mirror_to_archive(full_rescan=True) == {}
+        assert fake.bytes_received == bytes_received
+
+
+def test_mirror_state(tmp_path):
+    """Files uploaded by an earlier run are not sent again, even if archive.org does not list them yet."""
+    repo_path = str(tmp_path)
+    with FakeArchive() as fake:
+        write_sukta_files(repo_path=repo_path, size=3)
+        state_path = os.path.join(repo_path, "state.json")
+        item = archive_mirror.ArchiveItem(identifier="test", access_key="key", secret_key="secret", metadata_url=fake.metadata_url, s3_url=fake.s3_url, backoff_seconds=0)
+        repo = video_repo.VideoRepo(repo_paths=[repo_path], archive_item=item)
+        assert repo.mirror_to_archive(state_path=state_path) == {}
+        del fake.items["test"]
+        request_count = fake.request_count
+        assert repo.mirror_to_archive(state_path=state_path) == {}
+        # Just the listing.
+        assert fake.request_count - request_count == 1
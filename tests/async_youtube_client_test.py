@@ -0,0 +1,23 @@
+from tests.fake_youtube import FakeYoutube
+from tests.helpers import add_sukta_videos, make_channel
+
+
+def test_concurrent_reads():
+    fake = FakeYoutube(latency=0.001)
+    video_ids = add_sukta_videos(fake, indices=range(120))
+    for index in range(10):
+        fake.add_playlist(title="RIGSS %02d" % (index + 1), video_ids=video_ids[index::10])
+    channels = []
+    for max_concurrency in [None, 8]:
+        channel = make_channel(fake=fake, max_concurrency=max_concurrency)
+        channel.set_uploaded_videos()
+        channel.set_playlists()
+        channel.prefetch(concurrency=max_concurrency or 1)
+        channels.append(channel)
+    serial_channel, concurrent_channel = channels
+    # The same requests and results, only sent concurrently.
+    assert concurrent_channel.api_stats.get_total('calls') == serial_channel.api_stats.get_total('calls')
+    assert sorted(video.id for video in concurrent_channel.uploaded_vids) == sorted(video.id for video in serial_channel.uploaded_vids) == sorted(video_ids)
+    assert sorted((playlist.title, tuple(playlist.get_video_ids())) for playlist in concurrent_channel.playlists) == \
+        sorted((playlist.title, tuple(playlist.get_video_ids())) for playlist in serial_channel.playlists) == \
+        [("RIGSS %02d" % (index + 1), tuple(video_ids[index::10])) for index in range(10)]
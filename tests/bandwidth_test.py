@@ -0,0 +1,61 @@
+import threading
+import time
+
+from video_curation import bandwidth
+from video_curation.upload_sessions import CHUNK_GRANULARITY
+
+
+def _get_local_timestamp(hour, minute=0):
+    return time.mktime((2024, 5, 1, hour, minute, 0, 0, 0, -1))
+
+
+def test_schedule_windows():
+    schedule = bandwidth.BandwidthSchedule(windows=[(9, 21, 1e6), (8.5, 22, 0), (23, 2, 5e6)], default_bytes_per_second=None)
+    assert schedule.get_rate(_get_local_timestamp(12)) == 1e6
+    # The first matching window wins; windows end before end_hour.
+    assert schedule.get_rate(_get_local_timestamp(8, 45)) == schedule.get_rate(_get_local_timestamp(21)) == 0
+    # Around midnight.
+    assert schedule.get_rate(_get_local_timestamp(23, 30)) == schedule.get_rate(_get_local_timestamp(1)) == 5e6
+    assert schedule.get_rate(_get_local_timestamp(3)) is None
+
+
+def test_limit_chunksize():
+    limiter = bandwidth.BandwidthLimiter(bytes_per_second=1e6, burst_seconds=2)
+    assert limiter.limit_chunksize(64 * 1024 * 1024) == 7 * CHUNK_GRANULARITY
+    assert limiter.limit_chunksize(CHUNK_GRANULARITY) == CHUNK_GRANULARITY
+    assert bandwidth.BandwidthLimiter(bytes_per_second=1).limit_chunksize(64 * 1024 * 1024) == CHUNK_GRANULARITY
+    assert bandwidth.BandwidthLimiter().limit_chunksize(64 * 1024 * 1024) == 64 * 1024 * 1024
+
+
+def test_rate_limit():
+    limiter = bandwidth.BandwidthLimiter(bytes_per_second=1e6, burst_seconds=0.1)
+    start_time = time.time()
+    for _ in range(5):
+        limiter.acquire(num_bytes=100000)
+    # The first chunk goes at once; each later one waits for the debt of the one before.
+    assert 0.35 < time.time() - start_time < 2
+    start_time = time.time()
+    unlimited_limiter = bandwidth.BandwidthLimiter()
+    for _ in range(5):
+        unlimited_limiter.acquire(num_bytes=10 ** 9)
+    assert time.time() - start_time < 0.1
+
+
+def test_priority_order():
+    """Waiting chunks go in priority order, whatever the order they started waiting in."""
+    limiter = bandwidth.BandwidthLimiter(bytes_per_second=1e6, burst_seconds=1)
+    # A debt of 0.3 seconds, to queue the waiters behind.
+    limiter.acquire(num_bytes=300000)
+    order = []
+
+    def acquire(priority):
+        limiter.acquire(num_bytes=10000, priority=priority)
+        order.append(priority)
+    threads = []
+    for priority in [3, 1, 2, 0]:
+        threads.append(threading.Thread(target=acquire, args=(priority,)))
+        threads[-1].start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3]
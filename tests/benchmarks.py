@@ -0,0 +1,429 @@
+"""Benchmarks of API call counts and wall time, run offline against :py:class:tests.fake_youtube.FakeYoutube .
+
+These only measure - correctness is checked by the tests/*_test.py modules. For a report at 100, 1k and 10k items, run:
+    python -m tests.benchmarks
+"""
+import concurrent.futures
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from curation_projects import rgveda
+from curation_projects.rgveda import RgvedaRepo
+from tests.fake_archive import FakeArchive
+from tests.fake_youtube import FakeYoutube
+from tests.helpers import FakeHttpFactory, add_sukta_videos, get_mp4_bytes, get_sukta_file_name, make_channel, publish_channel_videos, write_sukta_files
+from video_curation import archive_mirror, channel_runner, youtube_client, video_repo
+from video_curation.api_stats import ApiStats
+from video_curation.playlist_items import PlaylistItems
+from video_curation.request_scheduler import CircuitBreaker, CircuitOpenError, QuotaExhaustedError, RequestScheduler
+
+REPORT_SIZES = [100, 1000, 10000]
+
+
+def _measure(name, size, api_stats, function):
+    calls = api_stats.get_total('calls')
+    quota_units = api_stats.get_total('quota_units')
+    bytes_in = api_stats.get_total('bytes_in')
+    start_time = time.time()
+    function()
+    return {'name': name, 'size': size, 'calls': api_stats.get_total('calls') - calls,
+            'quota_units': api_stats.get_total('quota_units') - quota_units, 'bytes_in': api_stats.get_total('bytes_in') - bytes_in,
+            'seconds': time.time() - start_time}
+
+
+def benchmark_channel_construction(size):
+    fake = FakeYoutube()
+    add_sukta_videos(fake, indices=range(size))
+    api_stats = ApiStats()
+
+    def construct():
+        channel = make_channel(fake=fake, api_stats=api_stats)
+        channel.set_uploaded_videos()
+        channel.set_playlists()
+    return [_measure("Channel construction", size, api_stats, construct)]
+
+
+def benchmark_concurrent_reads(size, num_playlists=10, latency=0.01):
+    """Channel construction with and without concurrent reads, against a fake with some latency per request."""
+    fake = FakeYoutube(latency=latency)
+    video_ids = add_sukta_videos(fake, indices=range(size))
+    for index in range(num_playlists):
+        fake.add_playlist(title="RIGSS %02d" % (index + 1), video_ids=video_ids[index::num_playlists])
+    results = []
+    for name, max_concurrency in [("Channel construction (serial)", None), ("Channel construction (concurrent)", 8)]:
+        api_stats = ApiStats()
+
+        def construct():
+            channel = make_channel(fake=fake, api_stats=api_stats, max_concurrency=max_concurrency)
+            channel.set_uploaded_videos()
+            channel.set_playlists()
+            channel.prefetch(concurrency=max_concurrency or 1)
+        results.append(_measure(name, size, api_stats, construct))
+    return results
+
+
+def benchmark_shared_api_service(size, num_threads=8, latency=0.01):
+    """Fetching videos one by one via YtVideo.sync_from_youtube (over the channel's shared api_service), from one thread and from num_threads threads."""
+    fake = FakeYoutube(latency=latency)
+    video_ids = add_sukta_videos(fake, indices=range(size))
+    channel = make_channel(fake=fake)
+    results = []
+    for name, num_workers in [("YtVideo.sync_from_youtube (serial)", 1), ("YtVideo.sync_from_youtube (threads)", num_threads)]:
+        videos = [youtube_client.YtVideo(id=video_id, api_service=channel.api_service) for video_id in video_ids]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            results.append(_measure(name, size, channel.api_stats, lambda: list(executor.map(lambda video: video.sync_from_youtube(), videos))))
+    return results
+
+
+def benchmark_set_playlists(size, videos_per_playlist=10):
+    """size // videos_per_playlist playlists, listed lazily, then prefetched."""
+    fake = FakeYoutube()
+    video_ids = add_sukta_videos(fake, indices=range(size))
+    for index in range(0, size, videos_per_playlist):
+        fake.add_playlist(title="Playlist %d" % index, video_ids=video_ids[index:index + videos_per_playlist])
+    channel = make_channel(fake=fake)
+    return [_measure("Channel.set_playlists (lazy items)", size, channel.api_stats, channel.set_playlists),
+            _measure("Channel.prefetch", size, channel.api_stats, channel.prefetch)]
+
+
+def benchmark_fields_masks(size):
+    """Listing the uploads playlist and its videos, with the default fields masks and with complete resources."""
+    fake = FakeYoutube()
+    add_sukta_videos(fake, indices=range(size), description=rgveda.description, tags=rgveda.video_tags)
+    channel = make_channel(fake=fake)
+    results = []
+    for name, fields in [("Uploads listing (default fields)", None), ("Uploads listing (all fields)", youtube_client.ALL_FIELDS)]:
+        def list_uploads():
+            channel.uploads_playlist.sync_items_from_youtube(fields=fields)
+            channel.set_uploaded_videos(fields=fields)
+        results.append(_measure(name, size, channel.api_stats, list_uploads))
+    return results
+
+
+def benchmark_metadata_push(size):
+    fake = FakeYoutube()
+    add_sukta_videos(fake, indices=range(size))
+    channel = make_channel(fake=fake)
+    channel.set_uploaded_videos()
+    repo = RgvedaRepo(repo_paths=[])
+    return [_measure("Metadata push (template change)", size, channel.api_stats, lambda: repo.update_video_metadatas(yt_channel=channel)),
+            _measure("Metadata push (unchanged)", size, channel.api_stats, lambda: repo.update_video_metadatas(yt_channel=channel))]
+
+
+class _DictBackedVideo(object):
+    """The former layout of :py:class:video_curation.youtube_client.YtVideo : a per-object __dict__, strings and tag lists as parsed, and the remote state as a metadata dict."""
+    def __init__(self, yt_metadata, api_service):
+        self.id = yt_metadata["id"]
+        self.title = yt_metadata['snippet'].get('title')
+        self.description = yt_metadata['snippet'].get('description')
+        self.tags = yt_metadata['snippet'].get('tags')
+        self.category_id = yt_metadata['snippet'].get('categoryId', 1)
+        self.privacy = yt_metadata['status'].get('privacyStatus', 'public')
+        self.upload_status = yt_metadata['status'].get('uploadStatus', 'uploaded')
+        self.api_service = api_service
+        self.remote_metadata = {'id': self.id,
+                                'snippet': {'title': self.title, 'description': self.description, 'tags': self.tags, 'categoryId': self.category_id},
+                                'status': {'privacyStatus': self.privacy, 'uploadStatus': self.upload_status}}
+
+
+class _DictBackedPlaylistItem(object):
+    """The former layout of :py:class:video_curation.youtube_client.PlaylistItem ."""
+    def __init__(self, metadata, api_service):
+        self.api_service = api_service
+        self.video_id = metadata['snippet']['resourceId']['videoId']
+        self.item_id = metadata['id']
+        self.position = metadata['snippet']['position']
+        self.title = metadata['snippet']['title']
+        self.playlist_id = metadata['snippet']['playlistId']
+
+
+def _measure_memory(name, size, make_objects):
+    """Bytes allocated (and still held) by make_objects."""
+    tracemalloc.start()
+    start_time = time.time()
+    objects = make_objects()
+    bytes_held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return {'name': name, 'size': size, 'calls': 0, 'quota_units': 0, 'bytes_in': 0, 'bytes_held': bytes_held, 'seconds': time.time() - start_time}
+
+
+def benchmark_memory(size):
+    """Memory held by the videos and uploads playlist items of a channel, as read from (json) responses."""
+    fake = FakeYoutube()
+    add_sukta_videos(fake, indices=range(size), description=rgveda.description, tags=rgveda.video_tags)
+    video_json = json.dumps([fake._project(video, {"part": "snippet,status"}) for video in fake.videos.values()])
+    item_json = json.dumps([fake._render_item(fake.uploads_playlist_id, position) for position in range(size)])
+    api_service = object()
+
+    def make_objects(video_class, item_class):
+        # Parse within the measurement, as strings from a response are distinct objects.
+        return ([video_class(yt_metadata, api_service) for yt_metadata in json.loads(video_json)],
+                [item_class(metadata, api_service) for metadata in json.loads(item_json)])
+    return [_measure_memory("Inventory memory (dict-backed)", size, lambda: make_objects(_DictBackedVideo, _DictBackedPlaylistItem)),
+            _measure_memory("Inventory memory (compact)", size, lambda: make_objects(lambda yt_metadata, api_service: youtube_client.YtVideo.from_yt_metadata(yt_metadata=yt_metadata, api_service=api_service),
+                                                                                    lambda metadata, api_service: youtube_client.PlaylistItem.from_metadata(metadata=metadata, api_service=api_service)))]
+
+
+def benchmark_set_videos(size):
+    fake = FakeYoutube()
+    video_ids = add_sukta_videos(fake, indices=range(size + 1))
+    channel = make_channel(fake=fake)
+    playlist = youtube_client.Playlist(api_service=channel.api_service, title="Benchmark")
+    playlist.add_to_youtube()
+    return [
+        _measure("Playlist.set_videos (fill)", size, channel.api_stats, lambda: playlist.set_videos(video_ids=video_ids[:size])),
+        _measure("Playlist.set_videos (unchanged)", size, channel.api_stats, lambda: playlist.set_videos(video_ids=video_ids[:size])),
+        _measure("Playlist.set_videos (one new)", size, channel.api_stats, lambda: playlist.set_videos(video_ids=video_ids)),
+    ]
+
+
+def benchmark_deduplicate(size):
+    fake = FakeYoutube()
+    video_ids = add_sukta_videos(fake, indices=range(size))
+    # Every tenth video appears twice.
+    playlist_id = fake.add_playlist(title="Benchmark", video_ids=video_ids + video_ids[::10])
+    channel = make_channel(fake=fake)
+    playlist = youtube_client.Playlist(api_service=channel.api_service, title="Benchmark", id=playlist_id, sync_items=True)
+    return [_measure("Playlist.deduplicate", size, channel.api_stats, lambda: playlist.deduplicate(batch_size=youtube_client.DEFAULT_BATCH_SIZE))]
+
+
+def _make_playlist_items(size):
+    # Every video appears twice in a row.
+    return [youtube_client.PlaylistItem(api_service=None, video_id="v%d" % (index // 2), playlist_id="PL", item_id="i%d" % index, position=index) for index in range(size)]
+
+
+def _delete_from_list(items, item):
+    """The former :py:meth:video_curation.youtube_client.Playlist._fold_deleted_item , on a plain list."""
+    position = items.index(item)
+    items.remove(item)
+    for index, later_item in enumerate(items[position:]):
+        later_item.position = position + index
+
+
+def benchmark_playlist_items(size):
+    """Local bookkeeping of deleting every other item, one by one, from a playlist of 2 * size items - kept in a plain list (renumbering positions) and in a :py:class:video_curation.playlist_items.PlaylistItems .
+    And random inserts, moves and deletes.
+    """
+    results = []
+    list_items = _make_playlist_items(2 * size)
+    start_time = time.time()
+    for item in list_items[1::2]:
+        _delete_from_list(list_items, item)
+    results.append({'name': "Delete duplicates (list)", 'size': size, 'calls': 0, 'quota_units': 0, 'bytes_in': 0, 'seconds': time.time() - start_time})
+    playlist_items = PlaylistItems(_make_playlist_items(2 * size))
+    start_time = time.time()
+    for item in playlist_items.get_duplicates():
+        playlist_items.remove(item)
+    results.append({'name': "Delete duplicates (PlaylistItems)", 'size': size, 'calls': 0, 'quota_units': 0, 'bytes_in': 0, 'seconds': time.time() - start_time})
+
+    random_generator = random.Random(0)
+    playlist_items = PlaylistItems(_make_playlist_items(size))
+    start_time = time.time()
+    for index in range(size):
+        operation = random_generator.choice(["insert", "move", "remove"])
+        if operation == "insert" or len(playlist_items) == 0:
+            item = youtube_client.PlaylistItem(api_service=None, video_id="w%d" % index, playlist_id="PL", item_id="j%d" % index)
+            playlist_items.insert(random_generator.randint(0, len(playlist_items)), item)
+        else:
+            item = playlist_items[random_generator.randrange(len(playlist_items))]
+            if operation == "move":
+                playlist_items.move(item, random_generator.randint(0, len(playlist_items) - 1))
+            else:
+                playlist_items.remove(item)
+    results.append({'name': "Random edits (PlaylistItems)", 'size': size, 'calls': 0, 'quota_units': 0, 'bytes_in': 0, 'seconds': time.time() - start_time})
+    return results
+
+
+def benchmark_upload_mandala_videos(size):
+    fake = FakeYoutube()
+    channel = make_channel(fake=fake)
+    channel.set_uploaded_videos()
+    with tempfile.TemporaryDirectory() as repo_path:
+        write_sukta_files(repo_path=repo_path, size=size)
+        repo = RgvedaRepo(repo_paths=[repo_path])
+
+        def upload():
+            for mandala_id in range(1, (size - 1) // 1000 + 2):
+                repo.upload_mandala_videos(mandala_id=mandala_id, yt_channel=channel)
+        return [_measure("RgvedaRepo.upload_mandala_videos", size, channel.api_stats, upload)]
+
+
+def benchmark_sync_engine(size):
+    """A channel with every other sukta uploaded (with outdated metadata), synced to all suktas of the local repo in mandala playlists - and then synced again."""
+    fake = FakeYoutube()
+    add_sukta_videos(fake, indices=range(0, size, 2))
+    channel = make_channel(fake=fake)
+    with tempfile.TemporaryDirectory() as repo_path:
+        write_sukta_files(repo_path=repo_path, size=size)
+        repo = RgvedaRepo(repo_paths=[repo_path])
+        engine = repo.get_sync_engine(yt_channel=channel)
+        mandala_ids = range(1, (size - 1) // 1000 + 2)
+        plans = []
+
+        def sync():
+            engine.read()
+            plans.append(engine.plan(desired_state=repo.get_desired_state(yt_channel=channel, mandala_ids=mandala_ids)))
+            engine.apply(plans[-1])
+        return [_measure("SyncEngine.sync", size, channel.api_stats, sync),
+                _measure("SyncEngine.sync (unchanged)", size, channel.api_stats, sync)]
+
+
+def benchmark_request_scheduler(size):
+    """Over a flaky connection: privacy flips of size private videos with quota for just half of them (beyond a reserve), a new playlist of a tenth of them, and an upload beyond the quota.
+    Then, in the next quota window, the deferred flips - until YouTube reports its quota exceeded. And requests to an API which always fails.
+    """
+    fake = FakeYoutube(error_rate=0.2)
+    video_ids = add_sukta_videos(fake, indices=range(size), privacy="private")
+    playlist_video_ids = video_ids[::10]
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        state_path = os.path.join(temp_dir, "scheduler_state.json")
+        # Room for the playlist and its entries, but not for an upload.
+        reserve = 50 * (1 + len(playlist_video_ids)) + 500
+        scheduler = RequestScheduler(low_priority_reserve=reserve, state_path=state_path, max_retries=10, backoff_seconds=0, circuit_breaker=CircuitBreaker(failure_threshold=20))
+        channel = youtube_client.Channel(http_factory=fake.get_http, scheduler=scheduler)
+        channel.set_uploaded_videos()
+        scheduler.daily_quota = scheduler.quota_spent + 50 * (size // 2) + reserve
+        results.append(_measure("Privacy flips (quota for half)", size, channel.api_stats,
+                                lambda: channel.set_video_metadatas(video_metadatas=dict([(video_id, {'privacy': 'public'}) for video_id in video_ids]))))
+        playlist = youtube_client.Playlist(api_service=channel.api_service, title="Benchmark")
+
+        def add_playlist():
+            playlist.add_to_youtube()
+            playlist.add_videos(video_ids=playlist_video_ids, batch_size=youtube_client.DEFAULT_BATCH_SIZE)
+        results.append(_measure("New playlist (high priority)", size, channel.api_stats, add_playlist))
+        filepath = os.path.join(temp_dir, "upload.mp4")
+        with open(filepath, "wb") as f:
+            f.write(get_mp4_bytes())
+
+        def upload():
+            try:
+                youtube_client.YtVideo(title="Beyond the quota", api_service=channel.api_service).initialize_upload(filepath=filepath)
+            except QuotaExhaustedError:
+                pass
+        results.append(_measure("Upload beyond the quota", size, channel.api_stats, upload))
+
+        # The next window, in a later run. YouTube allows a further quarter of the flips.
+        with open(state_path) as f:
+            state = json.load(f)
+        state['window'] = "2000-01-01"
+        with open(state_path, "w") as f:
+            json.dump(state, f)
+        next_scheduler = RequestScheduler(state_path=state_path, max_retries=10, backoff_seconds=0, circuit_breaker=CircuitBreaker(failure_threshold=20))
+        next_channel = youtube_client.Channel(http_factory=fake.get_http, scheduler=next_scheduler)
+        fake.daily_quota = fake.quota_spent + 50 * (size // 4)
+        results.append(_measure("Deferred requests (next window)", size, next_channel.api_stats, next_channel.run_deferred_requests))
+
+    broken_fake = FakeYoutube(error_rate=1)
+    broken_scheduler = RequestScheduler(max_retries=2, backoff_seconds=0, circuit_breaker=CircuitBreaker(failure_threshold=5, cooldown_seconds=60))
+    http = broken_scheduler.wrap(broken_fake.get_http())
+    start_time = time.time()
+    for _ in range(10):
+        try:
+            http.request("https://youtube.googleapis.com/youtube/v3/videos?part=id&id=v1")
+        except CircuitOpenError:
+            pass
+    results.append({'name': "Requests to a failing API", 'size': size, 'calls': broken_fake.request_count, 'quota_units': 0, 'bytes_in': 0, 'seconds': time.time() - start_time})
+    return results
+
+
+def benchmark_channel_runner(size, num_channels=4, latency=0.2):
+    """Privacy flips of size videos on each of num_channels channels (against fakes with some latency per request) - and a channel whose job fails - with one worker process, and with a worker per channel."""
+    results = []
+    for name, num_workers in [("ChannelRunner (one worker)", 1), ("ChannelRunner (worker per channel)", None)]:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            configs = [channel_runner.ChannelConfig(name="channel%d" % index, cache_dir=temp_dir, http_factory=FakeHttpFactory(name="channel%d" % index, size=size, latency=latency),
+                                                    job_kwargs={"name": "channel%d" % index}) for index in range(num_channels)]
+            configs.append(channel_runner.ChannelConfig(name="broken", cache_dir=temp_dir, http_factory=FakeHttpFactory(name="broken", size=size, latency=latency),
+                                                        job_kwargs={"name": "broken", "fail": True}))
+            report = channel_runner.ChannelRunner(configs=configs, job=publish_channel_videos, num_workers=num_workers).run()
+            results.append({'name': name, 'size': size, 'calls': sum(result.calls for result in report.results), 'quota_units': sum(result.quota_units for result in report.results),
+                            'bytes_in': 0, 'seconds': report.seconds})
+    return results
+
+
+def benchmark_probe(size):
+    """Probing size files (every tenth of them truncated), and again after changing one."""
+    with tempfile.TemporaryDirectory() as repo_path:
+        for index in range(size):
+            content = get_mp4_bytes(duration=index + 1, mdat_size=64 * 1024)
+            with open(os.path.join(repo_path, get_sukta_file_name(index)), "wb") as f:
+                f.write(content[:-1000] if index % 10 == 0 else content)
+        repo = video_repo.VideoRepo(repo_paths=[repo_path])
+        results = []
+        for name in ["VideoRepo.update_probe_index", "VideoRepo.update_probe_index (one changed)"]:
+            start_time = time.time()
+            repo.probe_index.update()
+            results.append({'name': name, 'size': size, 'calls': 0, 'quota_units': 0, 'bytes_in': 0, 'seconds': time.time() - start_time})
+            with open(os.path.join(repo_path, get_sukta_file_name(1)), "wb") as f:
+                f.write(get_mp4_bytes(duration=1000, width=1920, height=1080))
+            repo.manifest.forget_directories()
+            repo.rescan()
+        return results
+
+
+def benchmark_video_repo_scan(size, files_per_directory=100):
+    with tempfile.TemporaryDirectory() as root:
+        repo_paths = []
+        for index in range(size):
+            if index % files_per_directory == 0:
+                repo_paths.append(os.path.join(root, "%05d" % (index // files_per_directory)))
+                os.makedirs(repo_paths[-1])
+            open(os.path.join(repo_paths[-1], get_sukta_file_name(index)), "wb").close()
+        manifest_path = os.path.join(root, "manifest.sqlite")
+        results = []
+        for name in ["VideoRepo scan", "VideoRepo rescan (unchanged)"]:
+            start_time = time.time()
+            repo = video_repo.VideoRepo(repo_paths=repo_paths, manifest_path=manifest_path)
+            results.append({'name': name, 'size': size, 'calls': 0, 'quota_units': 0, 'bytes_in': 0, 'seconds': time.time() - start_time})
+            repo.manifest.close()
+        return results
+
+
+def benchmark_archive_mirror(size):
+    """Mirroring size files to a new archive.org item (over a flaky connection), and again after changing one file."""
+    with tempfile.TemporaryDirectory() as repo_path, FakeArchive(error_rate=0.1) as fake:
+        write_sukta_files(repo_path=repo_path, size=size)
+        item = archive_mirror.ArchiveItem(identifier="benchmark", access_key="key", secret_key="secret", metadata_url=fake.metadata_url, s3_url=fake.s3_url, backoff_seconds=0)
+        repo = video_repo.VideoRepo(repo_paths=[repo_path], archive_item=item)
+        results = []
+        for name in ["VideoRepo.mirror_to_archive", "VideoRepo.mirror_to_archive (one changed)"]:
+            request_count = fake.request_count
+            start_time = time.time()
+            repo.mirror_to_archive()
+            results.append({'name': name, 'size': size, 'calls': fake.request_count - request_count, 'quota_units': 0, 'bytes_in': 0, 'seconds': time.time() - start_time})
+            with open(os.path.join(repo_path, get_sukta_file_name(0)), "wb") as f:
+                f.write(os.urandom(2048))
+        return results
+
+
+def benchmark_import(size):
+    """Importing the modules a job needs before it talks to YouTube or archive.org, in a fresh interpreter."""
+    code = "import json, time; start_time = time.time(); import curation_projects.rgveda; print(json.dumps(time.time() - start_time))"
+    seconds = json.loads(subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                                                  cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout)
+    return [{'name': "Import curation_projects.rgveda", 'size': size, 'calls': 0, 'quota_units': 0, 'bytes_in': 0, 'seconds': seconds}]
+
+
+BENCHMARKS = [benchmark_import, benchmark_channel_construction, benchmark_concurrent_reads, benchmark_shared_api_service, benchmark_set_playlists, benchmark_fields_masks, benchmark_metadata_push, benchmark_memory, benchmark_set_videos, benchmark_deduplicate, benchmark_playlist_items, benchmark_upload_mandala_videos, benchmark_sync_engine, benchmark_request_scheduler, benchmark_channel_runner, benchmark_archive_mirror, benchmark_probe, benchmark_video_repo_scan]
+
+
+def main(sizes=REPORT_SIZES):
+    logging.disable(logging.INFO)
+    print("%-35s %8s %8s %12s %12s %12s %10s" % ("benchmark", "size", "calls", "quota_units", "bytes_in", "bytes_held", "seconds"))
+    for size in sizes:
+        for benchmark in BENCHMARKS:
+            for result in benchmark(size):
+                print("%-35s %8d %8d %12d %12d %12d %10.3f" % (result['name'], result['size'], result['calls'], result['quota_units'], result['bytes_in'], result.get('bytes_held', 0), result['seconds']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from tests.helpers import get_sukta_title
+from video_curation import channel_index
+from video_curation.youtube_client import YtVideo
+
+
+def _make_index():
+    return channel_index.ChannelIndex(key_functions={"mandala": lambda video: int(video.title.split(" ")[1]) if video.title.startswith("RIGSS") else None})
+
+
+def test_add():
+    index = _make_index()
+    videos = [YtVideo(id="v%d" % number, title=get_sukta_title(number), description="ऋग्वेद संहिता।", tags=["Veda", "Sanskrit"]) for number in range(0, 3000, 500)]
+    videos.append(YtVideo(id="other", title="Introduction", tags=["Veda"]))
+    index.set_items(videos)
+    assert len(index) == 7
+    assert index.get("mandala", 2) == videos[2:4]
+    assert sorted(index.get_keys("mandala")) == [1, 2, 3]
+    assert index.get_all("mandala") == videos[:6]
+    assert index.get_key("mandala", videos[-1]) is None
+    assert index.search("veda") == videos
+    assert index.search("Sanskrit ऋग्वेद") == videos[:6]
+    assert index.search("unknown veda") == index.search("") == []
+
+    # A key added later indexes the existing items.
+    index.add_key(name="first_tag", key_function=lambda video: video.tags[0] if video.tags else None)
+    assert index.get("first_tag", "Veda") == videos
+
+
+def test_rekey():
+    """Re-adding an edited item moves it to its new keys and tokens, even though the edit changed what the old ones were computed from."""
+    index = _make_index()
+    video = YtVideo(id="v1", title=get_sukta_title(1), tags=["veda"])
+    index.add(video)
+    video.title = get_sukta_title(1001)
+    video.tags = ("stotra",)
+    assert index.get_key("mandala", video) == 1
+    index.add(video)
+    assert index.get("mandala", 1) == [] and index.get("mandala", 2) == [video]
+    assert index.get_keys("mandala") == [2]
+    assert index.search("veda") == [] and index.search("stotra") == [video]
+    assert len(index) == 1
+
+
+def test_remove():
+    index = _make_index()
+    videos = [YtVideo(id="v%d" % number, title=get_sukta_title(number)) for number in range(3)]
+    index.set_items(videos)
+    index.remove(videos[1])
+    # Removing an item not indexed does nothing.
+    index.remove(videos[1])
+    assert len(index) == 2
+    assert index.get("mandala", 1) == [videos[0], videos[2]]
+    assert index.search(videos[1].title) == []
+    for video in [videos[0], videos[2]]:
+        index.remove(video)
+    # Emptied keys and tokens are dropped.
+    assert index.get_keys("mandala") == [] and index._token_index == {}
@@ -0,0 +1,46 @@
+import os
+
+from tests.helpers import FakeHttpFactory, publish_channel_videos
+from video_curation import channel_runner
+
+
+def _make_config(name, cache_dir, **job_kwargs):
+    return channel_runner.ChannelConfig(name=name, cache_dir=cache_dir, http_factory=FakeHttpFactory(name=name, size=20), job_kwargs=dict(name=name, **job_kwargs))
+
+
+def test_run(tmp_path):
+    cache_dir = str(tmp_path)
+    configs = [_make_config(name="channel%d" % index, cache_dir=cache_dir) for index in range(3)] + [_make_config(name="broken", cache_dir=cache_dir, fail=True)]
+    report = channel_runner.ChannelRunner(configs=configs, job=publish_channel_videos).run()
+    assert [result.name for result in report.results] == ["channel0", "channel1", "channel2", "broken"]
+    # The failing channel is reported, and the others go ahead.
+    assert [result.name for result in report.get_failures()] == ["broken"]
+    assert "ValueError: Bad credentials for broken" in report.get_failures()[0].error
+    assert "publish_channel_videos" in report.get_failures()[0].traceback
+    assert [result.result for result in report.results[:-1]] == [20] * 3
+    assert all(result.calls > 0 and result.quota_units > 0 for result in report.results[:-1])
+    assert "channel2" in report.describe()
+    # Every channel keeps its own quota state and API statistics.
+    for name in ["channel0", "channel1", "channel2"]:
+        assert os.path.exists(os.path.join(tmp_path, name + "_scheduler.json")) and os.path.exists(os.path.join(tmp_path, name + "_api_stats.json"))
+    report.dump(path=os.path.join(tmp_path, "report.json"))
+    assert os.path.exists(os.path.join(tmp_path, "report.json"))
+
+
+def test_crashed_worker(tmp_path):
+    cache_dir = str(tmp_path)
+    configs = [_make_config(name="channel0", cache_dir=cache_dir), _make_config(name="crashed", cache_dir=cache_dir, crash=True), _make_config(name="channel2", cache_dir=cache_dir)]
+    for num_workers in [1, None]:
+        report = channel_runner.ChannelRunner(configs=configs, job=publish_channel_videos, num_workers=num_workers).run()
+        # Only the channel whose worker process died fails.
+        assert [result.name for result in report.get_failures()] == ["crashed"]
+        assert "BrokenProcessPool" in report.get_failures()[0].error
+        assert [report.results[0].result, report.results[2].result] == [20, 20]
+
+
+def test_load_channel_configs(tmp_path):
+    path = os.path.join(tmp_path, "channels.json")
+    with open(path, "w") as f:
+        f.write('[{"name": "kashcit", "token_file_path": "token.json", "daily_quota": 10000, "job_kwargs": {"apply": true}}]')
+    [config] = channel_runner.load_channel_configs(path)
+    assert (config.name, config.token_file_path, config.daily_quota, config.job_kwargs, config.channel_kwargs) == ("kashcit", "token.json", 10000, {"apply": True}, {})
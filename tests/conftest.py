@@ -0,0 +1,10 @@
+"""Fixtures shared by the tests. Test data (titles, MP4 files, channels) comes from :py:mod:tests.helpers ."""
+import pytest
+
+from tests.fake_youtube import FakeYoutube
+
+
+@pytest.fixture
+def fake():
+    """An empty :py:class:tests.fake_youtube.FakeYoutube. Add videos before making a channel over it (see :py:func:tests.helpers.make_channel), which lists its uploads right away."""
+    return FakeYoutube()
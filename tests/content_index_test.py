@@ -0,0 +1,60 @@
+import hashlib
+import os
+
+from tests.helpers import get_sukta_file_name, write_sukta_files
+from video_curation import content_index, video_repo
+
+
+def _get_md5(path):
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def test_get_file_checksum(tmp_path):
+    path = os.path.join(tmp_path, "test.mp4")
+    with open(path, "wb") as f:
+        f.write(os.urandom(10000))
+    # Over several buffers, the last one partial.
+    assert content_index.get_file_checksum(path, buffer_size=4096) == content_index.get_file_checksum(path) == _get_md5(path)
+    open(path, "wb").close()
+    assert content_index.get_file_checksum(path) == hashlib.md5().hexdigest()
+
+
+def test_update(tmp_path):
+    repo_path = str(tmp_path)
+    paths = write_sukta_files(repo_path=repo_path, size=5)
+    with open(paths[0], "rb") as f:
+        content = f.read()
+    copy_path = os.path.join(tmp_path, get_sukta_file_name(5))
+    with open(copy_path, "wb") as f:
+        f.write(content)
+    repo = video_repo.VideoRepo(repo_paths=[repo_path])
+    assert repo.content_index.update() == 6
+    assert [repo.content_index.get_checksum(path) for path in paths] == [_get_md5(path) for path in paths]
+    assert repo.content_index.get_duplicate_groups() == [[paths[0], copy_path]]
+    assert repo.get_unique_paths(paths=paths + [copy_path]) == paths
+    assert repo.get_unique_paths(paths=paths, known_checksums=[_get_md5(paths[1])]) == paths[:1] + paths[2:]
+    # Unchanged files are not hashed again.
+    assert repo.content_index.update() == 0
+
+
+def test_update_after_modification_in_place(tmp_path):
+    """Files modified in place (which leaves the directory mtime, and so the manifest, alone) are re-hashed - as are files changed to the same size."""
+    repo_path = str(tmp_path)
+    paths = write_sukta_files(repo_path=repo_path, size=3)
+    repo = video_repo.VideoRepo(repo_paths=[repo_path])
+    repo.content_index.update()
+    old_checksum = repo.content_index.get_checksum(paths[0])
+    with open(paths[0], "r+b") as f:
+        f.write(b"changed")
+    stat = os.stat(paths[0])
+    os.utime(paths[0], (stat.st_atime, stat.st_mtime + 10))
+    with open(paths[1], "wb") as f:
+        f.write(b"a different, shorter file")
+    os.remove(paths[2])
+    repo.manifest.scan(roots=[repo_path], title_function=repo.get_title_from_path)
+    assert repo.content_index.update() == 2
+    assert repo.content_index.get_checksum(paths[0]) == _get_md5(paths[0]) != old_checksum
+    assert repo.content_index.get_checksum(paths[1]) == _get_md5(paths[1])
+    assert repo.content_index.get_checksum(paths[2]) is None
+    assert repo.get_unique_paths(paths=paths[:2], known_checksums=[old_checksum]) == paths[:2]
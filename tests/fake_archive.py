@@ -0,0 +1,108 @@
+"""A local stand-in server for the archive.org metadata and S3-like upload APIs, for offline tests and benchmarks.
+
+Example usage:
+    with FakeArchive() as fake:
+        item = archive_mirror.ArchiveItem(identifier="test-item", metadata_url=fake.metadata_url, s3_url=fake.s3_url, backoff_seconds=0)
+"""
+import base64
+import hashlib
+import http.server
+import json
+import random
+import threading
+import urllib.parse
+
+
+class FakeArchive(object):
+    """Keeps items (identifier to a dict from file name to content) in memory, serving them over http on a free local port.
+
+    Checks Content-MD5 of uploads like archive.org does, and counts requests and bytes received. Optionally fails a fraction error_rate of uploads with a 503.
+    """
+    def __init__(self, error_rate=0, seed=0):
+        self.error_rate = error_rate
+        self.items = {}
+        self.request_count = 0
+        self.bytes_received = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = None
+        base_url = "http://127.0.0.1:%d" % self._server.server_address[1]
+        self.metadata_url = base_url + "/metadata"
+        self.s3_url = base_url + "/s3"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def get_metadata(self, identifier):
+        if identifier not in self.items:
+            return {}
+        files = [{"name": name, "source": "original", "md5": hashlib.md5(content).hexdigest(), "size": str(len(content)), "format": "MPEG4"}
+                 for (name, content) in sorted(self.items[identifier].items())]
+        # Derivatives, as archive.org makes for videos.
+        files.extend([{"name": name[:-4] + ".ogv", "source": "derivative", "original": name, "md5": "0" * 32, "size": "0"}
+                      for name in sorted(self.items[identifier]) if name.endswith(".mp4")])
+        return {"metadata": {"identifier": identifier}, "files": files}
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, status, content=b""):
+                self.send_response(status)
+                self.send_header("content-length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.request_count += 1
+                path = urllib.parse.unquote(urllib.parse.urlparse(self.path).path)
+                if not path.startswith("/metadata/"):
+                    return self._respond(404)
+                with fake._lock:
+                    metadata = fake.get_metadata(path[len("/metadata/"):])
+                self._respond(200, json.dumps(metadata).encode("utf-8"))
+
+            def do_PUT(self):
+                content = self.rfile.read(int(self.headers.get("content-length", 0)))
+                with fake._lock:
+                    fake.request_count += 1
+                    fake.bytes_received += len(content)
+                    failed = fake.error_rate > 0 and fake._random.random() < fake.error_rate
+                path = urllib.parse.unquote(urllib.parse.urlparse(self.path).path)
+                if failed:
+                    return self._respond(503, b"<Error><Code>SlowDown</Code></Error>")
+                if not path.startswith("/s3/") or not self.headers.get("authorization", "").startswith("LOW "):
+                    return self._respond(403)
+                identifier, name = path[len("/s3/"):].split("/", 1)
+                expected_md5 = self.headers.get("content-md5")
+                if expected_md5 is not None and base64.b64decode(expected_md5) != hashlib.md5(content).digest():
+                    return self._respond(400, b"<Error><Code>BadDigest</Code></Error>")
+                with fake._lock:
+                    if identifier not in fake.items:
+                        if self.headers.get("x-archive-auto-make-bucket") != "1":
+                            return self._respond(404, b"<Error><Code>NoSuchBucket</Code></Error>")
+                        fake.items[identifier] = {}
+                    fake.items[identifier][name] = content
+                self._respond(200)
+
+        return Handler
@@ -0,0 +1,363 @@
+"""An in-process stand-in for the YouTube Data API, for offline tests and benchmarks.
+
+Example usage:
+    fake = FakeYoutube()
+    channel = youtube_client.Channel(http_factory=fake.get_http)
+"""
+import email.parser
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+import httplib2
+
+from video_curation.api_stats import get_api_method, get_quota_cost
+
+CHANNEL_ID = "UCfakechannel"
+
+
+def _get_etag(resource):
+    return hashlib.md5(json.dumps(resource, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _read_body(body):
+    if body is None:
+        return b""
+    if hasattr(body, "read"):
+        body = body.read()
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return body
+
+
+def _parse_fields_mask(text, position=0):
+    """Parse a partial response fields mask (eg. "items(id,snippet/title)") into a dict tree, where None selects a whole subtree.
+
+    :return: (tree, position after the parsed list).
+    """
+    tree = {}
+    while position < len(text):
+        path = re.match(r"[\w*]+(/[\w*]+)*", text[position:]).group(0)
+        position += len(path)
+        names = path.split("/")
+        node = tree
+        for name in names[:-1]:
+            node = node.setdefault(name, {})
+        if position < len(text) and text[position] == "(":
+            node[names[-1]], position = _parse_fields_mask(text, position + 1)
+        else:
+            node[names[-1]] = None
+        if position < len(text) and text[position] == ",":
+            position += 1
+        elif position < len(text) and text[position] == ")":
+            return tree, position + 1
+    return tree, position
+
+
+def _apply_fields_mask(value, tree):
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_apply_fields_mask(item, tree) for item in value]
+    if isinstance(value, dict):
+        return dict([(key, _apply_fields_mask(value[key], subtree)) for (key, subtree) in tree.items() if key in value])
+    return value
+
+
+def _get_thumbnails(resource_id):
+    return dict([(name, {"url": "https://i.ytimg.com/vi/%s/%s.jpg" % (resource_id, name), "width": width, "height": width * 9 // 16})
+                 for (name, width) in [("default", 120), ("medium", 320), ("high", 480), ("standard", 640), ("maxres", 1280)]])
+
+
+class FakeYoutube(object):
+    """Keeps videos, playlists and playlistItems in memory, and answers API requests about them via :py:meth:request .
+
+    Supports paging (pageToken is an offset), fields masks, batch requests, resumable uploads and If-None-Match. Resources carry the bulky fields (thumbnails, localizations) which real ones do. Optionally sleeps latency seconds per request, fails a fraction error_rate of requests with a 503, and fails requests with a 403 quotaExceeded once they would spend more than daily_quota units. With shuffle_batches, applies the parts of a batch request in random order - as YouTube may.
+    """
+    def __init__(self, latency=0, error_rate=0, seed=0, daily_quota=None, shuffle_batches=False):
+        self.latency = latency
+        self.shuffle_batches = shuffle_batches
+        self.error_rate = error_rate
+        self.daily_quota = daily_quota
+        self.quota_spent = 0
+        self.videos = {}
+        self.playlists = {}
+        # Playlist id to a list of (item_id, video_id), in playlist order.
+        self.playlist_items = {}
+        self.uploads_playlist_id = "UU" + CHANNEL_ID[2:]
+        self.playlist_items[self.uploads_playlist_id] = []
+        self.upload_sessions = {}
+        self.request_count = 0
+        self._random = random.Random(seed)
+        self._next_id = 0
+        self._lock = threading.RLock()
+
+    def get_http(self):
+        """The http object via which :py:class:video_curation.youtube_client.Channel talks to this fake (see its http_factory)."""
+        return self
+
+    def _new_id(self, prefix):
+        self._next_id += 1
+        return "%s%08d" % (prefix, self._next_id)
+
+    def add_video(self, title, description="", tags=None, privacy="public", upload_status="processed", category_id="22"):
+        """Create a video directly (as if uploaded earlier), at the top of the uploads playlist. Returns its id."""
+        with self._lock:
+            video_id = self._new_id("v")
+            self.videos[video_id] = {
+                "kind": "youtube#video", "id": video_id,
+                "snippet": {"publishedAt": "2020-01-01T00:00:00Z", "channelId": CHANNEL_ID, "title": title, "description": description,
+                            "thumbnails": _get_thumbnails(video_id), "channelTitle": "Fake channel", "tags": tags or [], "categoryId": category_id,
+                            "liveBroadcastContent": "none", "localized": {"title": title, "description": description}},
+                "status": {"uploadStatus": upload_status, "privacyStatus": privacy, "license": "youtube", "embeddable": True,
+                           "publicStatsViewable": True, "madeForKids": False}}
+            self.playlist_items[self.uploads_playlist_id].insert(0, (self._new_id("i"), video_id))
+            return video_id
+
+    def add_playlist(self, title, video_ids=(), description="", privacy="public"):
+        """Create a playlist directly. Returns its id."""
+        with self._lock:
+            playlist_id = self._new_id("PL")
+            self.playlists[playlist_id] = {"kind": "youtube#playlist", "id": playlist_id,
+                                           "snippet": {"title": title, "description": description, "channelId": CHANNEL_ID},
+                                           "status": {"privacyStatus": privacy}}
+            self.playlist_items[playlist_id] = [(self._new_id("i"), video_id) for video_id in video_ids]
+            return playlist_id
+
+    def get_playlist_video_ids(self, playlist_id):
+        return [video_id for (item_id, video_id) in self.playlist_items[playlist_id]]
+
+    # The http interface.
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        headers = dict([(key.lower(), value) for (key, value) in (headers or {}).items()])
+        with self._lock:
+            self.request_count += 1
+            if self.error_rate > 0 and self._random.random() < self.error_rate:
+                return self._get_error_response(503, "backendError")
+            status, response_headers, content = self._dispatch(uri=uri, method=method, body=body, headers=headers)
+        response = httplib2.Response(dict([("status", str(status))] + list(response_headers.items())))
+        return response, content
+
+    def _dispatch(self, uri, method, body, headers):
+        parsed_uri = urllib.parse.urlparse(uri)
+        params = dict([(key, values[0]) for (key, values) in urllib.parse.parse_qs(parsed_uri.query).items()])
+        collection = parsed_uri.path.rstrip("/").split("/")[-1]
+        if collection == "batch":
+            return self._handle_batch(body=_read_body(body), headers=headers)
+        quota_cost = get_quota_cost(get_api_method(uri=uri, method=method))
+        if self.daily_quota is not None and self.quota_spent + quota_cost > self.daily_quota:
+            return self._get_error_response(403, "quotaExceeded", as_tuple=True)
+        self.quota_spent += quota_cost
+        if "upload_id" in params:
+            return self._handle_upload_chunk(upload_id=params["upload_id"], body=body, headers=headers)
+        if parsed_uri.path.startswith("/upload/"):
+            return self._handle_upload_start(uri=uri, params=params, body=_read_body(body), headers=headers)
+        handler = getattr(self, "_handle_%s_%s" % (collection, method.lower()), None)
+        if handler is None:
+            return self._get_error_response(404, "notFound", as_tuple=True)
+        resource = json.loads(_read_body(body) or b"{}") if method in ["POST", "PUT"] else None
+        status, content = handler(params=params, resource=resource)
+        if status >= 400:
+            return self._get_error_response(status, "notFound", as_tuple=True)
+        if isinstance(content, dict):
+            if method == "GET" and headers.get("if-none-match") == content.get("etag"):
+                return 304, {}, b""
+            if "fields" in params:
+                content = _apply_fields_mask(content, _parse_fields_mask(params["fields"])[0])
+            return status, {"content-type": "application/json; charset=UTF-8"}, json.dumps(content).encode("utf-8")
+        return status, {}, b""
+
+    def _get_error_response(self, status, reason, as_tuple=False):
+        content = json.dumps({"error": {"code": status, "message": reason, "errors": [{"reason": reason}]}}).encode("utf-8")
+        headers = {"content-type": "application/json; charset=UTF-8"}
+        if as_tuple:
+            return status, headers, content
+        return httplib2.Response(dict([("status", str(status))] + list(headers.items()))), content
+
+    # noinspection PyMethodMayBeStatic
+    def _get_page(self, items, params, render=None):
+        """A page of items. If render is given, it is applied to the items on this page only."""
+        start = int(params.get("pageToken", 0))
+        max_results = min(int(params.get("maxResults", 5)), 50)
+        page_items = items[start:start + max_results]
+        if render is not None:
+            page_items = [render(item) for item in page_items]
+        page = {"kind": "youtube#listResponse", "items": page_items,
+                "pageInfo": {"totalResults": len(items), "resultsPerPage": max_results}}
+        if start + max_results < len(items):
+            page["nextPageToken"] = str(start + max_results)
+        page["etag"] = _get_etag(page)
+        return page
+
+    # noinspection PyMethodMayBeStatic
+    def _project(self, resource, params):
+        parts = [part.strip() for part in params.get("part", "snippet").split(",")]
+        projection = dict([(key, value) for (key, value) in resource.items() if key in ["kind", "id"] or key in parts])
+        # Like YouTube's, etags depend on the parts requested.
+        projection["etag"] = _get_etag(projection)
+        return projection
+
+    def _render_item(self, playlist_id, position):
+        item_id, video_id = self.playlist_items[playlist_id][position]
+        video_snippet = self.videos[video_id]["snippet"] if video_id in self.videos else {"title": "Deleted video", "description": ""}
+        return {"kind": "youtube#playlistItem", "id": item_id,
+                "snippet": {"publishedAt": "2020-01-01T00:00:00Z", "channelId": CHANNEL_ID, "title": video_snippet["title"],
+                            "description": video_snippet["description"], "thumbnails": _get_thumbnails(video_id), "channelTitle": "Fake channel",
+                            "playlistId": playlist_id, "position": position, "resourceId": {"kind": "youtube#video", "videoId": video_id},
+                            "videoOwnerChannelTitle": "Fake channel", "videoOwnerChannelId": CHANNEL_ID}}
+
+    def _find_item(self, item_id):
+        for playlist_id, items in self.playlist_items.items():
+            for position, (other_item_id, video_id) in enumerate(items):
+                if other_item_id == item_id:
+                    return playlist_id, position
+        return None, None
+
+    def _handle_channels_get(self, params, resource):
+        channel = {"kind": "youtube#channel", "id": CHANNEL_ID, "contentDetails": {"relatedPlaylists": {"uploads": self.uploads_playlist_id}}}
+        return 200, self._get_page([channel], params)
+
+    def _handle_videos_get(self, params, resource):
+        video_ids = params.get("id", "").split(",")
+        items = [self._project(self.videos[video_id], params) for video_id in video_ids if video_id in self.videos]
+        return 200, self._get_page(items, dict(params, maxResults=50))
+
+    def _handle_videos_put(self, params, resource):
+        video = self.videos.get(resource.get("id"))
+        if video is None:
+            return 404, None
+        for part in params.get("part", "").split(","):
+            part = part.strip()
+            if part in resource:
+                video[part].update(resource[part])
+        return 200, self._project(video, params)
+
+    def _handle_videos_delete(self, params, resource):
+        video_id = params.get("id")
+        if video_id not in self.videos:
+            return 404, None
+        del self.videos[video_id]
+        for playlist_id in self.playlist_items:
+            self.playlist_items[playlist_id] = [(item_id, other_video_id) for (item_id, other_video_id) in self.playlist_items[playlist_id] if other_video_id != video_id]
+        return 204, None
+
+    def _handle_playlists_get(self, params, resource):
+        items = [self._project(playlist, params) for playlist in self.playlists.values()]
+        return 200, self._get_page(items, params)
+
+    def _handle_playlists_post(self, params, resource):
+        playlist_id = self.add_playlist(title=resource["snippet"]["title"], description=resource["snippet"].get("description", ""),
+                                        privacy=resource.get("status", {}).get("privacyStatus", "public"))
+        self.playlists[playlist_id]["snippet"]["tags"] = resource["snippet"].get("tags", [])
+        return 200, self._project(self.playlists[playlist_id], params)
+
+    def _handle_playlists_put(self, params, resource):
+        playlist = self.playlists.get(resource.get("id"))
+        if playlist is None:
+            return 404, None
+        playlist["snippet"].update(resource.get("snippet", {}))
+        return 200, self._project(playlist, params)
+
+    def _handle_playlistItems_get(self, params, resource):
+        playlist_id = params.get("playlistId")
+        if playlist_id not in self.playlist_items:
+            return 404, None
+        positions = list(range(len(self.playlist_items[playlist_id])))
+        return 200, self._get_page(positions, params, render=lambda position: self._render_item(playlist_id, position))
+
+    def _handle_playlistItems_post(self, params, resource):
+        snippet = resource["snippet"]
+        playlist_id = snippet["playlistId"]
+        video_id = snippet["resourceId"]["videoId"]
+        if playlist_id not in self.playlist_items:
+            return 404, None
+        if video_id not in self.videos:
+            return 404, None
+        items = self.playlist_items[playlist_id]
+        position = min(snippet.get("position", len(items)), len(items))
+        items.insert(position, (self._new_id("i"), video_id))
+        return 200, self._render_item(playlist_id, position)
+
+    def _handle_playlistItems_put(self, params, resource):
+        playlist_id, position = self._find_item(resource.get("id"))
+        if playlist_id is None:
+            return 404, None
+        items = self.playlist_items[playlist_id]
+        new_position = resource["snippet"].get("position")
+        if new_position is not None:
+            item = items.pop(position)
+            position = min(new_position, len(items))
+            items.insert(position, item)
+        return 200, self._render_item(playlist_id, position)
+
+    def _handle_playlistItems_delete(self, params, resource):
+        playlist_id, position = self._find_item(params.get("id"))
+        if playlist_id is None:
+            return 404, None
+        self.playlist_items[playlist_id].pop(position)
+        return 204, None
+
+    def _handle_upload_start(self, uri, params, body, headers):
+        upload_id = self._new_id("upload")
+        self.upload_sessions[upload_id] = {"metadata": json.loads(body or b"{}"), "params": params,
+                                           "size": int(headers.get("x-upload-content-length", 0)), "received": 0}
+        location = "%s&upload_id=%s" % (uri, upload_id)
+        return 200, {"location": location}, b""
+
+    def _handle_upload_chunk(self, upload_id, body, headers):
+        session = self.upload_sessions.get(upload_id)
+        if session is None:
+            return 404, {}, b""
+        content_range = headers.get("content-range", "bytes */%d" % session["size"])
+        byte_range, size = content_range[len("bytes "):].split("/")
+        if byte_range != "*":
+            start, end = [int(value) for value in byte_range.split("-")]
+            if start != session["received"]:
+                return 400, {}, b""
+            data = _read_body(body)
+            session["received"] = start + len(data)
+        if size != "*":
+            session["size"] = int(size)
+        if session["received"] < session["size"]:
+            range_headers = {} if session["received"] == 0 else {"range": "bytes=0-%d" % (session["received"] - 1)}
+            return 308, range_headers, b""
+        metadata = session["metadata"]
+        snippet = metadata.get("snippet", {})
+        video_id = self.add_video(title=snippet.get("title"), description=snippet.get("description", ""), tags=snippet.get("tags"),
+                                  privacy=metadata.get("status", {}).get("privacyStatus", "public"), upload_status="uploaded",
+                                  category_id=snippet.get("categoryId", "22"))
+        del self.upload_sessions[upload_id]
+        return 200, {"content-type": "application/json; charset=UTF-8"}, json.dumps(self._project(self.videos[video_id], session["params"])).encode("utf-8")
+
+    def _handle_batch(self, body, headers):
+        message = email.parser.BytesParser().parsebytes(("content-type: %s\r\n\r\n" % headers["content-type"]).encode("utf-8") + body)
+        boundary = "batch_fake_boundary"
+        message_parts = message.get_payload()
+        order = list(range(len(message_parts)))
+        if self.shuffle_batches:
+            self._random.shuffle(order)
+        parts = {}
+        for index in order:
+            part = message_parts[index]
+            payload = part.get_payload()
+            request_line, rest = payload.split("\n", 1)
+            request_method, request_uri, _ = request_line.strip().split(" ")
+            request_headers, _, request_body = rest.replace("\r\n", "\n").partition("\n\n")
+            request_headers = dict([line.split(": ", 1) for line in request_headers.splitlines() if ": " in line])
+            status, response_headers, content = self._dispatch(uri=request_uri, method=request_method, body=request_body.encode("utf-8") or None,
+                                                               headers=dict([(key.lower(), value) for (key, value) in request_headers.items()]))
+            content_id = part["Content-ID"]
+            lines = ["--" + boundary, "Content-Type: application/http", "Content-ID: <response-%s" % content_id[1:], "",
+                     "HTTP/1.1 %d %s" % (status, "OK" if status < 400 else "Error")]
+            lines.extend(["%s: %s" % (key, value) for (key, value) in response_headers.items()] + ["Content-Length: %d" % len(content)])
+            lines.extend(["", content.decode("utf-8"), ""])
+            parts[index] = "\r\n".join(lines)
+        content = "".join([parts[index] for index in range(len(message_parts))]) + "--%s--\r\n" % boundary
+        return 200, {"content-type": "multipart/mixed; boundary=%s" % boundary}, content.encode("utf-8")
@@ -0,0 +1,91 @@
+"""Test data shared by the tests and :py:mod:tests.benchmarks : titles, minimal MP4 files, channels over a :py:class:tests.fake_youtube.FakeYoutube and a :py:class:video_curation.channel_runner.ChannelRunner job. Fixtures for the tests are in :py:mod:tests.conftest ."""
+import os
+import struct
+
+from tests.fake_youtube import FakeYoutube
+from video_curation import youtube_client
+
+
+def get_sukta_title(index):
+    """Rgveda style titles, 1000 suktas per mandala."""
+    return "RIGSS %02d %03d" % (index // 1000 + 1, index % 1000)
+
+
+def get_sukta_file_name(index):
+    return get_sukta_title(index).replace(" ", "_") + ".mp4"
+
+
+def get_box(box_type, *children):
+    body = b"".join(children)
+    return struct.pack(">I4s", 8 + len(body), box_type) + body
+
+
+def get_mp4_bytes(duration=60, width=1280, height=720, mdat_size=1024):
+    """A minimal MP4 file: ftyp, then moov with one video and one audio track (just the boxes :py:mod:video_curation.mp4_probe reads), then mdat with random bytes."""
+    timescale = 1000
+    mvhd = get_box(b"mvhd", struct.pack(">B3xIIII", 0, 3600000000, 3600000000, timescale, duration * timescale), bytes(80))
+
+    def get_trak(handler_type, codec, track_width, track_height):
+        tkhd = get_box(b"tkhd", bytes(76), struct.pack(">II", track_width << 16, track_height << 16))
+        hdlr = get_box(b"hdlr", bytes(8), handler_type, bytes(12))
+        stsd = get_box(b"stsd", struct.pack(">4xI", 1), get_box(codec, bytes(6), struct.pack(">H", 1), bytes(16), struct.pack(">HH", track_width, track_height), bytes(50)))
+        return get_box(b"trak", tkhd, get_box(b"mdia", hdlr, get_box(b"minf", get_box(b"stbl", stsd, get_box(b"stsz", bytes(12))))))
+    moov = get_box(b"moov", mvhd, get_trak(b"vide", b"avc1", width, height), get_trak(b"soun", b"mp4a", 0, 0))
+    return get_box(b"ftyp", b"isom", bytes(4), b"isomavc1") + moov + get_box(b"mdat", os.urandom(mdat_size))
+
+
+def write_sukta_files(repo_path, size, **kwargs):
+    """Write size MP4 files (see :py:func:get_mp4_bytes) with sukta file names to repo_path. Returns their paths."""
+    paths = []
+    for index in range(size):
+        paths.append(os.path.join(repo_path, get_sukta_file_name(index)))
+        with open(paths[-1], "wb") as f:
+            f.write(get_mp4_bytes(**kwargs))
+    return paths
+
+
+def add_sukta_videos(fake, indices, **kwargs):
+    """Add a video to fake (see :py:meth:tests.fake_youtube.FakeYoutube.add_video, for kwargs) titled get_sukta_title(index), for every index in indices. Returns their ids."""
+    return [fake.add_video(title=get_sukta_title(index), **kwargs) for index in indices]
+
+
+def make_channel(fake, api_stats=None, max_concurrency=None, **kwargs):
+    return youtube_client.Channel(http_factory=fake.get_http, api_stats=api_stats, max_concurrency=max_concurrency, **kwargs)
+
+
+def get_public_count(fake):
+    return len([video for video in fake.videos.values() if video["status"]["privacyStatus"] == "public"])
+
+
+# Channel name to its FakeYoutube, in each worker process of a ChannelRunner.
+worker_fakes = {}
+
+
+class FakeHttpFactory(object):
+    """A picklable http_factory for a ChannelConfig: a FakeYoutube of size private videos (with latency), made once per channel in the worker process running it."""
+    def __init__(self, name, size, latency=0):
+        self.name = name
+        self.size = size
+        self.latency = latency
+
+    def __call__(self):
+        if self.name not in worker_fakes:
+            fake = FakeYoutube(latency=self.latency)
+            add_sukta_videos(fake, indices=range(self.size), privacy="private")
+            worker_fakes[self.name] = fake
+        return worker_fakes[self.name].get_http()
+
+
+def publish_channel_videos(channel, name, fail=False, crash=False):
+    """A ChannelRunner job: make every video of the channel public. Returns the number of public videos.
+
+    :param fail: Raise instead.
+    :param crash: Kill the worker process instead.
+    """
+    if fail:
+        raise ValueError("Bad credentials for %s" % name)
+    if crash:
+        os._exit(1)
+    channel.set_uploaded_videos()
+    channel.set_video_metadatas(video_metadatas=dict([(video.id, {'privacy': 'public'}) for video in channel.uploaded_vids]))
+    return get_public_count(worker_fakes[name])
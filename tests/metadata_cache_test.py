@@ -0,0 +1,132 @@
+import json
+import os
+
+import httplib2
+
+from tests.helpers import add_sukta_videos, make_channel
+from video_curation import metadata_cache, youtube_client
+
+API_URI = "https://youtube.googleapis.com/youtube/v3/"
+
+
+class _Http(object):
+    """Serves canned list responses by uri (304 to a matching If-None-Match), and answers writes with write_status. Records every request."""
+    def __init__(self, responses):
+        self.responses = responses
+        self.write_status = 200
+        self.requests = []
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        headers = headers or {}
+        self.requests.append((method, uri, headers))
+        if method != "GET":
+            return httplib2.Response({"status": str(self.write_status)}), b"{}"
+        response = self.responses[uri]
+        if headers.get("If-None-Match") == response["etag"]:
+            return httplib2.Response({"status": "304"}), b""
+        return httplib2.Response({"status": "200"}), json.dumps(response).encode("utf-8")
+
+
+def _get_video_listing(video_id, title, etag="1"):
+    return {"etag": etag, "items": [{"kind": "youtube#video", "id": video_id, "etag": etag, "snippet": {"title": title}}]}
+
+
+def _get_titles(http, uri):
+    response, content = http.request(uri)
+    assert response.status == 200
+    return [item["snippet"]["title"] for item in json.loads(content)["items"]]
+
+
+def _make_cache(temp_dir, ttl):
+    return metadata_cache.MetadataCache(path=os.path.join(temp_dir, "cache.sqlite"), ttl=ttl)
+
+
+def test_ttl(tmp_path):
+    uri = API_URI + "videos?part=snippet&id=v1"
+    http = _Http(responses={uri: _get_video_listing("v1", "Old")})
+    cache = _make_cache(tmp_path, ttl=3600)
+    caching_http = cache.wrap(http)
+    assert _get_titles(caching_http, uri) == ["Old"]
+    # Within the ttl, even changes at YouTube go unnoticed.
+    http.responses[uri] = _get_video_listing("v1", "New", etag="2")
+    assert _get_titles(caching_http, uri) == ["Old"]
+    assert len(http.requests) == 1
+    assert cache.get_resource(kind="youtube#video", id="v1")["snippet"]["title"] == "Old"
+
+    # Expired.
+    cache.ttl = 0
+    assert _get_titles(caching_http, uri) == ["New"]
+    assert len(http.requests) == 2
+
+
+def test_etag_revalidation(tmp_path):
+    uri = API_URI + "videos?part=snippet&id=v1"
+    http = _Http(responses={uri: _get_video_listing("v1", "Old")})
+    cache = _make_cache(tmp_path, ttl=0)
+    caching_http = cache.wrap(http)
+    assert _get_titles(caching_http, uri) == ["Old"]
+    _, _, fetched_at = cache.get_response(uri)
+    # Unchanged: YouTube answers 304, and the cached response is served (and marked fresh).
+    assert _get_titles(caching_http, uri) == ["Old"]
+    assert http.requests[-1][2]["If-None-Match"] == "1"
+    assert cache.get_response(uri)[2] >= fetched_at
+
+    # Changed: the new response replaces the cached one.
+    http.responses[uri] = _get_video_listing("v1", "New", etag="2")
+    assert _get_titles(caching_http, uri) == ["New"]
+    assert cache.get_response(uri)[0] == "2"
+
+
+def test_invalidation_after_writes(tmp_path):
+    video_uris = [API_URI + "videos?part=snippet&id=" + video_id for video_id in ["v1", "v2"]]
+    items_uri = API_URI + "playlistItems?part=snippet&playlistId=PL1"
+    responses = dict([(uri, _get_video_listing(video_id, video_id)) for (uri, video_id) in zip(video_uris, ["v1", "v2"])])
+    responses[items_uri] = {"etag": "1", "items": [{"kind": "youtube#playlistItem", "id": "i1", "snippet": {"title": "v1"}}]}
+    http = _Http(responses=responses)
+    cache = _make_cache(tmp_path, ttl=3600)
+    caching_http = cache.wrap(http)
+    for uri in video_uris + [items_uri]:
+        _get_titles(caching_http, uri)
+
+    # A video update drops the responses containing that video (and playlistItems listings), but not others.
+    response, _ = caching_http.request(API_URI + "videos?part=snippet", method="PUT", body=json.dumps({"id": "v1", "snippet": {"title": "New title"}}))
+    assert response.status == 200
+    assert cache.get_response(video_uris[0]) is None and cache.get_response(items_uri) is None
+    assert cache.get_response(video_uris[1]) is not None
+
+    # An insert into the playlist drops its listings.
+    _get_titles(caching_http, items_uri)
+    caching_http.request(API_URI + "playlistItems?part=snippet", method="POST",
+                         body=json.dumps({"snippet": {"playlistId": "PL1", "resourceId": {"kind": "youtube#video", "videoId": "v2"}}}))
+    assert cache.get_response(items_uri) is None
+
+    # Failed writes invalidate nothing.
+    http.write_status = 404
+    caching_http.request(API_URI + "videos?part=snippet", method="PUT", body=json.dumps({"id": "v2", "snippet": {"title": "x"}}))
+    assert cache.get_response(video_uris[1]) is not None
+
+
+def test_invalidation_after_item_deletes(fake, tmp_path):
+    """Deleting an item drops every cached page of its playlist's listing, since all later pages shift."""
+    video_ids = add_sukta_videos(fake, indices=range(60))
+    playlist_id = fake.add_playlist(title="Test", video_ids=video_ids)
+    cache = _make_cache(tmp_path, ttl=3600)
+    channel = make_channel(fake=fake, metadata_cache=cache)
+    playlist = youtube_client.Playlist(api_service=channel.api_service, title="Test", id=playlist_id, sync_items=True)
+    playlist.delete_item(playlist.items[0])
+    relisted_playlist = youtube_client.Playlist(api_service=channel.api_service, title="Test", id=playlist_id, sync_items=True)
+    assert relisted_playlist.get_video_ids() == fake.get_playlist_video_ids(playlist_id) == video_ids[1:]
+
+
+def test_invalidation_after_unknown_item_deletes(tmp_path):
+    """Deleting an item not seen before drops all playlistItems listings - but no others."""
+    video_uri = API_URI + "videos?part=snippet&id=v1"
+    items_uri = API_URI + "playlistItems?part=snippet&playlistId=PL1"
+    http = _Http(responses={video_uri: _get_video_listing("v1", "v1"), items_uri: {"etag": "1", "items": []}})
+    cache = _make_cache(tmp_path, ttl=3600)
+    caching_http = cache.wrap(http)
+    for uri in [video_uri, items_uri]:
+        _get_titles(caching_http, uri)
+    caching_http.request(API_URI + "playlistItems?id=unknown", method="DELETE")
+    assert cache.get_response(items_uri) is None
+    assert cache.get_response(video_uri) is not None
@@ -0,0 +1,53 @@
+import os
+
+from tests.helpers import get_mp4_bytes, get_sukta_file_name
+from video_curation import mp4_probe, video_repo
+
+
+def test_probe_file(tmp_path):
+    path = os.path.join(tmp_path, "test.mp4")
+    with open(path, "wb") as f:
+        f.write(get_mp4_bytes(duration=2, mdat_size=64 * 1024))
+    probe = mp4_probe.probe_file(path)
+    assert (probe['duration'], probe['width'], probe['height'], probe['video_codec'], probe['audio_codec'], probe['error']) == (2, 1280, 720, "avc1", "mp4a", None)
+    assert probe['creation_time'] == 3600000000 - 2082844800
+    assert probe['bitrate'] == os.path.getsize(path) * 8 // 2
+
+
+def test_probe_malformed_files(tmp_path):
+    content = get_mp4_bytes()
+    for name, data in [("truncated.mp4", content[:-1000]), ("empty.mp4", b""), ("text.mp4", b"not a video at all")]:
+        path = os.path.join(tmp_path, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        assert mp4_probe.probe_file(path)['error'] is not None, name
+
+
+def test_probe_index(tmp_path):
+    """Probing files (every tenth of them truncated), and again after changing one."""
+    repo_path = str(tmp_path)
+    for index in range(20):
+        content = get_mp4_bytes(duration=index + 1, mdat_size=64 * 1024)
+        with open(os.path.join(tmp_path, get_sukta_file_name(index)), "wb") as f:
+            f.write(content[:-1000] if index % 10 == 0 else content)
+    repo = video_repo.VideoRepo(repo_paths=[repo_path])
+    assert repo.probe_index.update() == 20
+    assert sorted(repo.probe_index.get_malformed_paths()) == [os.path.join(tmp_path, get_sukta_file_name(index)) for index in [0, 10]]
+    path = os.path.join(tmp_path, get_sukta_file_name(1))
+    assert repo.get_probe(path)['duration'] == 2
+    # Unchanged files are not probed again.
+    assert repo.probe_index.update() == 0
+
+    with open(path, "wb") as f:
+        f.write(get_mp4_bytes(duration=1000, width=1920, height=1080))
+    repo.manifest.forget_directories()
+    repo.rescan()
+    assert repo.probe_index.update() == 1
+    probe = repo.get_probe(path)
+    assert (probe['duration'], probe['width'], probe['height']) == (1000, 1920, 1080)
+
+    # Files modified in place are re-probed without a rescan too.
+    with open(path, "wb") as f:
+        f.write(get_mp4_bytes(duration=500))
+    assert repo.probe_index.update() == 1
+    assert repo.get_probe(path)['duration'] == 500
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from video_curation.playlist_items import PlaylistItems
+from video_curation.youtube_client import PlaylistItem
+
+
+def _make_items(size):
+    # Every video appears twice in a row.
+    return [PlaylistItem(api_service=None, video_id="v%d" % (index // 2), playlist_id="PL", item_id="i%d" % index, position=index) for index in range(size)]
+
+
+def test_list_behaviour():
+    items = _make_items(10)
+    playlist_items = PlaylistItems(items)
+    assert len(playlist_items) == 10
+    assert list(playlist_items) == items and playlist_items[3] is items[3] and playlist_items[-1] is items[-1] and playlist_items[2:4] == items[2:4]
+    assert items[5] in playlist_items and playlist_items.index(items[5]) == 5
+    with pytest.raises(IndexError):
+        playlist_items[10]
+    other_item = PlaylistItem(api_service=None, video_id="w", playlist_id="PL", item_id="j")
+    assert other_item not in playlist_items
+    with pytest.raises(ValueError):
+        playlist_items.index(other_item)
+    with pytest.raises(ValueError):
+        playlist_items.insert(0, items[0])
+
+
+def test_remove_duplicates():
+    items = _make_items(200)
+    playlist_items = PlaylistItems(items)
+    duplicates = playlist_items.get_duplicates()
+    assert duplicates == items[1::2]
+    for item in duplicates:
+        playlist_items.remove(item)
+    assert list(playlist_items) == items[::2]
+    assert [item.position for item in playlist_items] == list(range(100))
+    assert playlist_items.get_item("i1") is None and playlist_items.get_position("i2") == 1
+
+
+def test_random_edits():
+    """Random inserts, moves and deletes, checked against a plain list."""
+    random_generator = random.Random(0)
+    list_items = _make_items(300)
+    playlist_items = PlaylistItems(list_items)
+    for index in range(300):
+        operation = random_generator.choice(["insert", "move", "remove"])
+        if operation == "insert" or len(list_items) == 0:
+            position = random_generator.randint(0, len(list_items))
+            item = PlaylistItem(api_service=None, video_id="v%d" % random_generator.randrange(200), playlist_id="PL", item_id="j%d" % index)
+            list_items.insert(position, item)
+            playlist_items.insert(position, item)
+        else:
+            item = random_generator.choice(list_items)
+            list_items.remove(item)
+            if operation == "move":
+                position = random_generator.randint(0, len(list_items))
+                list_items.insert(position, item)
+                playlist_items.move(item, position)
+            else:
+                playlist_items.remove(item)
+    assert list(playlist_items) == list_items
+    assert [item.position for item in list_items] == list(range(len(list_items)))
+    assert [playlist_items.get_position(item.item_id) for item in list_items] == list(range(len(list_items)))
+    for item in list_items:
+        assert playlist_items.get_items_by_video_id(item.video_id) == [other for other in list_items if other.video_id == item.video_id]
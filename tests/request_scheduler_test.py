@@ -0,0 +1,119 @@
+import json
+import os
+
+import pytest
+
+from tests.fake_youtube import FakeYoutube
+from tests.helpers import add_sukta_videos, get_mp4_bytes, get_public_count, get_sukta_title
+from video_curation import youtube_client
+from video_curation.request_scheduler import CircuitBreaker, CircuitOpenError, QuotaExhaustedError, RequestScheduler
+
+
+def _make_scheduler(**kwargs):
+    return RequestScheduler(max_retries=10, backoff_seconds=0, circuit_breaker=CircuitBreaker(failure_threshold=20), **kwargs)
+
+
+def test_quota_and_deferral(tmp_path):
+    """Over a flaky connection: privacy flips of 100 private videos with quota for just half of them (beyond a reserve), a new playlist of a tenth of them, and an upload beyond the quota.
+    Then, in the next quota window, the deferred flips - until YouTube reports its quota exceeded.
+    """
+    fake = FakeYoutube(error_rate=0.2)
+    video_ids = add_sukta_videos(fake, indices=range(100), privacy="private")
+    playlist_video_ids = video_ids[::10]
+    state_path = os.path.join(tmp_path, "scheduler_state.json")
+    # Room for the playlist and its entries, but not for an upload.
+    reserve = 50 * (1 + len(playlist_video_ids)) + 500
+    scheduler = _make_scheduler(low_priority_reserve=reserve, state_path=state_path)
+    channel = youtube_client.Channel(http_factory=fake.get_http, scheduler=scheduler)
+    channel.set_uploaded_videos()
+    scheduler.daily_quota = scheduler.quota_spent + 50 * 50 + reserve
+    channel.set_video_metadatas(video_metadatas=dict([(video_id, {'privacy': 'public'}) for video_id in video_ids]))
+    assert (get_public_count(fake), len(scheduler.deferred)) == (50, 50)
+
+    # High priority writes go ahead.
+    playlist = youtube_client.Playlist(api_service=channel.api_service, title="Test")
+    playlist.add_to_youtube()
+    playlist.add_videos(video_ids=playlist_video_ids, batch_size=youtube_client.DEFAULT_BATCH_SIZE)
+    assert sorted(fake.get_playlist_video_ids(playlist.id)) == sorted(playlist_video_ids)
+
+    # An upload beyond the quota is refused before a request is sent.
+    filepath = os.path.join(tmp_path, "upload.mp4")
+    with open(filepath, "wb") as f:
+        f.write(get_mp4_bytes())
+    request_count = fake.request_count
+    with pytest.raises(QuotaExhaustedError):
+        youtube_client.YtVideo(title="Beyond the quota", api_service=channel.api_service).initialize_upload(filepath=filepath)
+    assert fake.request_count == request_count
+
+    # The next window, in a later run. YouTube allows a further quarter of the flips.
+    with open(state_path) as f:
+        state = json.load(f)
+    state['window'] = "2000-01-01"
+    with open(state_path, "w") as f:
+        json.dump(state, f)
+    next_scheduler = _make_scheduler(state_path=state_path)
+    assert len(next_scheduler.deferred) == 50
+    next_channel = youtube_client.Channel(http_factory=fake.get_http, scheduler=next_scheduler)
+    fake.daily_quota = fake.quota_spent + 50 * 25
+    next_channel.run_deferred_requests()
+    assert get_public_count(fake) == 75
+    assert len(next_scheduler.deferred) == 25 and next_scheduler.quota_exceeded
+
+
+def test_circuit_breaker():
+    fake = FakeYoutube(error_rate=1)
+    scheduler = RequestScheduler(max_retries=2, backoff_seconds=0, circuit_breaker=CircuitBreaker(failure_threshold=5, cooldown_seconds=60))
+    http = scheduler.wrap(fake.get_http())
+    refused_count = 0
+    for _ in range(10):
+        try:
+            http.request("https://youtube.googleapis.com/youtube/v3/videos?part=id&id=v1")
+        except CircuitOpenError:
+            refused_count += 1
+    # Two requests with two retries each, until 5 consecutive failures open the circuit.
+    assert (fake.request_count, refused_count) == (5, 9)
+
+
+def test_failed_deferred_requests(fake):
+    """Deferred requests which fail are kept for later runs, up to max_deferred_failures times."""
+    video_id = fake.add_video(title=get_sukta_title(0), privacy="private")
+    scheduler = _make_scheduler(max_deferred_failures=2)
+    channel = youtube_client.Channel(http_factory=fake.get_http, scheduler=scheduler)
+    for id in [video_id, "missing"]:
+        scheduler.defer(channel.api_service.videos().update(body={'id': id, 'status': {'privacyStatus': 'public'}}, part='status'))
+    assert channel.run_deferred_requests() == 1
+    assert get_public_count(fake) == 1
+    assert [entry['failures'] for entry in scheduler.deferred] == [1]
+    assert channel.run_deferred_requests() == 0
+    assert scheduler.deferred == []
+
+
+def test_stale_playlists(fake, tmp_path):
+    """Moves and deletes beyond the quota are not deferred - the playlist is re-planned towards its target order in the next window instead, against the items it has by then."""
+    video_ids = add_sukta_videos(fake, indices=range(10))
+    playlist_id = fake.add_playlist(title="Test", video_ids=video_ids[:8])
+    state_path = os.path.join(tmp_path, "scheduler_state.json")
+    scheduler = _make_scheduler(low_priority_reserve=0, state_path=state_path)
+    channel = youtube_client.Channel(http_factory=fake.get_http, scheduler=scheduler)
+    playlist = youtube_client.Playlist(api_service=channel.api_service, title="Test", id=playlist_id, sync_items=True)
+    # Quota for the deletion, but not for the moves.
+    scheduler.daily_quota = scheduler.quota_spent + 50
+    target_video_ids = list(reversed(video_ids[1:8]))
+    playlist.set_videos(video_ids=target_video_ids)
+    assert scheduler.deferred == []
+    assert scheduler.stale_playlists == {playlist_id: target_video_ids}
+    assert fake.get_playlist_video_ids(playlist_id) == video_ids[1:8]
+
+    # Meanwhile, the playlist changes.
+    scheduler.daily_quota = None
+    playlist.add_video_yt(video_id=video_ids[9], position=3)
+    with open(state_path) as f:
+        state = json.load(f)
+    state['window'] = "2000-01-01"
+    with open(state_path, "w") as f:
+        json.dump(state, f)
+    next_scheduler = _make_scheduler(state_path=state_path)
+    next_channel = youtube_client.Channel(http_factory=fake.get_http, scheduler=next_scheduler)
+    next_channel.run_deferred_requests()
+    assert fake.get_playlist_video_ids(playlist_id) == target_video_ids
+    assert next_scheduler.stale_playlists == {}
@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+from curation_projects.rgveda import RgvedaRepo
+from tests.helpers import get_sukta_title, make_channel, write_sukta_files
+
+# Imported only once a job talks to YouTube or archive.org.
+HEAVY_MODULES = ["googleapiclient", "google_auth_httplib2", "httplib2", "curation_utils", "requests", "git"]
+
+
+def test_import():
+    code = "import sys, json; import curation_projects.rgveda; print(json.dumps(sorted(sys.modules)))"
+    modules = json.loads(subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                                        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout)
+    assert [module for module in modules if module.split(".")[0] in HEAVY_MODULES] == []
+
+
+def test_upload_mandala_videos(fake, tmp_path):
+    fake.add_video(title=get_sukta_title(0))
+    channel = make_channel(fake=fake)
+    channel.set_uploaded_videos()
+    repo_path = str(tmp_path)
+    write_sukta_files(repo_path=repo_path, size=10)
+    repo = RgvedaRepo(repo_paths=[repo_path])
+    calls = channel.api_stats.get_total('calls')
+    repo.upload_mandala_videos(mandala_id=1, yt_channel=channel)
+    # One session start and one chunk per missing file.
+    assert channel.api_stats.get_total('calls') - calls == 2 * 9
+    assert sorted(video["snippet"]["title"] for video in fake.videos.values()) == [get_sukta_title(index) for index in range(10)]
+    assert sorted(channel.video_index.get_key("sukta", video) for video in channel.video_index.get_all("sukta")) == [get_sukta_title(index) for index in range(10)]
@@ -0,0 +1,28 @@
+
+from curation_projects import rgveda
+from curation_projects.rgveda import RgvedaRepo
+from tests.helpers import add_sukta_videos, get_sukta_title, make_channel, write_sukta_files
+
+
+def test_sync(fake, tmp_path):
+    """A channel with every other sukta uploaded (with outdated metadata), synced to all suktas of the local repo in a mandala playlist - and then synced again."""
+    add_sukta_videos(fake, indices=range(0, 20, 2))
+    channel = make_channel(fake=fake)
+    repo_path = str(tmp_path)
+    write_sukta_files(repo_path=repo_path, size=20)
+    repo = RgvedaRepo(repo_paths=[repo_path])
+    engine = repo.get_sync_engine(yt_channel=channel)
+    engine.read()
+    plan = engine.plan(desired_state=repo.get_desired_state(yt_channel=channel, mandala_ids=[1]))
+    assert plan.get_call_counts() == {'videos.insert': 10, 'videos.update': 10, 'playlists.insert': 1, 'playlistItems.insert': 20}
+    engine.apply(plan)
+    titles = sorted(video["snippet"]["title"] for video in fake.videos.values())
+    assert titles == sorted(rgveda.get_video_title(get_sukta_title(index)) for index in range(20))
+    assert all(video["snippet"]["description"] == rgveda.description for video in fake.videos.values())
+    [playlist_id] = fake.playlists.keys()
+    assert fake.playlists[playlist_id]["snippet"]["title"] == rgveda.get_playlist_title(mandala_id="RIGSS 01")
+    playlist_titles = [fake.videos[video_id]["snippet"]["title"] for video_id in fake.get_playlist_video_ids(playlist_id)]
+    assert playlist_titles == [rgveda.get_video_title(get_sukta_title(index)) for index in range(20)]
+
+    engine.read()
+    assert len(engine.plan(desired_state=repo.get_desired_state(yt_channel=channel, mandala_ids=[1]))) == 0
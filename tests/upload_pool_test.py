@@ -0,0 +1,36 @@
+import os
+import threading
+import time
+
+from video_curation import upload_pool
+
+
+class _BlockingVideo(object):
+    """Stands in for a :py:class:video_curation.youtube_client.YtVideo, whose upload lasts until release is set."""
+    def __init__(self, release):
+        self.release = release
+
+    def initialize_upload(self, filepath, http=None, progress_callback=None, session_store=None, chunk_throttle=None):
+        assert self.release.wait(timeout=10)
+
+
+def test_reserved_worker(tmp_path):
+    """An urgent job starts at once, even while the backlog keeps every regular worker busy."""
+    backlog_release, urgent_release = threading.Event(), threading.Event()
+    urgent_release.set()
+    filepath = os.path.join(tmp_path, "video.mp4")
+    with open(filepath, "wb") as f:
+        f.write(b"0" * 1024)
+    pool = upload_pool.UploadPool(http_factory=lambda: None, num_workers=2)
+    pool.start()
+    backlog_jobs = [pool.submit(upload_pool.UploadJob(video=_BlockingVideo(backlog_release), filepath=filepath)) for _ in range(3)]
+    while [job.status for job in backlog_jobs] != ['uploading', 'uploading', 'pending']:
+        time.sleep(0.01)
+    urgent_job = pool.submit(upload_pool.UploadJob(video=_BlockingVideo(urgent_release), filepath=filepath, priority=-1))
+    pool.wait([urgent_job])
+    assert urgent_job.status == 'done'
+    assert [job.status for job in backlog_jobs] == ['uploading', 'uploading', 'pending']
+    backlog_release.set()
+    pool.wait(backlog_jobs)
+    pool.stop()
+    assert [job.status for job in backlog_jobs] == ['done'] * 3
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from tests.helpers import make_channel
+from video_curation import upload_sessions, youtube_client
+from video_curation.upload_sessions import CHUNK_GRANULARITY
+
+
+class _Interruption(Exception):
+    pass
+
+
+def test_session_store(tmp_path):
+    path = os.path.join(tmp_path, "sessions.json")
+    filepath = os.path.join(tmp_path, "upload.mp4")
+    with open(filepath, "wb") as f:
+        f.write(b"video")
+    upload_sessions.UploadSessionStore(path).put(filepath=filepath, session_uri="https://upload/1", bytes_confirmed=3)
+    # Survives a restart.
+    store = upload_sessions.UploadSessionStore(path)
+    assert (store.get(filepath)['session_uri'], store.get(filepath)['bytes_confirmed']) == ("https://upload/1", 3)
+    # A changed file is a different upload.
+    stat = os.stat(filepath)
+    os.utime(filepath, (stat.st_atime, stat.st_mtime + 10))
+    assert store.get(filepath) is None
+    store.put(filepath=filepath, session_uri="https://upload/2", bytes_confirmed=0)
+    store.delete(filepath)
+    assert upload_sessions.UploadSessionStore(path).get(filepath) is None
+
+
+def test_resume_after_restart(fake, tmp_path):
+    """An upload interrupted after two chunks is resumed by a later run (with new objects throughout) from the third chunk."""
+    filepath = os.path.join(tmp_path, "upload.mp4")
+    with open(filepath, "wb") as f:
+        f.write(os.urandom(5 * CHUNK_GRANULARITY))
+    store_path = os.path.join(tmp_path, "sessions.json")
+    progress = []
+
+    def interrupt_after_two_chunks(bytes_uploaded):
+        progress.append(bytes_uploaded)
+        if len(progress) == 2:
+            raise _Interruption()
+    video = youtube_client.YtVideo(title="Resumed", api_service=make_channel(fake=fake).api_service)
+    with pytest.raises(_Interruption):
+        video.initialize_upload(filepath=filepath, session_store=upload_sessions.UploadSessionStore(store_path), progress_callback=interrupt_after_two_chunks,
+                                chunk_sizer=upload_sessions.AdaptiveChunkSizer(initial=CHUNK_GRANULARITY, maximum=CHUNK_GRANULARITY))
+    assert upload_sessions.UploadSessionStore(store_path).get(filepath)['bytes_confirmed'] == 2 * CHUNK_GRANULARITY
+
+    progress = []
+    store = upload_sessions.UploadSessionStore(store_path)
+    video = youtube_client.YtVideo(title="Resumed", api_service=make_channel(fake=fake).api_service)
+    video.initialize_upload(filepath=filepath, session_store=store, progress_callback=progress.append,
+                            chunk_sizer=upload_sessions.AdaptiveChunkSizer(initial=CHUNK_GRANULARITY, maximum=CHUNK_GRANULARITY))
+    assert progress == [index * CHUNK_GRANULARITY for index in range(3, 6)]
+    assert fake.videos[video.id]["snippet"]["title"] == "Resumed"
+    assert len(fake.videos) == 1 and len(fake.upload_sessions) == 0
+    assert store.get(filepath) is None
+
+
+def test_adaptive_chunk_sizer():
+    sizer = upload_sessions.AdaptiveChunkSizer(initial=4 * CHUNK_GRANULARITY, maximum=32 * CHUNK_GRANULARITY, target_seconds=10)
+    # Growth is limited to doubling per chunk.
+    sizer.record_success(num_bytes=sizer.chunksize, seconds=0.01)
+    assert sizer.chunksize == 8 * CHUNK_GRANULARITY
+    for _ in range(5):
+        sizer.record_success(num_bytes=sizer.chunksize, seconds=0.01)
+    assert sizer.chunksize == 32 * CHUNK_GRANULARITY
+    # A slow chunk shrinks the next to about target_seconds worth, in whole granules.
+    sizer.record_success(num_bytes=10 * CHUNK_GRANULARITY + 1, seconds=20)
+    assert sizer.chunksize == 5 * CHUNK_GRANULARITY
+    sizer.record_error()
+    assert sizer.chunksize == 2 * CHUNK_GRANULARITY
+    for _ in range(3):
+        sizer.record_error()
+    assert sizer.chunksize == CHUNK_GRANULARITY
+    assert upload_sessions.AdaptiveChunkSizer(initial=10 ** 10).chunksize <= 64 * 1024 * 1024
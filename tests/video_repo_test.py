@@ -0,0 +1,46 @@
+import os
+import shutil
+
+from tests.helpers import get_sukta_file_name, get_sukta_title
+from video_curation import video_repo
+
+
+def test_scan(tmp_path):
+    repo_paths = []
+    for index in range(30):
+        if index % 10 == 0:
+            repo_paths.append(os.path.join(tmp_path, "%05d" % (index // 10)))
+            os.makedirs(repo_paths[-1])
+        open(os.path.join(repo_paths[-1], get_sukta_file_name(index)), "wb").close()
+    manifest_path = os.path.join(tmp_path, "manifest.sqlite")
+    for _ in range(2):
+        repo = video_repo.VideoRepo(repo_paths=repo_paths, manifest_path=manifest_path)
+        assert sorted(repo.title_to_path) == [get_sukta_title(index) for index in range(30)]
+        repo.manifest.close()
+
+
+def test_incremental_rescan(tmp_path):
+    """Rescans list only changed directories, report title collisions across directories, and drop directories which disappeared."""
+    root = str(tmp_path)
+    directories = [os.path.join(tmp_path, name) for name in ["a", "b", "c"]]
+    for directory_index, directory in enumerate(directories):
+        os.makedirs(directory)
+        for index in range(directory_index * 10, directory_index * 10 + 10):
+            open(os.path.join(directory, get_sukta_file_name(index)), "wb").close()
+    repo = video_repo.VideoRepo(repo_paths=[root], recursive=True)
+    assert repo.manifest.count_files(roots=[root]) == 30
+    assert repo.get_title_collisions() == {}
+    # Nothing changed.
+    assert repo.manifest.scan(roots=[root], title_function=repo.get_title_from_path, recursive=True) == 0
+
+    collision_path = os.path.join(directories[2], get_sukta_file_name(0))
+    open(collision_path, "wb").close()
+    assert repo.manifest.scan(roots=[root], title_function=repo.get_title_from_path, recursive=True) == 1
+    assert repo.get_title_collisions() == {get_sukta_title(0): [os.path.join(directories[0], get_sukta_file_name(0)), collision_path]}
+
+    shutil.rmtree(directories[0])
+    # The root, whose mtime changed.
+    assert repo.manifest.scan(roots=[root], title_function=repo.get_title_from_path, recursive=True) == 1
+    assert repo.get_title_collisions() == {}
+    assert sorted(repo.title_to_path) == [get_sukta_title(index) for index in [0] + list(range(10, 30))]
+    assert repo.get_paths_for_title(get_sukta_title(0)) == [collision_path]
@@ -0,0 +1,165 @@
+import concurrent.futures
+import os
+
+from curation_projects import rgveda
+from tests.fake_youtube import FakeYoutube
+from tests.helpers import add_sukta_videos, get_sukta_title, make_channel
+from video_curation import youtube_client
+
+
+def test_channel_construction(fake):
+    add_sukta_videos(fake, indices=range(120))
+    channel = make_channel(fake=fake)
+    channel.set_uploaded_videos()
+    channel.set_playlists()
+    # channels.list, playlistItems.list and videos.list pages (3 of each), playlists.list.
+    assert channel.api_stats.get_total('calls') == 1 + 2 * 3 + 1
+    assert sorted(video.title for video in channel.uploaded_vids) == [get_sukta_title(index) for index in range(120)]
+
+
+def test_shared_api_service(fake):
+    video_ids = add_sukta_videos(fake, indices=range(40))
+    channel = make_channel(fake=fake)
+    videos = [youtube_client.YtVideo(id=video_id, api_service=channel.api_service) for video_id in video_ids]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda video: video.sync_from_youtube(), videos))
+    assert [video.title for video in videos] == [get_sukta_title(index) for index in range(40)]
+    # One http object (with its connections) per thread - the main thread and the executor's - reused across requests.
+    assert len(channel.http_pool) <= 1 + 8
+
+
+def test_set_playlists_and_prefetch(fake):
+    video_ids = add_sukta_videos(fake, indices=range(30))
+    playlist_ids = [fake.add_playlist(title="Playlist %d" % index, video_ids=video_ids[index:index + 10]) for index in range(0, 30, 10)]
+    channel = make_channel(fake=fake)
+    calls = channel.api_stats.get_total('calls')
+    channel.set_playlists()
+    # Items are listed lazily.
+    assert channel.api_stats.get_total('calls') - calls == 1
+    assert not any(playlist.items_loaded() for playlist in channel.playlists)
+    channel.prefetch()
+    assert channel.api_stats.get_total('calls') - calls == 1 + 3
+    assert dict([(playlist.id, playlist.get_video_ids()) for playlist in channel.playlists]) == dict([(playlist_id, fake.get_playlist_video_ids(playlist_id)) for playlist_id in playlist_ids])
+
+
+def test_fields_masks(fake):
+    add_sukta_videos(fake, indices=range(20), description=rgveda.description, tags=rgveda.video_tags)
+    channel = make_channel(fake=fake)
+    bytes_in = {}
+    for name, fields in [("default", None), ("all", youtube_client.ALL_FIELDS)]:
+        start_bytes_in = channel.api_stats.get_total('bytes_in')
+        channel.uploads_playlist.sync_items_from_youtube(fields=fields)
+        channel.set_uploaded_videos(fields=fields)
+        bytes_in[name] = channel.api_stats.get_total('bytes_in') - start_bytes_in
+        assert sorted(video.title for video in channel.uploaded_vids) == [get_sukta_title(index) for index in range(20)]
+    assert bytes_in["default"] * 3 < bytes_in["all"]
+
+
+def test_set_video_metadatas(fake):
+    video_ids = add_sukta_videos(fake, indices=range(60))
+    channel = make_channel(fake=fake)
+    channel.set_uploaded_videos()
+    video_metadatas = dict([(video_id, {"title": "New " + get_sukta_title(index), "tags": ["veda"]}) for (index, video_id) in enumerate(video_ids)])
+    calls = channel.api_stats.get_total('calls')
+    channel.set_video_metadatas(video_metadatas=video_metadatas)
+    # Requests within a batch are counted individually, besides the batch requests themselves.
+    assert channel.api_stats.get_total('calls') - calls == 60 + 2
+    assert [fake.videos[video_id]["snippet"]["title"] for video_id in video_ids] == ["New " + get_sukta_title(index) for index in range(60)]
+    assert all(fake.videos[video_id]["snippet"]["tags"] == ["veda"] for video_id in video_ids)
+    # Unchanged metadata is not sent again.
+    calls = channel.api_stats.get_total('calls')
+    channel.set_video_metadatas(video_metadatas=video_metadatas)
+    assert channel.api_stats.get_total('calls') == calls
+
+
+def test_compact_objects(fake):
+    fake.add_video(title=get_sukta_title(0), tags=["veda"])
+    video = youtube_client.YtVideo.from_yt_metadata(yt_metadata=fake._project(list(fake.videos.values())[0], {"part": "snippet,status"}), api_service=None)
+    item = youtube_client.PlaylistItem.from_metadata(metadata=fake._render_item(fake.uploads_playlist_id, 0), api_service=None)
+    assert not hasattr(video, "__dict__") and not hasattr(item, "__dict__")
+    assert (video.title, video.tags, item.video_id, item.position) == (get_sukta_title(0), ("veda",), video.id, 0)
+
+
+def test_set_videos(fake):
+    video_ids = add_sukta_videos(fake, indices=range(21))
+    channel = make_channel(fake=fake)
+    playlist = youtube_client.Playlist(api_service=channel.api_service, title="Test")
+    playlist.add_to_youtube()
+    for expected_video_ids, expected_calls in [(video_ids[:20], 20), (video_ids[:20], 0), (video_ids, 1)]:
+        calls = channel.api_stats.get_total('calls')
+        playlist.set_videos(video_ids=expected_video_ids)
+        assert channel.api_stats.get_total('calls') - calls == expected_calls
+        assert fake.get_playlist_video_ids(playlist.id) == playlist.get_video_ids() == expected_video_ids
+
+
+def test_deduplicate(fake):
+    video_ids = add_sukta_videos(fake, indices=range(100))
+    # Every tenth video appears twice.
+    playlist_id = fake.add_playlist(title="Test", video_ids=video_ids + video_ids[::10])
+    channel = make_channel(fake=fake)
+    playlist = youtube_client.Playlist(api_service=channel.api_service, title="Test", id=playlist_id, sync_items=True)
+    calls = channel.api_stats.get_total('calls')
+    deleted_items = playlist.deduplicate(batch_size=youtube_client.DEFAULT_BATCH_SIZE)
+    # 10 deletes, in one batch.
+    assert channel.api_stats.get_total('calls') - calls == 10 + 1
+    assert [item.video_id for item in deleted_items] == video_ids[::10]
+    assert fake.get_playlist_video_ids(playlist_id) == playlist.get_video_ids() == video_ids
+    assert [item.position for item in playlist.items] == list(range(100))
+
+
+def test_add_videos():
+    """Videos are added to the top in order; appends to an empty playlist are batched, and any landing out of order are moved into place."""
+    fake = FakeYoutube(shuffle_batches=True)
+    video_ids = add_sukta_videos(fake, indices=range(66))
+    playlist_id = fake.add_playlist(title="Test", video_ids=[])
+    channel = make_channel(fake=fake)
+    playlist = youtube_client.Playlist(api_service=channel.api_service, title="Test", id=playlist_id, sync_items=True)
+    playlist.add_videos(video_ids=video_ids[6:], batch_size=youtube_client.DEFAULT_BATCH_SIZE)
+    assert fake.get_playlist_video_ids(playlist_id) == playlist.get_video_ids() == video_ids[6:]
+    playlist.add_videos(video_ids=video_ids[:6], batch_size=youtube_client.DEFAULT_BATCH_SIZE)
+    assert fake.get_playlist_video_ids(playlist_id) == playlist.get_video_ids() == video_ids
+    assert [item.position for item in playlist.items] == list(range(66))
+
+
+def test_set_videos_batched_appends():
+    """Videos past every existing item are appended in batches - a rebuild takes a round trip per batch when they land in order, and ends in order regardless."""
+    for shuffle_batches in [False, True]:
+        fake = FakeYoutube(shuffle_batches=shuffle_batches)
+        video_ids = add_sukta_videos(fake, indices=range(103))
+        playlist_id = fake.add_playlist(title="Test", video_ids=video_ids[:3])
+        channel = make_channel(fake=fake)
+        playlist = youtube_client.Playlist(api_service=channel.api_service, title="Test", id=playlist_id, sync_items=True)
+        request_count = fake.request_count
+        plan = playlist.set_videos(video_ids=video_ids, batch_size=youtube_client.DEFAULT_BATCH_SIZE)
+        assert plan.num_appends == 100
+        assert fake.get_playlist_video_ids(playlist_id) == playlist.get_video_ids() == video_ids
+        if not shuffle_batches:
+            assert fake.request_count - request_count == 2
+
+
+def test_incremental_uploads_sync(fake, tmp_path):
+    """A later run reuses the stored uploads listing, lists only the page up to the first known item, and fetches just the new videos."""
+    add_sukta_videos(fake, indices=range(120))
+    sync_state_path = os.path.join(tmp_path, "uploads.json")
+    channel = make_channel(fake=fake, sync_state_path=sync_state_path)
+    channel.set_uploaded_videos()
+    assert len(channel.uploaded_vids) == 120
+    assert os.path.exists(sync_state_path)
+
+    new_video_ids = add_sukta_videos(fake, indices=range(120, 123))
+    next_channel = make_channel(fake=fake, sync_state_path=sync_state_path)
+    calls = next_channel.api_stats.get_total('calls')
+    request_count = fake.request_count
+    next_channel.set_uploaded_videos(incremental=True)
+    # One playlistItems.list page, a batch (of 3 videos.list requests) for the etags of the known videos, and one videos.list request for the new ones.
+    assert next_channel.api_stats.get_total('calls') - calls == 6
+    assert fake.request_count - request_count == 3
+    assert next_channel.uploads_playlist.get_video_ids()[:3] == new_video_ids[::-1]
+    assert sorted(video.title for video in next_channel.uploaded_vids) == [get_sukta_title(index) for index in range(123)]
+
+    # Videos edited elsewhere are refetched, by their etags.
+    edited_video_id = new_video_ids[0]
+    fake.videos[edited_video_id]["snippet"]["title"] = "Edited"
+    third_channel = make_channel(fake=fake, sync_state_path=sync_state_path)
+    third_channel.set_uploaded_videos(incremental=True)
+    assert third_channel.uploads_videos[edited_video_id].title == "Edited"
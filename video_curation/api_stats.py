@@ -0,0 +1,207 @@
+"""Count calls, quota units, latency and bytes of YouTube API requests.
+
+Example usage: :py:attr:video_curation.youtube_client.Channel.api_stats , and curation_projects.rgveda .
+"""
+import atexit
+import bisect
+import json
+import logging
+import threading
+import time
+import urllib.parse
+
+# Estimated quota units per method. See https://developers.google.com/youtube/v3/determine_quota_cost .
+QUOTA_COSTS = {
+    'videos.insert': 1600,
+    'search.list': 100,
+}
+DEFAULT_READ_COST = 1
+DEFAULT_WRITE_COST = 50
+
+# Upper bounds (seconds) of latency histogram buckets.
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300]
+
+HTTP_METHOD_TO_API_METHOD = {'GET': 'list', 'POST': 'insert', 'PUT': 'update', 'DELETE': 'delete'}
+
+# Responses with these statuses are retried by googleapiclient and by _resumable_upload.
+RETRIABLE_STATUSES = [429, 500, 502, 503, 504]
+
+
+def get_api_method(uri, method):
+    """Get an API method name (eg. playlistItems.insert) for an http request.
+
+    Media upload chunks (sent to a resumable upload session) are named videos.insert:upload, and cost no quota by themselves.
+    """
+    parsed_uri = urllib.parse.urlparse(uri)
+    collection = parsed_uri.path.rstrip("/").split("/")[-1]
+    if collection == "batch":
+        return "batch"
+    if "upload_id" in urllib.parse.parse_qs(parsed_uri.query):
+        return "%s.insert:upload" % collection
+    return "%s.%s" % (collection, HTTP_METHOD_TO_API_METHOD.get(method, method.lower()))
+
+
+def get_quota_cost(api_method):
+    if api_method in QUOTA_COSTS:
+        return QUOTA_COSTS[api_method]
+    if api_method == "batch" or api_method.endswith(":upload"):
+        return 0
+    if api_method.endswith(".list"):
+        return DEFAULT_READ_COST
+    return DEFAULT_WRITE_COST
+
+
+def get_batch_api_methods(body):
+    """Get API methods of the requests within a multi-part batch request body."""
+    body = body.decode("utf-8") if isinstance(body, bytes) else (body or "")
+    api_methods = []
+    # Inner requests look like "PUT /youtube/v3/playlistItems?part=snippet HTTP/1.1".
+    for line in body.splitlines():
+        parts = line.split(" ")
+        if len(parts) == 3 and parts[2].startswith("HTTP/"):
+            api_methods.append(get_api_method(uri=parts[1], method=parts[0]))
+    return api_methods
+
+
+class MethodStats(object):
+    """Statistics of one API method."""
+    def __init__(self, api_method):
+        self.api_method = api_method
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.quota_units = 0
+        self.seconds = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        # latency_buckets[i] counts calls which took at most LATENCY_BUCKETS[i] seconds (and more than the previous bound); the last entry counts the rest.
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def to_dict(self):
+        return {'calls': self.calls, 'errors': self.errors, 'retries': self.retries, 'quota_units': self.quota_units,
+                'seconds': round(self.seconds, 6), 'bytes_out': self.bytes_out, 'bytes_in': self.bytes_in,
+                'latency_buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], self.latency_buckets))}
+
+
+class ApiStats(object):
+    """In-process statistics of API requests, per API method. Thread-safe."""
+    def __init__(self):
+        self.method_stats = {}
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "calls:%d quota_units:%d seconds:%.1f" % (self.get_total('calls'), self.get_total('quota_units'), self.get_total('seconds'))
+
+    def _get_method_stats(self, api_method):
+        if api_method not in self.method_stats:
+            self.method_stats[api_method] = MethodStats(api_method=api_method)
+        return self.method_stats[api_method]
+
+    def record(self, api_method, seconds, status=200, bytes_out=0, bytes_in=0, quota_units=None):
+        with self._lock:
+            stats = self._get_method_stats(api_method)
+            stats.calls += 1
+            if status is None or status >= 400:
+                stats.errors += 1
+            stats.quota_units += get_quota_cost(api_method) if quota_units is None else quota_units
+            stats.seconds += seconds
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            stats.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def record_retry(self, api_method):
+        with self._lock:
+            self._get_method_stats(api_method).retries += 1
+
+    def get_total(self, attribute):
+        with self._lock:
+            return sum(getattr(stats, attribute) for stats in self.method_stats.values())
+
+    def to_dict(self):
+        with self._lock:
+            methods = dict([(api_method, stats.to_dict()) for (api_method, stats) in sorted(self.method_stats.items())])
+        return {'start_time': self.start_time, 'wall_seconds': round(time.time() - self.start_time, 3),
+                'total_calls': sum(stats['calls'] for stats in methods.values()),
+                'total_quota_units': sum(stats['quota_units'] for stats in methods.values()),
+                'methods': methods}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus_text(self):
+        """Render these statistics in the Prometheus text exposition format."""
+        lines = []
+        counters = [('calls', 'API calls'), ('errors', 'API calls which failed'), ('retries', 'Retried API calls'),
+                    ('quota_units', 'Estimated quota units'), ('bytes_out', 'Request bytes'), ('bytes_in', 'Response bytes')]
+        with self._lock:
+            method_stats = sorted(self.method_stats.items())
+            for attribute, description in counters:
+                name = "youtube_api_%s_total" % attribute
+                lines.append("# HELP %s %s." % (name, description))
+                lines.append("# TYPE %s counter" % name)
+                for api_method, stats in method_stats:
+                    lines.append('%s{method="%s"} %d' % (name, api_method, getattr(stats, attribute)))
+            name = "youtube_api_latency_seconds"
+            lines.append("# HELP %s API call latency." % name)
+            lines.append("# TYPE %s histogram" % name)
+            for api_method, stats in method_stats:
+                cumulative_count = 0
+                for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], stats.latency_buckets):
+                    cumulative_count += count
+                    lines.append('%s_bucket{method="%s",le="%s"} %d' % (name, api_method, bound, cumulative_count))
+                lines.append('%s_sum{method="%s"} %f' % (name, api_method, stats.seconds))
+                lines.append('%s_count{method="%s"} %d' % (name, api_method, stats.calls))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, format="json"):
+        """Write these statistics to path, in json or prometheus (text) format."""
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus_text() if format == "prometheus" else self.to_json())
+        logging.info("API usage: %s. Details in %s", self, path)
+
+    def dump_at_exit(self, path, format="json"):
+        atexit.register(self.dump, path=path, format=format)
+
+    def wrap(self, http):
+        """Return an http object which records requests in these statistics, and otherwise delegates to http."""
+        return InstrumentedHttp(http=http, stats=self)
+
+
+class InstrumentedHttp(object):
+    """Wraps an http object (eg. an AuthorizedHttp), recording every request in an :py:class:ApiStats object.
+
+    A request identical to the previous one (through this http object, which is used by one thread at a time) which failed with a retriable status (or an exception) is counted as a retry.
+    """
+    def __init__(self, http, stats):
+        self.http = http
+        self.stats = stats
+        self._last_failed_request = None
+
+    def __getattr__(self, name):
+        # Let googleapiclient find credentials, timeout etc. of the wrapped http object.
+        return getattr(self.http, name)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        api_method = get_api_method(uri=uri, method=method)
+        request_key = (method, uri)
+        if self._last_failed_request == request_key:
+            self.stats.record_retry(api_method)
+        bytes_out = len(body) if body is not None and hasattr(body, "__len__") else int(dict(headers or {}).get("Content-Length", 0))
+        start_time = time.time()
+        try:
+            resp, content = self.http.request(uri, method=method, body=body, headers=headers, **kwargs)
+        except Exception:
+            self.stats.record(api_method=api_method, seconds=time.time() - start_time, status=None, bytes_out=bytes_out)
+            self._last_failed_request = request_key
+            raise
+        seconds = time.time() - start_time
+        if api_method == "batch":
+            inner_api_methods = get_batch_api_methods(body)
+            self.stats.record(api_method=api_method, seconds=seconds, status=resp.status, bytes_out=bytes_out, bytes_in=len(content or b""))
+            for inner_api_method in inner_api_methods:
+                self.stats.record(api_method=inner_api_method, seconds=0, status=resp.status)
+        else:
+            self.stats.record(api_method=api_method, seconds=seconds, status=resp.status, bytes_out=bytes_out, bytes_in=len(content or b""))
+        self._last_failed_request = request_key if resp.status in RETRIABLE_STATUSES else None
+        return resp, content
@@ -0,0 +1,196 @@
+"""Mirror the files of a :py:class:video_curation.video_repo.VideoRepo to an archive.org item, uploading only files which are new or changed.
+
+Files are compared by md5, which archive.org lists for every file of an item and :py:class:video_curation.content_index.ContentIndex caches for local files - so unchanged files are neither re-hashed nor re-sent. Uploads go via archive.org's S3-like API, num_workers at a time, with retries. requests is imported on first use, since a VideoRepo need not be mirrored.
+
+Example usage: :py:meth:video_curation.video_repo.VideoRepo.mirror_to_archive .
+"""
+import base64
+import concurrent.futures
+import configparser
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+ARCHIVE_METADATA_URL = "https://archive.org/metadata"
+ARCHIVE_S3_URL = "https://s3.us.archive.org"
+# Responses on which an upload is retried.
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ArchiveItem(object):
+    """An archive.org item, listed via the metadata API and written via the S3-like API.
+
+    The base urls may point elsewhere, eg. at the stand-in server in tests.
+    """
+    def __init__(self, identifier, access_key=None, secret_key=None, metadata=None, metadata_url=ARCHIVE_METADATA_URL, s3_url=ARCHIVE_S3_URL, max_retries=5, backoff_seconds=2):
+        """
+
+        :param identifier:
+        :param access_key: S3 keys, as from https://archive.org/account/s3.php - see :py:meth:from_config_file .
+        :param secret_key:
+        :param metadata: A dict of item metadata (eg. mediatype, collection, title), set if the item is created by the first upload.
+        :param metadata_url:
+        :param s3_url:
+        :param max_retries: Per file.
+        :param backoff_seconds: Retries wait backoff_seconds, then twice as long, and so on.
+        """
+        self.identifier = identifier
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.metadata = metadata or {}
+        self.metadata_url = metadata_url
+        self.s3_url = s3_url
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        # Whether the item exists at archive.org, as of the last get_files.
+        self.exists = None
+
+    def __repr__(self):
+        return "archive item:%s" % self.identifier
+
+    @classmethod
+    def from_config_file(cls, identifier, config_path="~/.config/ia.ini", **kwargs):
+        """Read the S3 keys from the config file written by `ia configure`."""
+        config = configparser.ConfigParser()
+        config.read(os.path.expanduser(config_path))
+        return cls(identifier=identifier, access_key=config.get('s3', 'access', fallback=None), secret_key=config.get('s3', 'secret', fallback=None), **kwargs)
+
+    def get_files(self, session=None):
+        """The original (ie. uploaded, rather than derived) files of this item.
+
+        :return: A dict from file name to a dict with md5 and size.
+        """
+        import requests
+        response = (session or requests).get("%s/%s" % (self.metadata_url, self.identifier), timeout=60)
+        response.raise_for_status()
+        item_metadata = response.json()
+        self.exists = len(item_metadata) > 0
+        return dict([(file['name'], {'md5': file.get('md5'), 'size': int(file.get('size', 0))})
+                     for file in item_metadata.get('files', []) if file.get('source', 'original') == 'original'])
+
+    def _get_upload_headers(self, md5):
+        headers = {'authorization': "LOW %s:%s" % (self.access_key, self.secret_key)}
+        if md5 is not None:
+            # archive.org rejects the upload if the received bytes do not match.
+            headers['content-md5'] = base64.b64encode(bytes.fromhex(md5)).decode('ascii')
+        if not self.exists:
+            headers['x-archive-auto-make-bucket'] = "1"
+            for key, value in self.metadata.items():
+                headers['x-archive-meta-%s' % key] = value
+        return headers
+
+    def upload_file(self, filepath, name, md5=None, session=None, on_attempt=None):
+        """Upload filepath as name (streaming it from disk), retrying on connection errors and RETRY_STATUS_CODES.
+
+        :param md5: The hex md5 of filepath, sent for verification.
+        :param session: A requests.Session, one per thread.
+        :param on_attempt: Called with the size of filepath before every attempt.
+        """
+        import requests
+        url = "%s/%s/%s" % (self.s3_url, self.identifier, urllib.parse.quote(name))
+        size = os.path.getsize(filepath)
+        for attempt in range(self.max_retries + 1):
+            if on_attempt is not None:
+                on_attempt(size)
+            try:
+                with open(filepath, 'rb') as f:
+                    response = (session or requests).put(url, data=f, headers=self._get_upload_headers(md5=md5), timeout=600)
+                if response.status_code < 300:
+                    return
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise ArchiveError("Uploading %s to %s failed: %d %s" % (filepath, url, response.status_code, response.text))
+                error = "%d %s" % (response.status_code, response.reason)
+            except requests.exceptions.RequestException as e:
+                error = e
+            if attempt < self.max_retries:
+                sleep_seconds = self.backoff_seconds * 2 ** attempt
+                logging.warning("Uploading %s failed (%s), retrying in %.1f seconds.", filepath, error, sleep_seconds)
+                time.sleep(sleep_seconds)
+        raise ArchiveError("Uploading %s to %s failed after %d retries: %s" % (filepath, url, self.max_retries, error))
+
+
+class ArchiveMirror(object):
+    """Brings an :py:class:ArchiveItem up to date with local files, num_workers uploads at a time.
+
+    archive.org lists a new file only once its ingest task has run, so files uploaded by earlier runs are also remembered in a json file at state_path (if given) - an interrupted mirror thus resumes with the files it has not sent yet. Remote files without a local counterpart are left alone.
+    """
+    def __init__(self, item, num_workers=4, state_path=None):
+        self.item = item
+        self.num_workers = num_workers
+        self.state_path = state_path
+        # File name to the md5 of the last successful upload.
+        self.uploaded = {}
+        if state_path is not None and os.path.exists(state_path):
+            with open(state_path) as f:
+                self.uploaded = json.load(f).get(item.identifier, {})
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._thread_local = threading.local()
+
+    def _get_session(self):
+        if not hasattr(self._thread_local, "session"):
+            import requests
+            self._thread_local.session = requests.Session()
+        return self._thread_local.session
+
+    def _save_state(self):
+        if self.state_path is None:
+            return
+        state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+        state[self.item.identifier] = self.uploaded
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.state_path)
+
+    def get_changed_files(self, files):
+        """The files to upload.
+
+        :param files: A dict from file name (at archive.org) to a (local path, md5) pair.
+        :return: A sorted list of file names, whose md5 differs from both the remote file and the last upload.
+        """
+        remote_files = self.item.get_files(session=self._get_session())
+        return sorted([name for (name, (path, md5)) in files.items()
+                       if md5 is None or md5 not in [remote_files.get(name, {}).get('md5'), self.uploaded.get(name)]])
+
+    def _count_bytes(self, num_bytes):
+        with self._lock:
+            self.bytes_sent += num_bytes
+
+    def _upload(self, name, path, md5):
+        self.item.upload_file(filepath=path, name=name, md5=md5, session=self._get_session(), on_attempt=self._count_bytes)
+        with self._lock:
+            self.uploaded[name] = md5
+            self._save_state()
+        logging.info("Uploaded %s as %s to %s", path, name, self.item)
+
+    def mirror(self, files, dry_run=False):
+        """Upload the new and changed files.
+
+        :param files: See :py:meth:get_changed_files .
+        :param dry_run: If True, only log what would be uploaded.
+        :return: A dict from the name of each failed file to its exception.
+        """
+        names = self.get_changed_files(files=files)
+        logging.info("%d of %d files to upload to %s: %s", len(names), len(files), self.item, names)
+        if dry_run or len(names) == 0:
+            return {}
+        failures = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="archive-upload") as executor:
+            futures = dict([(executor.submit(self._upload, name, files[name][0], files[name][1]), name) for name in names])
+            for future in concurrent.futures.as_completed(futures):
+                if future.exception() is not None:
+                    logging.error("Failed to upload %s: %s", futures[future], future.exception())
+                    failures[futures[future]] = future.exception()
+        logging.info("Sent %.1f MB to %s; %d uploads failed.", self.bytes_sent / 1e6, self.item, len(failures))
+        return failures
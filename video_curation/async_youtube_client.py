@@ -0,0 +1,134 @@
+"""An asyncio variant of the read paths of :py:mod:video_curation.youtube_client, which sends independent requests concurrently.
+
+googleapiclient and httplib2 are blocking, so requests run on a pool of max_concurrency threads (which bounds the requests in flight), each reusing its own http object and so its connections.
+Pages of a single listing still follow one another (each page token comes with the previous page), so concurrency comes from:
+
+- videos.list id chunks, which are all independent,
+- listings of different playlists, and
+- fetching the videos of a page of the uploads playlist while the next page is listed.
+
+Example usage: :py:class:video_curation.youtube_client.Channel (max_concurrency).
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+from video_curation import youtube_client
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+class AsyncYoutubeClient(object):
+    """Executes googleapiclient requests concurrently, at most max_concurrency at a time."""
+    def __init__(self, http_factory, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+
+        :param http_factory: A callable returning a new http object, such as :py:meth:video_curation.youtube_client.Channel.new_http . Called once per worker thread.
+        :param max_concurrency:
+        """
+        self.http_factory = http_factory
+        self.max_concurrency = max_concurrency
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="youtube-client")
+        self._thread_local = threading.local()
+
+    def _get_http(self):
+        if not hasattr(self._thread_local, "http"):
+            self._thread_local.http = self.http_factory()
+        return self._thread_local.http
+
+    def _execute_in_thread(self, request):
+        return request.execute(http=self._get_http())
+
+    async def execute(self, request):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._execute_in_thread, request)
+
+    async def execute_all(self, requests):
+        """Responses to requests, in order."""
+        return await asyncio.gather(*[self.execute(request) for request in requests])
+
+    async def list_pages(self, request, list_next, on_page=None):
+        """Responses of all pages of a listing, in order.
+
+        :param request: The request for the first page.
+        :param list_next: Eg. api_service.playlistItems().list_next .
+        :param on_page: Called with every response as soon as it arrives.
+        """
+        responses = []
+        while request is not None:
+            response = await self.execute(request)
+            if on_page is not None:
+                on_page(response)
+            responses.append(response)
+            request = list_next(request, response)
+        return responses
+
+    def run(self, coroutine):
+        """Sync facade: run coroutine to completion in a new event loop, and return its result."""
+        return asyncio.run(coroutine)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class AsyncChannel(object):
+    """Concurrent reads for a :py:class:video_curation.youtube_client.Channel, producing the same :py:class:video_curation.youtube_client.Playlist, PlaylistItem and YtVideo objects."""
+    def __init__(self, channel, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.channel = channel
+        self.api_service = channel.api_service
+        self.client = AsyncYoutubeClient(http_factory=channel.new_http, max_concurrency=max_concurrency)
+
+    def run(self, coroutine):
+        return self.client.run(coroutine)
+
+    def _get_videos_request(self, video_ids, part, fields=None):
+        return self.api_service.videos().list(part=part, id=",".join(video_ids), fields=youtube_client.get_fields_parameter(fields=fields, part=part, part_fields=youtube_client.YtVideo.PART_FIELDS))
+
+    def _to_videos(self, responses):
+        return [youtube_client.YtVideo.from_yt_metadata(yt_metadata=yt_metadata, api_service=self.api_service) for response in responses for yt_metadata in response["items"]]
+
+    async def get_videos(self, video_ids, part="snippet,status", fields=None):
+        """:py:class:video_curation.youtube_client.YtVideo objects for video_ids, fetching all 50-id chunks concurrently."""
+        requests = [self._get_videos_request(video_ids=id_chunk, part=part, fields=fields) for id_chunk in youtube_client.get_chunks(list(video_ids), 50)]
+        return self._to_videos(await self.client.execute_all(requests))
+
+    def _get_items_request(self, playlist):
+        return self.api_service.playlistItems().list(playlistId=playlist.id, part='snippet', maxResults=50, fields=youtube_client.get_fields_mask(part='snippet', part_fields=youtube_client.PlaylistItem.PART_FIELDS))
+
+    def _set_items(self, playlist, responses):
+        item_metadatas = sorted([metadata for response in responses for metadata in response['items']], key=lambda metadata: metadata['snippet']['position'])
+        playlist.items = [youtube_client.PlaylistItem.from_metadata(metadata=metadata, api_service=self.api_service) for metadata in item_metadatas]
+        return playlist.items
+
+    async def sync_playlist_items(self, playlist):
+        """Set playlist.items from YouTube, like :py:meth:video_curation.youtube_client.Playlist.sync_items_from_youtube ."""
+        responses = await self.client.list_pages(request=self._get_items_request(playlist), list_next=self.api_service.playlistItems().list_next)
+        return self._set_items(playlist=playlist, responses=responses)
+
+    async def sync_playlists_items(self, playlists):
+        """Set the items of all playlists, listing the playlists concurrently."""
+        await asyncio.gather(*[self.sync_playlist_items(playlist) for playlist in playlists])
+
+    async def sync_playlist_items_and_videos(self, playlist, part="snippet,status", fields=None):
+        """Set playlist.items, and get the videos in it - fetching the videos of each page of items while the next page is listed.
+
+        :return: A dict from video id to :py:class:video_curation.youtube_client.YtVideo .
+        """
+        video_tasks = []
+
+        def on_page(response):
+            video_ids = [metadata['snippet']['resourceId']['videoId'] for metadata in response['items']]
+            if len(video_ids) > 0:
+                video_tasks.append(asyncio.ensure_future(self.client.execute(self._get_videos_request(video_ids=video_ids, part=part, fields=fields))))
+        responses = await self.client.list_pages(request=self._get_items_request(playlist), list_next=self.api_service.playlistItems().list_next, on_page=on_page)
+        self._set_items(playlist=playlist, responses=responses)
+        videos = self._to_videos(await asyncio.gather(*video_tasks))
+        return dict([(video.id, video) for video in videos])
+
+    async def get_playlists(self, with_items=False, fields=None):
+        """All playlists of the channel. If with_items, their items are listed right away (concurrently), rather than on first access."""
+        request = self.api_service.playlists().list(mine=True, part='snippet, status', maxResults=50, fields=youtube_client.get_fields_parameter(fields=fields, part='snippet, status', part_fields=youtube_client.Playlist.PART_FIELDS))
+        responses = await self.client.list_pages(request=request, list_next=self.api_service.playlists().list_next)
+        playlists = [youtube_client.Playlist.from_metadata(yt_metadata=metadata, api_service=self.api_service, sync_items=False) for response in responses for metadata in response['items']]
+        if with_items:
+            await self.sync_playlists_items(playlists)
+        return playlists
@@ -0,0 +1,118 @@
+"""Shape the bandwidth used by uploads: a global bytes-per-second cap, which may vary by time of day, shared by prioritized uploads.
+
+Example usage: :py:class:video_curation.upload_pool.UploadPool .
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from video_curation.upload_sessions import CHUNK_GRANULARITY
+
+# How long a waiter sleeps at most before rechecking the (possibly changed) rate.
+MAX_WAIT_SECONDS = 60
+
+
+class BandwidthSchedule(object):
+    """Bytes-per-second limits by local time of day.
+
+    Example: full speed at night, 1 MB/s by day:
+        BandwidthSchedule(windows=[(9, 21, 1e6)], default_bytes_per_second=None)
+    """
+    def __init__(self, windows, default_bytes_per_second=None):
+        """
+
+        :param windows: A list of (start_hour, end_hour, bytes_per_second) tuples. Hours may be fractional; a window with start_hour > end_hour wraps around midnight. bytes_per_second None means unlimited, and 0 means paused. The first matching window wins.
+        :param default_bytes_per_second: The limit outside all windows.
+        """
+        self.windows = windows
+        self.default_bytes_per_second = default_bytes_per_second
+
+    def get_rate(self, when=None):
+        local_time = time.localtime(when)
+        hour = local_time.tm_hour + local_time.tm_min / 60 + local_time.tm_sec / 3600
+        for start_hour, end_hour, bytes_per_second in self.windows:
+            if start_hour <= end_hour:
+                in_window = start_hour <= hour < end_hour
+            else:
+                in_window = hour >= start_hour or hour < end_hour
+            if in_window:
+                return bytes_per_second
+        return self.default_bytes_per_second
+
+
+class BandwidthLimiter(object):
+    """A token bucket shared by all uploads, whose tokens are bytes.
+
+    Upload chunks take tokens before they are sent (see :py:meth:shape_chunk), and waiting chunks are served in priority order, so that an urgent upload overtakes a running backlog at its next chunk. A chunk may overdraw the bucket; the debt delays the following chunks, which keeps the average rate at the limit.
+    """
+    def __init__(self, bytes_per_second=None, schedule=None, burst_seconds=2):
+        """
+
+        :param bytes_per_second: A fixed limit. None means unlimited.
+        :param schedule: A :py:class:BandwidthSchedule, overriding bytes_per_second.
+        :param burst_seconds: The bucket holds this many seconds worth of bytes. Chunks are also limited to this size, since a chunk, once started, is sent at full link speed.
+        """
+        self.bytes_per_second = bytes_per_second
+        self.schedule = schedule
+        self.burst_seconds = burst_seconds
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._tokens = 0
+        self._last_refill_time = time.time()
+
+    def get_rate(self):
+        """The current limit in bytes per second (None if unlimited)."""
+        if self.schedule is not None:
+            return self.schedule.get_rate()
+        return self.bytes_per_second
+
+    def limit_chunksize(self, chunksize):
+        rate = self.get_rate()
+        if not rate:
+            return chunksize
+        max_chunksize = max(int(rate * self.burst_seconds) // CHUNK_GRANULARITY * CHUNK_GRANULARITY, CHUNK_GRANULARITY)
+        return min(chunksize, max_chunksize)
+
+    def _refill(self, rate):
+        now = time.time()
+        if rate is not None:
+            self._tokens = min(self._tokens + (now - self._last_refill_time) * rate, rate * self.burst_seconds)
+        self._last_refill_time = now
+
+    def acquire(self, num_bytes, priority=0):
+        """Block until num_bytes may be sent.
+
+        :param num_bytes:
+        :param priority: Waiters with smaller values go first.
+        """
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    rate = self.get_rate()
+                    self._refill(rate)
+                    wait_seconds = None
+                    if self._waiters[0] == ticket:
+                        if rate is None:
+                            return
+                        if rate > 0 and self._tokens >= 0:
+                            self._tokens -= num_bytes
+                            return
+                        wait_seconds = MAX_WAIT_SECONDS if rate == 0 else min(-self._tokens / rate, MAX_WAIT_SECONDS)
+                    self._condition.wait(wait_seconds)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def shape_chunk(self, chunksize, bytes_remaining, priority=0):
+        """Limit chunksize, and wait until the chunk may be sent. Meant to be passed (as chunk_throttle) to :py:meth:video_curation.youtube_client.YtVideo.initialize_upload .
+
+        :return: The chunk size to use.
+        """
+        chunksize = self.limit_chunksize(chunksize)
+        self.acquire(num_bytes=min(chunksize, bytes_remaining), priority=priority)
+        return chunksize
@@ -0,0 +1,130 @@
+"""In-memory indexes over the videos or playlists of a channel, so that lookups by project-defined keys or by words need not scan all of them.
+
+Example usage: :py:meth:curation_projects.rgveda.RgvedaRepo.set_mandala_videos_in_playlist .
+"""
+import re
+
+# Tokens are runs of characters other than whitespace, ASCII punctuation and dandas - so that words in Indic scripts (with their combining vowel signs) stay whole.
+TOKEN_PATTERN = re.compile(r"[^\s!-/:-@\[-`{-~।॥]+")
+
+
+def tokenize(text):
+    """Lowercased tokens of text, as a set."""
+    if not text:
+        return set()
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+def get_text_tokens(item):
+    """Tokens of the title, description and tags of a :py:class:video_curation.youtube_client.YtVideo or Playlist."""
+    tokens = tokenize(item.title) | tokenize(item.description)
+    for tag in item.tags or []:
+        tokens |= tokenize(tag)
+    return tokens
+
+
+class ChannelIndex(object):
+    """Indexes items (YtVideo or Playlist objects, identified by their id) by named keys and by the tokens of their text.
+
+    A key function maps an item to a hashable key, or None if the item should not be indexed under that name. Indexes are updated item by item via :py:meth:add and :py:meth:remove, so after editing an item, call add again.
+    """
+    def __init__(self, key_functions=None):
+        """
+
+        :param key_functions: A dict from index name to key function.
+        """
+        self.key_functions = {}
+        # Item id to item.
+        self.items = {}
+        # Index name to a dict from key to a dict (used as an ordered set) of item ids.
+        self._key_indexes = {}
+        # Token to a dict of item ids.
+        self._token_index = {}
+        # Item id to ({index name: key}, tokens) it is currently indexed under, so that it can be unindexed even after being edited.
+        self._indexed_entries = {}
+        for name, key_function in (key_functions or {}).items():
+            self.add_key(name=name, key_function=key_function)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add_key(self, name, key_function):
+        """Index all items under a new key function. Does nothing if an index of that name exists."""
+        if name in self.key_functions:
+            return
+        self.key_functions[name] = key_function
+        self._key_indexes[name] = {}
+        for item_id, item in self.items.items():
+            key = key_function(item)
+            self._indexed_entries[item_id][0][name] = key
+            if key is not None:
+                self._key_indexes[name].setdefault(key, {})[item_id] = None
+
+    def add(self, item):
+        """Index item, or reindex it if an item of the same id is indexed already."""
+        self.remove(item)
+        self.items[item.id] = item
+        keys = {}
+        for name, key_function in self.key_functions.items():
+            key = key_function(item)
+            keys[name] = key
+            if key is not None:
+                self._key_indexes[name].setdefault(key, {})[item.id] = None
+        tokens = get_text_tokens(item)
+        for token in tokens:
+            self._token_index.setdefault(token, {})[item.id] = None
+        self._indexed_entries[item.id] = (keys, tokens)
+
+    def remove(self, item):
+        """Unindex item (if indexed)."""
+        if item.id not in self._indexed_entries:
+            return
+        keys, tokens = self._indexed_entries.pop(item.id)
+        for name, key in keys.items():
+            if key is not None:
+                _discard(self._key_indexes[name], key, item.id)
+        for token in tokens:
+            _discard(self._token_index, token, item.id)
+        del self.items[item.id]
+
+    def set_items(self, items):
+        """Reindex from scratch, with just these items."""
+        self.items = {}
+        self._key_indexes = dict([(name, {}) for name in self.key_functions])
+        self._token_index = {}
+        self._indexed_entries = {}
+        for item in items:
+            self.add(item)
+
+    def get(self, name, key):
+        """Items whose name key is key, in the order they were indexed."""
+        return [self.items[item_id] for item_id in self._key_indexes[name].get(key, {})]
+
+    def get_key(self, name, item):
+        """The name key item is indexed under (None if it is not)."""
+        entry = self._indexed_entries.get(item.id)
+        return None if entry is None else entry[0][name]
+
+    def get_keys(self, name):
+        return list(self._key_indexes[name].keys())
+
+    def get_all(self, name):
+        """Items having some name key."""
+        return [self.items[item_id] for item_ids in self._key_indexes[name].values() for item_id in item_ids]
+
+    def search(self, text):
+        """Items having every token of text in their title, description or tags."""
+        posting_lists = [self._token_index.get(token, {}) for token in tokenize(text)]
+        if len(posting_lists) == 0:
+            return []
+        posting_lists.sort(key=len)
+        return [self.items[item_id] for item_id in posting_lists[0] if all(item_id in posting_list for posting_list in posting_lists[1:])]
+
+
+def _discard(index, key, item_id):
+    item_ids = index.get(key)
+    if item_ids is None:
+        return
+    item_ids.pop(item_id, None)
+    if len(item_ids) == 0:
+        del index[key]
@@ -0,0 +1,218 @@
+"""Run a curation job over many channels at once, each in its own worker process - with its own credentials, api service, caches and quota budget.
+
+A failing channel does not stop the others; the run ends with a report of every channel's result (or error) and timing. A nightly pass over all channels thus takes about as long as the slowest one.
+
+Example usage: curation_projects.rgveda .
+"""
+import concurrent.futures
+import importlib
+import json
+import logging
+import os
+import time
+import traceback
+
+
+class ChannelConfig(object):
+    """What a worker process needs to set up one channel, and the arguments of the job to run on it. Picklable, so that it can be sent to the worker."""
+    def __init__(self, name, token_file_path=None, client_secret_file=None, service_account_file=None, cache_dir=None, daily_quota=None,
+                 channel_kwargs=None, job_kwargs=None, http_factory=None):
+        """
+
+        :param name: Eg. "kashcit". Names the channel in reports, and its files in cache_dir.
+        :param token_file_path: See :py:class:video_curation.youtube_client.Channel .
+        :param client_secret_file:
+        :param service_account_file:
+        :param cache_dir: If given, the channel keeps its metadata cache (<name>.sqlite), uploads sync state (<name>_uploads.json), quota state (<name>_scheduler.json), API statistics (<name>_api_stats.json) and log (<name>.log) there.
+        :param daily_quota: The quota budget of this channel's project - see :py:class:video_curation.request_scheduler.RequestScheduler .
+        :param channel_kwargs: More arguments for :py:class:video_curation.youtube_client.Channel, eg. max_concurrency.
+        :param job_kwargs: Arguments for the job, besides the channel.
+        :param http_factory: See :py:class:video_curation.youtube_client.Channel . Must be picklable.
+        """
+        self.name = name
+        self.token_file_path = token_file_path
+        self.client_secret_file = client_secret_file
+        self.service_account_file = service_account_file
+        self.cache_dir = cache_dir
+        self.daily_quota = daily_quota
+        self.channel_kwargs = channel_kwargs or {}
+        self.job_kwargs = job_kwargs or {}
+        self.http_factory = http_factory
+
+    def __repr__(self):
+        return "channel config:%s" % self.name
+
+    def get_cache_path(self, suffix):
+        """The path of this channel's file with suffix (eg. "_uploads.json") in cache_dir, None without a cache_dir."""
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, self.name + suffix)
+
+    def make_channel(self):
+        """A new :py:class:video_curation.youtube_client.Channel, authenticated as configured."""
+        # Imported here, so that the parent process (which only hands out configs) stays light.
+        from video_curation import metadata_cache, request_scheduler, youtube_client
+        scheduler = request_scheduler.RequestScheduler(daily_quota=self.daily_quota, state_path=self.get_cache_path("_scheduler.json"))
+        cache = None
+        if self.cache_dir is not None:
+            cache = metadata_cache.MetadataCache(path=self.get_cache_path(".sqlite"))
+        return youtube_client.Channel(service_account_file=self.service_account_file, token_file_path=self.token_file_path, client_secret_file=self.client_secret_file,
+                                      metadata_cache=cache, sync_state_path=self.get_cache_path("_uploads.json"), http_factory=self.http_factory, scheduler=scheduler,
+                                      **self.channel_kwargs)
+
+
+def load_channel_configs(path):
+    """ChannelConfig objects from a json file holding a list of dicts of their arguments (but for http_factory)."""
+    with open(path) as f:
+        return [ChannelConfig(**entry) for entry in json.load(f)]
+
+
+class ChannelResult(object):
+    """The outcome of a job on one channel.
+
+    - status: "ok" or "failed".
+    - result: What the job returned.
+    - error, traceback: Of the failure, if any.
+    - seconds: From process start of the channel (including authentication) to the end of the job.
+    - calls, quota_units: Requests sent, as counted by the channel's :py:class:video_curation.api_stats.ApiStats .
+    - deferred: Requests waiting for the next quota window.
+    """
+    def __init__(self, name, status, result=None, error=None, traceback=None, seconds=0, calls=0, quota_units=0, deferred=0):
+        self.name = name
+        self.status = status
+        self.result = result
+        self.error = error
+        self.traceback = traceback
+        self.seconds = seconds
+        self.calls = calls
+        self.quota_units = quota_units
+        self.deferred = deferred
+
+    def __repr__(self):
+        return "%s:%s" % (self.name, self.status)
+
+    def to_dict(self):
+        return {'name': self.name, 'status': self.status, 'result': self.result, 'error': self.error, 'traceback': self.traceback,
+                'seconds': round(self.seconds, 3), 'calls': self.calls, 'quota_units': self.quota_units, 'deferred': self.deferred}
+
+
+def get_job_function(job):
+    """job itself if callable, else the function named by job as "module:function" (eg. "curation_projects.rgveda:sync_channel")."""
+    if callable(job):
+        return job
+    module_name, function_name = job.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run_channel_job(config, job, run_deferred=True):
+    """Set up the channel of config, and run job on it - in the calling (worker) process.
+
+    :param config: A :py:class:ChannelConfig .
+    :param job: Called as job(channel=channel, **config.job_kwargs) - a picklable function, or its "module:function" name (see :py:func:get_job_function).
+    :param run_deferred: If True, first send requests deferred by earlier runs (see :py:meth:video_curation.youtube_client.Channel.run_deferred_requests).
+    :return: A :py:class:ChannelResult . Failures are caught, and reported there.
+    """
+    start_time = time.time()
+    log_handler = None
+    if config.cache_dir is not None:
+        log_handler = logging.FileHandler(config.get_cache_path(".log"))
+        log_handler.setFormatter(logging.Formatter("%(levelname)s:%(asctime)s:%(module)s:%(lineno)d %(message)s"))
+        logging.getLogger().addHandler(log_handler)
+    channel = None
+    try:
+        channel = config.make_channel()
+        if run_deferred:
+            channel.run_deferred_requests()
+        result = get_job_function(job)(channel=channel, **config.job_kwargs)
+        channel_result = ChannelResult(name=config.name, status="ok", result=result)
+    except Exception as e:
+        logging.exception("Job failed for %s", config)
+        channel_result = ChannelResult(name=config.name, status="failed", error="%s: %s" % (type(e).__name__, e), traceback=traceback.format_exc())
+    finally:
+        if channel is not None:
+            channel.scheduler.save_state()
+            if config.cache_dir is not None:
+                channel.api_stats.dump(path=config.get_cache_path("_api_stats.json"))
+        if log_handler is not None:
+            logging.getLogger().removeHandler(log_handler)
+            log_handler.close()
+    if channel is not None:
+        channel_result.calls = channel.api_stats.get_total('calls')
+        channel_result.quota_units = channel.api_stats.get_total('quota_units')
+        channel_result.deferred = len(channel.scheduler.deferred)
+    channel_result.seconds = time.time() - start_time
+    return channel_result
+
+
+class RunReport(object):
+    """The results of a :py:class:ChannelRunner run, in the order of the configs."""
+    def __init__(self, results, seconds):
+        self.results = results
+        self.seconds = seconds
+
+    def __repr__(self):
+        return "channels:%d failed:%d seconds:%.1f" % (len(self.results), len(self.get_failures()), self.seconds)
+
+    def get_failures(self):
+        return [result for result in self.results if result.status != "ok"]
+
+    def describe(self):
+        """A table of channels with status, time, calls, quota and error - and the wall time against the time of all channels one after another."""
+        lines = ["%-20s %8s %10s %8s %12s %8s  %s" % ("channel", "status", "seconds", "calls", "quota_units", "deferred", "error")]
+        for result in self.results:
+            lines.append("%-20s %8s %10.1f %8d %12d %8d  %s" % (result.name, result.status, result.seconds, result.calls, result.quota_units, result.deferred, result.error or ""))
+        lines.append("%d channels, %d failed, in %.1f seconds (%.1f seconds one after another)." % (len(self.results), len(self.get_failures()), self.seconds,
+                                                                                                sum(result.seconds for result in self.results)))
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {'seconds': round(self.seconds, 3), 'results': [result.to_dict() for result in self.results]}
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2, default=repr)
+        logging.info("Run report: %s. Details in %s", self, path)
+
+
+class ChannelRunner(object):
+    """Runs a job over many channels, each in a worker process of its own (up to num_workers at a time)."""
+    def __init__(self, configs, job, num_workers=None, run_deferred=True):
+        """
+
+        :param configs: :py:class:ChannelConfig objects, with distinct names.
+        :param job: See :py:func:run_channel_job .
+        :param num_workers: Defaults to one per channel.
+        :param run_deferred: See :py:func:run_channel_job .
+        """
+        self.configs = configs
+        self.job = job
+        self.num_workers = num_workers or max(1, len(configs))
+        self.run_deferred = run_deferred
+
+    def _run_channel(self, config):
+        """Run the job on config's channel in a new process - so that a crash of that process (which breaks its pool) affects no other channel."""
+        start_time = time.time()
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                return executor.submit(run_channel_job, config, self.job, self.run_deferred).result()
+        except Exception as e:
+            logging.error("Worker process of %s failed: %s", config, e)
+            return ChannelResult(name=config.name, status="failed", error="%s: %s" % (type(e).__name__, e), seconds=time.time() - start_time)
+
+    def run(self):
+        """Run the job on every channel.
+
+        :return: A :py:class:RunReport . A channel whose worker process died is reported as failed too.
+        """
+        start_time = time.time()
+        results = {}
+        # Threads only wait on the worker processes.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            futures = dict([(executor.submit(self._run_channel, config), config) for config in self.configs])
+            for future in concurrent.futures.as_completed(futures):
+                config = futures[future]
+                results[config.name] = future.result()
+                logging.info("Done with %s: %s in %.1f seconds", config, results[config.name].status, results[config.name].seconds)
+        report = RunReport(results=[results[config.name] for config in self.configs], seconds=time.time() - start_time)
+        logging.info("%s\n%s", report, report.describe())
+        return report
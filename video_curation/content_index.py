@@ -0,0 +1,72 @@
+"""Index video files by content checksum, to find byte-identical files under different names.
+
+md5 is used since archive.org item file lists carry md5 checksums too.
+
+Example usage: :py:meth:video_curation.video_repo.VideoRepo.update_content_index .
+"""
+import concurrent.futures
+import hashlib
+import logging
+import mmap
+import os
+
+# Bytes hashed per step.
+BUFFER_SIZE = 8 * 1024 * 1024
+
+
+def get_file_checksum(path, buffer_size=BUFFER_SIZE):
+    """Stream path through md5 via a memory map, buffer_size bytes at a time. Returns the hex digest."""
+    checksum = hashlib.md5()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return checksum.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            with memoryview(mapped_file) as view:
+                for offset in range(0, size, buffer_size):
+                    checksum.update(view[offset:offset + buffer_size])
+    return checksum.hexdigest()
+
+
+class ContentIndex(object):
+    """Checksums of files in a :py:class:video_curation.repo_manifest.RepoManifest, cached there by (path, size, mtime), so that unchanged files are never re-hashed."""
+    def __init__(self, manifest, roots, num_workers=None):
+        """
+
+        :param manifest:
+        :param roots: Restrict the index to files under these roots.
+        :param num_workers: Number of hashing processes. Defaults to the number of CPUs.
+        """
+        self.manifest = manifest
+        self.roots = roots
+        self.num_workers = num_workers
+
+    def update(self):
+        """Hash every file in the manifest which is new or changed since it was last hashed, on a process pool.
+
+        Every file is re-stat-ed first (see :py:meth:video_curation.repo_manifest.RepoManifest.refresh_files), so that files modified in place since the last scan get re-hashed too.
+        :return: The number of files hashed.
+        """
+        self.manifest.refresh_files(roots=self.roots)
+        paths = self.manifest.get_unhashed_paths(roots=self.roots)
+        if len(paths) == 0:
+            return 0
+        logging.info("Hashing %d files.", len(paths))
+        if len(paths) == 1 or self.num_workers == 1:
+            checksums = [get_file_checksum(path) for path in paths]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                checksums = list(executor.map(get_file_checksum, paths))
+        self.manifest.set_checksums(dict(zip(paths, checksums)))
+        return len(paths)
+
+    def get_checksum(self, path):
+        """The checksum of path, or None if it is not (or no longer) hashed."""
+        return self.manifest.get_checksum(path=path)
+
+    def get_paths_for_checksum(self, checksum):
+        return self.manifest.get_paths_for_checksum(checksum=checksum, roots=self.roots)
+
+    def get_duplicate_groups(self):
+        """Lists of paths of byte-identical files (each list having 2 or more members)."""
+        return self.manifest.get_checksum_duplicate_groups(roots=self.roots)
@@ -0,0 +1,76 @@
+"""Fast startup for Google API clients: the bundled discovery document, and access tokens cached across runs.
+
+The google client libraries take a large share of the startup time of short jobs, so they are imported here on first use only.
+
+Example usage: :py:meth:video_curation.youtube_client.Channel._set_authenticated_service .
+"""
+import datetime
+import json
+import logging
+import os
+
+# Cached access tokens are refreshed this long before they expire.
+EXPIRY_MARGIN = datetime.timedelta(minutes=5)
+
+
+def build_service(api_service_name, api_version, http):
+    """Build an api service from the discovery document bundled with googleapiclient, rather than fetching it (or consulting a discovery cache)."""
+    from googleapiclient.discovery import build
+    return build(serviceName=api_service_name, version=api_version, http=http, static_discovery=True, cache_discovery=False)
+
+
+def load_token_file_credentials(token_file_path):
+    """Credentials from a token file as written by curation_utils' oauth (or by :py:func:save_token_file_credentials), None if there is no such file.
+
+    The access token cached there is reused while it is valid; otherwise the credentials come without a token, and so get refreshed before the first request.
+    """
+    if not os.path.exists(token_file_path):
+        return None
+    from google.oauth2.credentials import Credentials
+    with open(token_file_path) as f:
+        token_data = json.load(f)
+    token = None
+    expiry = None
+    if token_data.get('expiry') is not None:
+        expiry = datetime.datetime.strptime(token_data['expiry'], "%Y-%m-%dT%H:%M:%S")
+        if expiry - EXPIRY_MARGIN > datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None):
+            token = token_data['access_token']
+    return Credentials(token, refresh_token=token_data['refresh_token'], token_uri=token_data['token_uri'], client_id=token_data['client_id'],
+                       client_secret=token_data['client_secret'], expiry=expiry if token is not None else None)
+
+
+def save_token_file_credentials(credentials, token_file_path):
+    """Remember the access token of credentials (and its expiry) in token_file_path, keeping the rest of the file."""
+    with open(token_file_path) as f:
+        token_data = json.load(f)
+    token_data['access_token'] = credentials.token
+    token_data['expiry'] = credentials.expiry.strftime("%Y-%m-%dT%H:%M:%S") if credentials.expiry is not None else None
+    temp_path = token_file_path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(token_data, f)
+    os.replace(temp_path, token_file_path)
+
+
+def get_credentials(service_account_file=None, token_file_path=None, client_secrets_file=None, scopes=None):
+    """Like curation_utils.google.api_helper.get_credentials, but reusing access tokens cached in token_file_path, and refreshing expired ones right away (saving them there) - rather than on a failed first request.
+
+    curation_utils (and with it the interactive oauth machinery) is only imported if there is no usable token file.
+    """
+    credentials = None
+    use_token_file = token_file_path is not None and (service_account_file is None or not os.path.exists(service_account_file))
+    if use_token_file:
+        credentials = load_token_file_credentials(token_file_path)
+    if credentials is None:
+        from curation_utils.google import api_helper
+        credentials = api_helper.get_credentials(service_account_file=service_account_file, token_file_path=token_file_path, client_secrets_file=client_secrets_file, scopes=scopes)
+        if use_token_file and os.path.exists(token_file_path):
+            # Replace the placeholder token curation_utils sets.
+            credentials = load_token_file_credentials(token_file_path)
+    if credentials is not None and not credentials.valid:
+        import google_auth_httplib2
+        from googleapiclient.http import build_http
+        credentials.refresh(google_auth_httplib2.Request(build_http()))
+        logging.info("Refreshed credentials, valid until %s.", credentials.expiry)
+        if use_token_file:
+            save_token_file_credentials(credentials=credentials, token_file_path=token_file_path)
+    return credentials
@@ -0,0 +1,188 @@
+"""A persistent local cache of YouTube API read responses, revalidated with ETags.
+
+Example usage: pass a :py:class:MetadataCache to :py:class:video_curation.youtube_client.Channel .
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+# Collections whose list responses are cached.
+CACHED_COLLECTIONS = ['videos', 'playlists', 'playlistItems', 'channels']
+
+
+def get_collection(uri):
+    """Get the API collection (eg. playlistItems) addressed by some YouTube API uri."""
+    path = urllib.parse.urlparse(uri).path
+    return path.rstrip("/").split("/")[-1]
+
+
+class MetadataCache(object):
+    """An SQLite store of videos, playlists and playlistItems list responses, keyed by request uri, along with their ETags.
+
+    Every cached response also records the (kind, id) of the resources it contains, so that it can be invalidated when any of those resources is modified.
+    """
+    def __init__(self, path, ttl=3600):
+        """
+
+        :param path: The SQLite database file.
+        :param ttl: Seconds for which a cached response is served without revalidation. Beyond that, it is revalidated with a conditional (If-None-Match) request.
+        """
+        self.path = path
+        self.ttl = ttl
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS responses (uri TEXT PRIMARY KEY, collection TEXT, etag TEXT, body TEXT, fetched_at REAL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS response_resources (uri TEXT, kind TEXT, id TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS response_resources_id ON response_resources (id)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS resources (kind TEXT, id TEXT, etag TEXT, body TEXT, PRIMARY KEY (kind, id))")
+
+    def get_response(self, uri):
+        """Return (etag, body, fetched_at) for a cached uri, or None."""
+        with self._lock:
+            row = self._connection.execute("SELECT etag, body, fetched_at FROM responses WHERE uri = ?", (uri,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], row[2]
+
+    def put_response(self, uri, body):
+        """Store the (json string) body of a successful read of uri, along with the resources therein."""
+        response = json.loads(body)
+        items = response.get("items", [])
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (uri, get_collection(uri), response.get("etag"), body, time.time()))
+            self._connection.execute("DELETE FROM response_resources WHERE uri = ?", (uri,))
+            self._connection.executemany("INSERT INTO response_resources VALUES (?, ?, ?)", [(uri, item.get("kind"), item.get("id")) for item in items])
+            self._connection.executemany("INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?)", [(item.get("kind"), item.get("id"), item.get("etag"), json.dumps(item)) for item in items])
+
+    def touch(self, uri):
+        """Mark a cached response as freshly revalidated."""
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE responses SET fetched_at = ? WHERE uri = ?", (time.time(), uri))
+
+    def get_resource(self, kind, id):
+        """Get the last seen version of some resource (eg. kind youtube#video), or None."""
+        with self._lock:
+            row = self._connection.execute("SELECT body FROM resources WHERE kind = ? AND id = ?", (kind, id)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def invalidate(self, collection=None, resource_id=None):
+        """Drop cached responses.
+
+        :param collection: If given, drop responses from this collection (eg. playlistItems). If resource_id is also given, drop only those which contain or mention resource_id.
+        :param resource_id: If given, drop responses which contain this resource, or which mention it in the request uri (eg. a playlistId).
+        :return:
+        """
+        conditions = []
+        parameters = []
+        if resource_id is not None:
+            conditions.append("(uri IN (SELECT uri FROM response_resources WHERE id = ?) OR uri LIKE ?)")
+            parameters.extend([resource_id, "%" + urllib.parse.quote(resource_id, safe="") + "%"])
+        if collection is not None:
+            conditions.append("collection = ?")
+            parameters.append(collection)
+        where = "" if len(conditions) == 0 else " WHERE " + " AND ".join(conditions)
+        with self._lock, self._connection:
+            uris = [row[0] for row in self._connection.execute("SELECT uri FROM responses" + where, parameters)]
+            self._connection.executemany("DELETE FROM responses WHERE uri = ?", [(uri,) for uri in uris])
+            self._connection.executemany("DELETE FROM response_resources WHERE uri = ?", [(uri,) for uri in uris])
+            if resource_id is not None:
+                self._connection.execute("DELETE FROM resources WHERE id = ?", (resource_id,))
+        if len(uris) > 0:
+            logging.debug("Invalidated %d cached responses for %s %s", len(uris), collection, resource_id)
+
+    def clear(self):
+        self.invalidate()
+
+    def wrap(self, http):
+        """Return an http object which serves reads via this cache, and otherwise delegates to http."""
+        return CachingHttp(http=http, cache=self)
+
+
+class CachingHttp(object):
+    """Wraps an http object (eg. an AuthorizedHttp), serving cacheable GET requests from a :py:class:MetadataCache.
+
+    Writes (including batch requests) pass through, and invalidate the cached responses they may affect.
+    """
+    def __init__(self, http, cache):
+        self.http = http
+        self.cache = cache
+
+    def __getattr__(self, name):
+        # Let googleapiclient find credentials, timeout etc. of the wrapped http object.
+        return getattr(self.http, name)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if method != "GET" or get_collection(uri) not in CACHED_COLLECTIONS:
+            resp, content = self.http.request(uri, method=method, body=body, headers=headers, **kwargs)
+            if method != "GET" and resp.status < 400:
+                self._invalidate_for_write(uri=uri, method=method, body=body)
+            return resp, content
+
+        cached = self.cache.get_response(uri)
+        if cached is not None:
+            etag, cached_body, fetched_at = cached
+            if time.time() - fetched_at < self.cache.ttl:
+                return self._get_cached_response(cached_body)
+            if etag is not None:
+                headers = dict(headers or {})
+                headers["If-None-Match"] = etag
+
+        resp, content = self.http.request(uri, method=method, body=body, headers=headers, **kwargs)
+        if resp.status == 304 and cached is not None:
+            self.cache.touch(uri)
+            return self._get_cached_response(cached[1])
+        if resp.status == 200:
+            self.cache.put_response(uri, content.decode("utf-8") if isinstance(content, bytes) else content)
+        return resp, content
+
+    # noinspection PyMethodMayBeStatic
+    def _get_cached_response(self, body):
+        import httplib2
+        resp = httplib2.Response({"status": "200", "content-type": "application/json; charset=UTF-8"})
+        return resp, body.encode("utf-8")
+
+    def _invalidate_for_write(self, uri, method, body):
+        collection = get_collection(uri)
+        if collection == "batch":
+            # Inner requests look like "PUT /youtube/v3/playlistItems?part=snippet HTTP/1.1".
+            body = body.decode("utf-8") if isinstance(body, bytes) else (body or "")
+            for line in body.splitlines():
+                parts = line.split(" ")
+                if len(parts) == 3 and parts[2].startswith("HTTP/"):
+                    self.cache.invalidate(collection=get_collection(parts[1]))
+            return
+        resource_ids = list(urllib.parse.parse_qs(urllib.parse.urlparse(uri).query).get("id", []))
+        try:
+            resource = json.loads(body) if body else {}
+        except (ValueError, TypeError):
+            resource = {}
+        if "id" in resource:
+            resource_ids.append(resource["id"])
+        playlist_id = resource.get("snippet", {}).get("playlistId")
+        if playlist_id is not None:
+            resource_ids.append(playlist_id)
+        if collection == "playlistItems" and playlist_id is None:
+            # Deletes name just the item - but they shift every later page of its playlist's listings, not only the page holding it.
+            for item_id in list(resource_ids):
+                item = self.cache.get_resource(kind="youtube#playlistItem", id=item_id)
+                item_playlist_id = None if item is None else item.get("snippet", {}).get("playlistId")
+                if item_playlist_id is None:
+                    self.cache.invalidate(collection="playlistItems")
+                else:
+                    resource_ids.append(item_playlist_id)
+        if collection == "videos":
+            # Uploads and video edits also change the uploads playlist listing.
+            self.cache.invalidate(collection="playlistItems")
+        if len(resource_ids) == 0:
+            self.cache.invalidate(collection=collection)
+        for resource_id in resource_ids:
+            self.cache.invalidate(resource_id=resource_id)
@@ -0,0 +1,167 @@
+"""Read duration, resolution, codecs, bitrate and creation time of MP4 files by walking their box tree, and flag malformed or truncated files.
+
+Only box headers and the few small boxes needed (moov/mvhd, trak/tkhd, mdia/hdlr, stbl/stsd) are read, via a memory map - a few KB per file, however large it is. Sample tables and media data are skipped.
+
+Example usage: :py:meth:video_curation.video_repo.VideoRepo.update_probe_index .
+"""
+import concurrent.futures
+import logging
+import mmap
+import os
+import struct
+
+# Boxes descended into, on the way to the boxes read.
+CONTAINER_BOXES = [b'moov', b'trak', b'mdia', b'minf', b'stbl']
+# Seconds from 1904-01-01 (the MP4 epoch) to 1970-01-01.
+MP4_EPOCH_OFFSET = 2082844800
+
+
+class Mp4Error(Exception):
+    pass
+
+
+def _iterate_boxes(data, start, end):
+    """Yield (box type, body start, box end) of the boxes in data[start:end].
+
+    :raises Mp4Error: If a box header is malformed, or a box extends beyond end (as in a truncated file).
+    """
+    position = start
+    while position < end:
+        if end - position < 8:
+            raise Mp4Error("Incomplete box header at byte %d" % position)
+        size, box_type = struct.unpack(">I4s", data[position:position + 8])
+        header_size = 8
+        if size == 1:
+            if end - position < 16:
+                raise Mp4Error("Incomplete box header at byte %d" % position)
+            size = struct.unpack(">Q", data[position + 8:position + 16])[0]
+            header_size = 16
+        elif size == 0:
+            # The box extends to the end of its container.
+            size = end - position
+        if size < header_size:
+            raise Mp4Error("Bad size %d of %r box at byte %d" % (size, box_type, position))
+        if position + size > end:
+            raise Mp4Error("%r box at byte %d needs %d bytes, but only %d remain" % (box_type, position, size, end - position))
+        yield box_type, position + header_size, position + size
+        position += size
+
+
+def _read_mvhd(data, start):
+    version = data[start]
+    if version == 1:
+        creation_time, modification_time, timescale, duration = struct.unpack(">QQIQ", data[start + 4:start + 32])
+    else:
+        creation_time, modification_time, timescale, duration = struct.unpack(">IIII", data[start + 4:start + 20])
+    return creation_time, timescale, duration
+
+
+def _read_tkhd_dimensions(data, start, end):
+    # Width and height are the last 8 bytes, as 16.16 fixed point numbers.
+    width, height = struct.unpack(">II", data[end - 8:end])
+    return width >> 16, height >> 16
+
+
+def _read_track(data, start, end, probe):
+    handler_type = None
+    codec = None
+    dimensions = None
+    # (start, end) ranges of boxes still to be walked.
+    pending = [(start, end)]
+    while len(pending) > 0:
+        box_start, box_end = pending.pop()
+        for box_type, body_start, body_end in _iterate_boxes(data, box_start, box_end):
+            if box_type in CONTAINER_BOXES:
+                pending.append((body_start, body_end))
+            elif box_type == b'tkhd':
+                dimensions = _read_tkhd_dimensions(data, body_start, body_end)
+            elif box_type == b'hdlr':
+                handler_type = bytes(data[body_start + 8:body_start + 12])
+            elif box_type == b'stsd':
+                # Version and flags, entry count, then the first sample entry, whose type is the codec.
+                for entry_type, entry_start, entry_end in _iterate_boxes(data, body_start + 8, body_end):
+                    codec = entry_type.decode('latin-1').strip()
+                    break
+    if handler_type == b'vide':
+        probe['video_codec'] = codec
+        probe['width'], probe['height'] = dimensions or (None, None)
+    elif handler_type == b'soun':
+        probe['audio_codec'] = codec
+
+
+def probe_file(path):
+    """Probe the MP4 file at path.
+
+    :return: A dict with duration (seconds), width, height, video_codec, audio_codec, bitrate (bits per second), creation_time (unix time) - each None if not found - and error: None, or why the file is malformed or truncated.
+    """
+    probe = {'duration': None, 'width': None, 'height': None, 'video_codec': None, 'audio_codec': None, 'bitrate': None, 'creation_time': None, 'error': None}
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                raise Mp4Error("Empty file")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                with memoryview(mapped_file) as data:
+                    top_level_types = []
+                    for box_type, body_start, body_end in _iterate_boxes(data, 0, size):
+                        top_level_types.append(box_type)
+                        if box_type == b'moov':
+                            for child_type, child_start, child_end in _iterate_boxes(data, body_start, body_end):
+                                if child_type == b'mvhd':
+                                    creation_time, timescale, duration = _read_mvhd(data, child_start)
+                                    if timescale > 0:
+                                        probe['duration'] = duration / timescale
+                                    if creation_time > 0:
+                                        probe['creation_time'] = creation_time - MP4_EPOCH_OFFSET
+                                elif child_type == b'trak':
+                                    _read_track(data, child_start, child_end, probe)
+        if b'moov' not in top_level_types:
+            raise Mp4Error("No moov box")
+        if b'mdat' not in top_level_types:
+            raise Mp4Error("No mdat box")
+        if probe['duration']:
+            probe['bitrate'] = int(size * 8 / probe['duration'])
+    except (Mp4Error, struct.error, ValueError, OSError) as e:
+        probe['error'] = "%s: %s" % (type(e).__name__, e)
+    return probe
+
+
+class ProbeIndex(object):
+    """Probes of files in a :py:class:video_curation.repo_manifest.RepoManifest, cached there by (path, size, mtime), so that unchanged files are never re-probed."""
+    def __init__(self, manifest, roots, num_workers=None):
+        """
+
+        :param manifest:
+        :param roots: Restrict the index to files under these roots.
+        :param num_workers: Number of probing processes. Defaults to the number of CPUs.
+        """
+        self.manifest = manifest
+        self.roots = roots
+        self.num_workers = num_workers
+
+    def update(self):
+        """Probe every file in the manifest which is new or changed since it was last probed, on a process pool.
+
+        Every file is re-stat-ed first (see :py:meth:video_curation.repo_manifest.RepoManifest.refresh_files), so that files modified in place since the last scan get re-probed too.
+        :return: The number of files probed.
+        """
+        self.manifest.refresh_files(roots=self.roots)
+        paths = self.manifest.get_unprobed_paths(roots=self.roots)
+        if len(paths) == 0:
+            return 0
+        logging.info("Probing %d files.", len(paths))
+        if len(paths) == 1 or self.num_workers == 1:
+            probes = [probe_file(path) for path in paths]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                probes = list(executor.map(probe_file, paths, chunksize=16))
+        self.manifest.set_probes(dict(zip(paths, probes)))
+        return len(paths)
+
+    def get_probe(self, path):
+        """The probe of path (see :py:func:probe_file), or None if it is not (or no longer) probed."""
+        return self.manifest.get_probe(path=path)
+
+    def get_malformed_paths(self):
+        """A dict from the path of every malformed or truncated file to its error."""
+        return dict([(path, probe['error']) for (path, probe) in self.manifest.get_probes(roots=self.roots).items() if probe['error'] is not None])
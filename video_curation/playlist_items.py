@@ -0,0 +1,270 @@
+"""An ordered container of the items of a playlist, with O(log n) inserts, deletes, moves and position lookups, and indexes by video id and item id.
+
+Items are kept in a treap (a binary tree, balanced by random node priorities) ordered by position, in which every node knows the size of its subtree - so the position of an item is found by walking up from its node, and no positions need renumbering after an edit.
+
+Example usage: :py:attr:video_curation.youtube_client.Playlist.items .
+"""
+import random
+
+
+class _Node(object):
+    __slots__ = ('item', 'priority', 'size', 'left', 'right', 'parent')
+
+    def __init__(self, item, priority):
+        self.item = item
+        self.priority = priority
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.parent = None
+
+
+def _get_size(node):
+    return node.size if node is not None else 0
+
+
+def _update_size(node):
+    node.size = _get_size(node.left) + _get_size(node.right) + 1
+
+
+def get_node_index(node):
+    """The position of node within its tree, in O(log n)."""
+    index = _get_size(node.left)
+    while node.parent is not None:
+        if node is node.parent.right:
+            index += _get_size(node.parent.left) + 1
+        node = node.parent
+    return index
+
+
+class PlaylistItems(object):
+    """The :py:class:video_curation.youtube_client.PlaylistItem objects of a playlist, in playlist order.
+
+    Behaves like a list for reading (len, iteration, indexing, index), while insert, remove and move take O(log n), and keep the position of every item (see :py:attr:video_curation.youtube_client.PlaylistItem.position) current.
+    An item can be in one PlaylistItems at a time - that of the playlist it was last added to.
+    """
+    def __init__(self, items=()):
+        self._root = None
+        # Video id to the items of that video, in no particular order.
+        self._video_index = {}
+        # Item id to item.
+        self._item_index = {}
+        self._build(list(items))
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __len__(self):
+        return _get_size(self._root)
+
+    def __iter__(self):
+        stack = []
+        node = self._root
+        while len(stack) > 0 or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.item
+                node = node.right
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return self._get_node(index).item
+
+    def __contains__(self, item):
+        return self._owns(item)
+
+    def _build(self, items):
+        """Build a treap of items (in O(n)), as a cartesian tree of random priorities."""
+        stack = []
+        for item in items:
+            node = _Node(item=item, priority=random.random())
+            self._add_to_indexes(node)
+            last_popped = None
+            while len(stack) > 0 and stack[-1].priority < node.priority:
+                last_popped = stack.pop()
+            node.left = last_popped
+            if last_popped is not None:
+                last_popped.parent = node
+            if len(stack) > 0:
+                stack[-1].right = node
+                node.parent = stack[-1]
+            stack.append(node)
+        self._root = stack[0] if len(stack) > 0 else None
+        # Set sizes bottom up: children come after their parents in a pre-order listing.
+        pre_order = []
+        pending = [self._root] if self._root is not None else []
+        while len(pending) > 0:
+            node = pending.pop()
+            pre_order.append(node)
+            pending.extend([child for child in (node.left, node.right) if child is not None])
+        for node in reversed(pre_order):
+            _update_size(node)
+
+    def _add_to_indexes(self, node):
+        item = node.item
+        item._node = node
+        self._video_index.setdefault(item.video_id, []).append(item)
+        if item.item_id is not None:
+            self._item_index[item.item_id] = item
+
+    def _remove_from_indexes(self, item):
+        item._node = None
+        video_items = self._video_index[item.video_id]
+        video_items.remove(item)
+        if len(video_items) == 0:
+            del self._video_index[item.video_id]
+        if self._item_index.get(item.item_id) is item:
+            del self._item_index[item.item_id]
+
+    def _owns(self, item):
+        node = getattr(item, "_node", None)
+        if node is None:
+            return False
+        while node.parent is not None:
+            node = node.parent
+        return node is self._root
+
+    def _get_node(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("playlist item index out of range")
+        node = self._root
+        while True:
+            left_size = _get_size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node
+            else:
+                index -= left_size + 1
+                node = node.right
+
+    def _rotate_up(self, node):
+        """Rotate node above its parent, keeping the order."""
+        parent = node.parent
+        grandparent = parent.parent
+        if node is parent.left:
+            parent.left = node.right
+            if node.right is not None:
+                node.right.parent = parent
+            node.right = parent
+        else:
+            parent.right = node.left
+            if node.left is not None:
+                node.left.parent = parent
+            node.left = parent
+        parent.parent = node
+        node.parent = grandparent
+        if grandparent is None:
+            self._root = node
+        elif grandparent.left is parent:
+            grandparent.left = node
+        else:
+            grandparent.right = node
+        _update_size(parent)
+        _update_size(node)
+
+    def index(self, item):
+        """The position of item, in O(log n).
+
+        :raises ValueError: If item is not here.
+        """
+        if not self._owns(item):
+            raise ValueError("%s is not in the playlist items" % (item,))
+        return get_node_index(item._node)
+
+    def insert(self, position, item):
+        """Insert item before position (with list.insert semantics for out of range and negative positions)."""
+        if self._owns(item):
+            raise ValueError("%s is in the playlist items already" % (item,))
+        if position < 0:
+            position = max(0, position + len(self))
+        position = min(position, len(self))
+        node = _Node(item=item, priority=random.random())
+        self._add_to_indexes(node)
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            current.size += 1
+            if position <= _get_size(current.left):
+                if current.left is None:
+                    current.left = node
+                    break
+                current = current.left
+            else:
+                position -= _get_size(current.left) + 1
+                if current.right is None:
+                    current.right = node
+                    break
+                current = current.right
+        node.parent = current
+        while node.parent is not None and node.priority > node.parent.priority:
+            self._rotate_up(node)
+
+    def append(self, item):
+        self.insert(len(self), item)
+
+    def remove(self, item):
+        """Remove item, in O(log n).
+
+        :raises ValueError: If item is not here.
+        """
+        if not self._owns(item):
+            raise ValueError("%s is not in the playlist items" % (item,))
+        node = item._node
+        # Rotate node down to a leaf, and cut it off.
+        while node.left is not None or node.right is not None:
+            if node.right is None or (node.left is not None and node.left.priority > node.right.priority):
+                self._rotate_up(node.left)
+            else:
+                self._rotate_up(node.right)
+        parent = node.parent
+        if parent is None:
+            self._root = None
+        elif parent.left is node:
+            parent.left = None
+        else:
+            parent.right = None
+        while parent is not None:
+            parent.size -= 1
+            parent = parent.parent
+        self._remove_from_indexes(item)
+
+    def move(self, item, position):
+        """Move item to position (as counted after its removal)."""
+        self.remove(item)
+        self.insert(position, item)
+
+    def get_items_by_video_id(self, video_id):
+        """The items of video_id, in playlist order."""
+        return sorted(self._video_index.get(video_id, []), key=lambda item: get_node_index(item._node))
+
+    def get_item(self, item_id):
+        """The item with item_id, or None."""
+        return self._item_index.get(item_id)
+
+    def get_position(self, item_id):
+        """The position of the item with item_id, in O(log n).
+
+        :raises KeyError: If there is no such item.
+        """
+        return get_node_index(self._item_index[item_id]._node)
+
+    def get_duplicates(self, key=lambda item: item.video_id):
+        """The items to delete to leave one item per key: all but the first (in playlist order) of every key, in playlist order. One pass, in O(n)."""
+        seen_keys = set()
+        duplicates = []
+        for item in self:
+            item_key = key(item)
+            if item_key in seen_keys:
+                duplicates.append(item)
+            else:
+                seen_keys.add(item_key)
+        return duplicates
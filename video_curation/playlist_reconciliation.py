@@ -0,0 +1,114 @@
+"""Compute minimal edits which turn one playlist order into another.
+
+Example usage: :py:meth:video_curation.youtube_client.Playlist.set_videos .
+"""
+import bisect
+import collections
+
+
+class PlaylistEditPlan(object):
+    """The write calls needed to reconcile a playlist with a target order.
+
+    - deletes: items to be removed. These are applied first.
+    - placements: (position, video_id, item) tuples, to be applied in order after the deletes. item is None for a new insertion, and an existing item to be moved otherwise. position is the index at the time the placement is applied.
+    - video_ids: The target order.
+    - num_appends: How many of the last placements insert the last videos of the target order, after every existing item - ie. could just be appended to the playlist, in order.
+    """
+    def __init__(self, video_ids=()):
+        self.deletes = []
+        self.placements = []
+        self.video_ids = list(video_ids)
+        self.num_appends = 0
+
+    def __repr__(self):
+        return "deletes:%d inserts:%d moves:%d" % (len(self.deletes), len(self.get_inserts()), len(self.get_moves()))
+
+    def __len__(self):
+        """Number of write calls in this plan."""
+        return len(self.deletes) + len(self.placements)
+
+    def get_inserts(self):
+        return [(position, video_id) for (position, video_id, item) in self.placements if item is None]
+
+    def get_moves(self):
+        return [(position, item) for (position, video_id, item) in self.placements if item is not None]
+
+
+def get_longest_increasing_subsequence(values):
+    """Return the indices of a longest strictly increasing subsequence of values, in O(n log n).
+
+    :param values: A list of comparable values.
+    :return: A list of indices into values.
+    """
+    tail_values = []
+    tail_indices = []
+    predecessors = [None] * len(values)
+    for index, value in enumerate(values):
+        length = bisect.bisect_left(tail_values, value)
+        if length > 0:
+            predecessors[index] = tail_indices[length - 1]
+        if length == len(tail_values):
+            tail_values.append(value)
+            tail_indices.append(index)
+        else:
+            tail_values[length] = value
+            tail_indices[length] = index
+    subsequence = []
+    index = tail_indices[-1] if len(tail_indices) > 0 else None
+    while index is not None:
+        subsequence.append(index)
+        index = predecessors[index]
+    subsequence.reverse()
+    return subsequence
+
+
+def plan_playlist_edits(items, video_ids):
+    """Plan the fewest deletes, inserts and moves which turn items into the video_ids order.
+
+    Existing items are matched to target positions in order (so repeated videos are retained as often as they recur in video_ids); unmatched items are deleted. Among matched items, a longest run which is already in target order stays untouched; only the rest are moved.
+
+    :param items: Current :py:class:video_curation.youtube_client.PlaylistItem objects (anything with a video_id attribute), in playlist order.
+    :param video_ids: The target order.
+    :return: A :py:class:PlaylistEditPlan.
+    """
+    plan = PlaylistEditPlan(video_ids=video_ids)
+    available = collections.defaultdict(collections.deque)
+    for index, item in enumerate(items):
+        available[item.video_id].append(index)
+
+    # target_items[i] is the existing item which ends up at position i, or None for a new insertion.
+    target_items = []
+    target_index = {}
+    for position, video_id in enumerate(video_ids):
+        if len(available[video_id]) > 0:
+            item = items[available[video_id].popleft()]
+            target_index[id(item)] = position
+            target_items.append(item)
+        else:
+            target_items.append(None)
+
+    plan.deletes = [item for item in items if id(item) not in target_index]
+    current_order = [item for item in items if id(item) in target_index]
+    current_target_indices = [target_index[id(item)] for item in current_order]
+    stable_positions = set(current_target_indices[index] for index in get_longest_increasing_subsequence(current_target_indices))
+
+    # Simulate the placements, so that every position is valid at the time it is applied.
+    # Every placed entry lands right after its target predecessor, which is always in place by then.
+    order = list(current_order)
+    placed = []
+    for position, item in enumerate(target_items):
+        if position in stable_positions:
+            placed.append(item)
+            continue
+        entry = item
+        if item is None:
+            entry = object()
+        else:
+            order.remove(item)
+        new_position = 0 if position == 0 else order.index(placed[position - 1]) + 1
+        order.insert(new_position, entry)
+        placed.append(entry)
+        plan.placements.append((new_position, video_ids[position], item))
+    while plan.num_appends < len(target_items) and target_items[len(target_items) - 1 - plan.num_appends] is None:
+        plan.num_appends += 1
+    return plan
@@ -0,0 +1,238 @@
+"""A persistent SQLite manifest of video files under some root directories, rescanned incrementally.
+
+Example usage: :py:class:video_curation.video_repo.VideoRepo .
+"""
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+
+def _scan_root(root, known_directory_mtimes, known_subdirectories, recursive, extension):
+    """Walk root, listing (with os.scandir) only directories whose mtime differs from known_directory_mtimes.
+
+    Runs in a worker thread, so it does not touch the database.
+    :return: A list of (directory, mtime, files, subdirectories) tuples, where files (a list of (path, size, mtime)) and subdirectories are None if the directory was unchanged.
+    """
+    results = []
+    pending_directories = [root]
+    while len(pending_directories) > 0:
+        directory = pending_directories.pop()
+        try:
+            mtime = os.stat(directory).st_mtime
+        except FileNotFoundError:
+            logging.warning("Missing directory %s", directory)
+            continue
+        if known_directory_mtimes.get(directory) == mtime:
+            results.append((directory, mtime, None, None))
+            subdirectories = known_subdirectories.get(directory, [])
+        else:
+            files = []
+            subdirectories = []
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        subdirectories.append(entry.path)
+                    elif entry.name.endswith(extension) and entry.is_file():
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_size, stat.st_mtime))
+            results.append((directory, mtime, files, subdirectories))
+        if recursive:
+            pending_directories.extend(subdirectories)
+    return results
+
+
+class RepoManifest(object):
+    """Records (path, size, mtime, title) of every video file, and the mtime of every scanned directory.
+
+    Queries run against the database, so that large repositories need not be loaded into memory. If path is None, the manifest lives in memory only.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        if path is not None and os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, root TEXT, directory TEXT, size INTEGER, mtime REAL, title TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS files_title ON files (title)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS files_directory ON files (directory)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, root TEXT, parent TEXT, mtime REAL)")
+            # Valid only while the file still has the recorded size and mtime.
+            self._connection.execute("CREATE TABLE IF NOT EXISTS checksums (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, checksum TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS checksums_checksum ON checksums (checksum)")
+            # Likewise. probe is a json object - see video_curation.mp4_probe.probe_file .
+            self._connection.execute("CREATE TABLE IF NOT EXISTS probes (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, probe TEXT)")
+
+    def scan(self, roots, title_function, recursive=False, extension=".mp4", num_workers=None):
+        """Bring the manifest up to date with the files under roots, scanning roots in parallel.
+
+        Only directories whose mtime changed are listed. Note that modifying a file in place does not change its directory's mtime - use :py:meth:forget_directories to force a rescan.
+        :param roots:
+        :param title_function: Maps a file path to its title.
+        :param recursive: Whether to descend into subdirectories.
+        :param extension:
+        :param num_workers: Number of roots scanned at once. Defaults to len(roots).
+        :return: The number of directories which were (re)listed.
+        """
+        roots = [os.path.abspath(root) for root in roots]
+        with self._lock:
+            rows = self._connection.execute("SELECT path, parent, mtime FROM directories").fetchall()
+        known_directory_mtimes = dict([(path, mtime) for (path, parent, mtime) in rows])
+        known_subdirectories = {}
+        for path, parent, mtime in rows:
+            known_subdirectories.setdefault(parent, []).append(path)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers or max(len(roots), 1)) as executor:
+            scan_results = list(executor.map(lambda root: _scan_root(root, known_directory_mtimes, known_subdirectories, recursive, extension), roots))
+
+        num_listed_directories = 0
+        with self._lock, self._connection:
+            for root, results in zip(roots, scan_results):
+                for directory, mtime, files, subdirectories in results:
+                    if files is None:
+                        continue
+                    num_listed_directories += 1
+                    self._connection.execute("DELETE FROM files WHERE directory = ?", (directory,))
+                    self._connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                                                 [(path, root, directory, size, file_mtime, title_function(path)) for (path, size, file_mtime) in files])
+                    self._connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)", (directory, root, os.path.dirname(directory), mtime))
+                    if recursive:
+                        for vanished_directory in set(known_subdirectories.get(directory, [])) - set(subdirectories):
+                            self._forget_directory_tree(vanished_directory)
+        logging.info("Listed %d changed directories.", num_listed_directories)
+        return num_listed_directories
+
+    def refresh_files(self, roots):
+        """Re-stat every file under roots: update the size and mtime of files modified in place (which leaves their directory's mtime alone, so that :py:meth:scan misses them), and drop files which vanished.
+
+        Checksums and probes are keyed by (path, size, mtime), so those of changed files are no longer returned.
+        :return: The number of files updated or dropped.
+        """
+        roots = [os.path.abspath(root) for root in roots]
+        rows = self._query("SELECT path, size, mtime FROM files WHERE root IN (%s)" % ",".join("?" * len(roots)), roots)
+        changed_files = []
+        vanished_paths = []
+        for path, size, mtime in rows:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                vanished_paths.append((path,))
+                continue
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                changed_files.append((stat.st_size, stat.st_mtime, path))
+        if len(changed_files) + len(vanished_paths) > 0:
+            logging.info("%d files changed in place, %d vanished.", len(changed_files), len(vanished_paths))
+            with self._lock, self._connection:
+                self._connection.executemany("UPDATE files SET size = ?, mtime = ? WHERE path = ?", changed_files)
+                self._connection.executemany("DELETE FROM files WHERE path = ?", vanished_paths)
+        return len(changed_files) + len(vanished_paths)
+
+    def _forget_directory_tree(self, directory):
+        pattern = directory + os.sep + "%"
+        self._connection.execute("DELETE FROM files WHERE directory = ? OR directory LIKE ?", (directory, pattern))
+        self._connection.execute("DELETE FROM directories WHERE path = ? OR path LIKE ?", (directory, pattern))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def forget_directories(self, directories=None):
+        """Make the next scan relist these directories (all, if None)."""
+        with self._lock, self._connection:
+            if directories is None:
+                self._connection.execute("DELETE FROM directories")
+            else:
+                self._connection.executemany("DELETE FROM directories WHERE path = ?", [(os.path.abspath(directory),) for directory in directories])
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def count_files(self, roots):
+        roots = [os.path.abspath(root) for root in roots]
+        return self._query("SELECT COUNT(*) FROM files WHERE root IN (%s)" % ",".join("?" * len(roots)), roots)[0][0]
+
+    def get_paths(self, roots):
+        """All file paths, sorted within each root, roots in the given order."""
+        paths = []
+        for root in roots:
+            paths.extend([row[0] for row in self._query("SELECT path FROM files WHERE root = ? ORDER BY path", (os.path.abspath(root),))])
+        return paths
+
+    def get_paths_for_title(self, title, roots):
+        roots = [os.path.abspath(root) for root in roots]
+        return [row[0] for row in self._query("SELECT path FROM files WHERE title = ? AND root IN (%s) ORDER BY path" % ",".join("?" * len(roots)), [title] + roots)]
+
+    def get_titles_and_paths(self, roots, title_substring=None):
+        """(title, path) pairs, optionally only those whose title contains title_substring."""
+        roots = [os.path.abspath(root) for root in roots]
+        sql = "SELECT title, path FROM files WHERE root IN (%s)" % ",".join("?" * len(roots))
+        parameters = list(roots)
+        if title_substring is not None:
+            sql += " AND instr(title, ?) > 0"
+            parameters.append(title_substring)
+        return self._query(sql + " ORDER BY path", parameters)
+
+    def get_file_info(self, path):
+        """(size, mtime, title) of some file, or None."""
+        rows = self._query("SELECT size, mtime, title FROM files WHERE path = ?", (os.path.abspath(path),))
+        return rows[0] if len(rows) > 0 else None
+
+    def get_title_collisions(self, roots):
+        """A dict from every title shared by multiple files to those files' paths."""
+        roots = [os.path.abspath(root) for root in roots]
+        placeholders = ",".join("?" * len(roots))
+        rows = self._query("SELECT title, path FROM files WHERE root IN (%s) AND title IN (SELECT title FROM files WHERE root IN (%s) GROUP BY title HAVING COUNT(*) > 1) ORDER BY title, path" % (placeholders, placeholders), roots + roots)
+        collisions = {}
+        for title, path in rows:
+            collisions.setdefault(title, []).append(path)
+        return collisions
+
+    def get_unhashed_paths(self, roots):
+        """Paths of files without a checksum for their current (size, mtime)."""
+        roots = [os.path.abspath(root) for root in roots]
+        return [row[0] for row in self._query("SELECT files.path FROM files LEFT JOIN checksums ON files.path = checksums.path AND files.size = checksums.size AND files.mtime = checksums.mtime WHERE checksums.path IS NULL AND files.root IN (%s) ORDER BY files.path" % ",".join("?" * len(roots)), roots)]
+
+    def set_checksums(self, path_to_checksum):
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO checksums SELECT path, size, mtime, ? FROM files WHERE path = ?",
+                                         [(checksum, path) for (path, checksum) in path_to_checksum.items()])
+
+    def get_checksum(self, path):
+        rows = self._query("SELECT checksums.checksum FROM files JOIN checksums ON files.path = checksums.path AND files.size = checksums.size AND files.mtime = checksums.mtime WHERE files.path = ?", (os.path.abspath(path),))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def get_paths_for_checksum(self, checksum, roots):
+        roots = [os.path.abspath(root) for root in roots]
+        return [row[0] for row in self._query("SELECT files.path FROM files JOIN checksums ON files.path = checksums.path AND files.size = checksums.size AND files.mtime = checksums.mtime WHERE checksums.checksum = ? AND files.root IN (%s) ORDER BY files.path" % ",".join("?" * len(roots)), [checksum] + roots)]
+
+    def get_checksum_duplicate_groups(self, roots):
+        """Lists of paths of files sharing a checksum."""
+        roots = [os.path.abspath(root) for root in roots]
+        rows = self._query("SELECT checksums.checksum, files.path FROM files JOIN checksums ON files.path = checksums.path AND files.size = checksums.size AND files.mtime = checksums.mtime WHERE files.root IN (%s) ORDER BY checksums.checksum, files.path" % ",".join("?" * len(roots)), roots)
+        groups = {}
+        for checksum, path in rows:
+            groups.setdefault(checksum, []).append(path)
+        return [paths for paths in groups.values() if len(paths) > 1]
+
+    def get_unprobed_paths(self, roots):
+        """Paths of files without a probe for their current (size, mtime)."""
+        roots = [os.path.abspath(root) for root in roots]
+        return [row[0] for row in self._query("SELECT files.path FROM files LEFT JOIN probes ON files.path = probes.path AND files.size = probes.size AND files.mtime = probes.mtime WHERE probes.path IS NULL AND files.root IN (%s) ORDER BY files.path" % ",".join("?" * len(roots)), roots)]
+
+    def set_probes(self, path_to_probe):
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO probes SELECT path, size, mtime, ? FROM files WHERE path = ?",
+                                         [(json.dumps(probe), path) for (path, probe) in path_to_probe.items()])
+
+    def get_probe(self, path):
+        rows = self._query("SELECT probes.probe FROM files JOIN probes ON files.path = probes.path AND files.size = probes.size AND files.mtime = probes.mtime WHERE files.path = ?", (os.path.abspath(path),))
+        return json.loads(rows[0][0]) if len(rows) > 0 else None
+
+    def get_probes(self, roots):
+        """A dict from path to probe, for all probed files."""
+        roots = [os.path.abspath(root) for root in roots]
+        rows = self._query("SELECT files.path, probes.probe FROM files JOIN probes ON files.path = probes.path AND files.size = probes.size AND files.mtime = probes.mtime WHERE files.root IN (%s) ORDER BY files.path" % ",".join("?" * len(roots)), roots)
+        return dict([(path, json.loads(probe)) for (path, probe) in rows])
@@ -0,0 +1,392 @@
+"""Send YouTube API requests within the daily quota: retry transient failures with jittered exponential backoff, stop calling an API which keeps failing for a while (a circuit breaker), and once quota runs low, defer less valuable writes to the next quota window.
+
+Every request of a :py:class:video_curation.youtube_client.Channel passes through an http object made by :py:meth:RequestScheduler.wrap (retries, circuit breaker, quota accounting), while model objects execute their writes with a priority via :py:func:video_curation.youtube_client.execute_request (deferral).
+
+Example usage: curation_projects.rgveda .
+"""
+import atexit
+import datetime
+import http.client
+import json
+import logging
+import os
+import random
+import threading
+import time
+import zoneinfo
+
+from video_curation.api_stats import RETRIABLE_STATUSES, get_api_method, get_batch_api_methods, get_quota_cost
+
+# Uploads, new playlists and new playlist entries - which later work builds on. Never deferred.
+PRIORITY_HIGH = 0
+# Metadata updates and deletions. Deferred once the quota is used up.
+PRIORITY_NORMAL = 1
+# Re-sorts and privacy flips. Deferred once the quota falls to the low_priority_reserve.
+PRIORITY_LOW = 2
+
+# The default daily quota of a YouTube API project.
+DEFAULT_DAILY_QUOTA = 10000
+# YouTube quotas are reset at midnight Pacific time.
+QUOTA_TIMEZONE = "America/Los_Angeles"
+# Reasons (in 403 error responses) for which requests are retried, as for RETRIABLE_STATUSES.
+RATE_LIMIT_REASONS = ["rateLimitExceeded", "userRateLimitExceeded"]
+# Reasons (in 403 error responses) meaning that the daily quota is used up.
+QUOTA_EXCEEDED_REASONS = ["quotaExceeded", "dailyLimitExceeded"]
+# Quota accounting is saved to the state file at most this often (deferrals right away).
+SAVE_INTERVAL_SECONDS = 10
+
+
+class QuotaExhaustedError(Exception):
+    """Raised for requests which can not be sent (nor deferred) since the quota of the current window is used up."""
+
+
+class CircuitOpenError(Exception):
+    """Raised for requests not sent since too many consecutive requests failed just before."""
+
+
+def get_quota_window(timestamp=None):
+    """The quota window (ie. the day, in Pacific time) of timestamp (now by default), eg. "2024-05-01"."""
+    return datetime.datetime.fromtimestamp(time.time() if timestamp is None else timestamp, tz=zoneinfo.ZoneInfo(QUOTA_TIMEZONE)).date().isoformat()
+
+
+def get_backoff_seconds(attempt, base_seconds=1, max_seconds=64):
+    """Seconds to wait before retry number attempt (0 for the first): random, up to base_seconds * 2 ** attempt (but no more than max_seconds) - so that clients failing together do not retry together."""
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
+
+
+def _get_request_cost(uri, method, body):
+    api_method = get_api_method(uri=uri, method=method)
+    if api_method == "batch":
+        return sum(get_quota_cost(inner_api_method) for inner_api_method in get_batch_api_methods(body))
+    return get_quota_cost(api_method)
+
+
+def _get_deferred_key(request_dict):
+    return request_dict['method'], request_dict['uri'], request_dict['body']
+
+
+def _is_positional(request_dict):
+    """Whether a request places playlist items by position - a move, a delete (which shifts the later items) or a positioned insert. Such positions only hold against the playlist as it was, so these requests are not deferred."""
+    api_method = get_api_method(uri=request_dict['uri'], method=request_dict['method'])
+    if api_method in ["playlistItems.update", "playlistItems.delete"]:
+        return True
+    return api_method == "playlistItems.insert" and '"position"' in (request_dict['body'] or "")
+
+
+def _has_reason(content, reasons):
+    # A plain search, which also finds the reasons of failed requests within a batch response.
+    return content is not None and any(('"%s"' % reason).encode("utf-8") in content for reason in reasons)
+
+
+class CircuitBreaker(object):
+    """Opens after failure_threshold consecutive failures, failing requests right away for cooldown_seconds - after which one request is let through to probe the API (and closes the circuit if it succeeds). Thread-safe."""
+    def __init__(self, failure_threshold=5, cooldown_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() < self.opened_at + self.cooldown_seconds:
+                return False
+            # Half open: let this request probe the API, and keep the others out until it is done.
+            self.opened_at = time.time()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logging.warning("%d consecutive requests failed. Pausing requests for %d seconds.", self.consecutive_failures, self.cooldown_seconds)
+                self.opened_at = time.time()
+
+
+class RequestScheduler(object):
+    """Quota accounting, retries and deferral for all requests of a channel. Thread-safe.
+
+    Quota spent in the current window (as estimated per method by :py:func:video_curation.api_stats.get_quota_cost, and as reported by quotaExceeded errors) and deferred requests are kept in a json file at state_path (if given) - so they carry over to later runs, and deferred requests get sent by :py:meth:run_deferred in a later window.
+    Positional playlist edits are not deferred (they would be replayed against a playlist which has changed since); instead, the playlist is marked stale with its target order (see :py:meth:mark_playlist_stale), to be planned afresh in a later window.
+    """
+    def __init__(self, daily_quota=None, low_priority_reserve=1000, state_path=None, max_retries=5, backoff_seconds=1, max_backoff_seconds=64, circuit_breaker=None, max_deferred_failures=3):
+        """
+
+        :param daily_quota: Quota units per window, eg. DEFAULT_DAILY_QUOTA. If None, requests are only deferred (or refused) once YouTube reports that the quota is exceeded.
+        :param low_priority_reserve: PRIORITY_LOW requests are deferred once they would leave less quota than this.
+        :param state_path:
+        :param max_retries: Per request.
+        :param backoff_seconds: See :py:func:get_backoff_seconds .
+        :param max_backoff_seconds:
+        :param circuit_breaker: A :py:class:CircuitBreaker. A new one by default.
+        :param max_deferred_failures: A deferred request which fails (other than for lack of quota) stays deferred, until it has failed in this many runs of :py:meth:run_deferred .
+        """
+        self.daily_quota = daily_quota
+        self.low_priority_reserve = low_priority_reserve
+        self.state_path = state_path
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.max_deferred_failures = max_deferred_failures
+        self.window = get_quota_window()
+        self.quota_spent = 0
+        # Whether YouTube reported the quota of this window exceeded.
+        self.quota_exceeded = False
+        # Dicts with priority, description, request (as from HttpRequest.to_json) and (once sending it failed) failures, in the order deferred.
+        self.deferred = []
+        # Playlist id to the video ids it should hold, in order - for playlists whose edits were not all sent.
+        self.stale_playlists = {}
+        self._last_save_time = 0
+        self._lock = threading.RLock()
+        if state_path is not None and os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            self.deferred = [entry for entry in state.get('deferred', []) if not _is_positional(json.loads(entry['request']))]
+            self.stale_playlists = state.get('stale_playlists', {})
+            if state.get('window') == self.window:
+                self.quota_spent = state.get('quota_spent', 0)
+                self.quota_exceeded = state.get('quota_exceeded', False)
+        # (method, uri, body) of the deferred requests.
+        self._deferred_keys = set([_get_deferred_key(json.loads(entry['request'])) for entry in self.deferred])
+
+    def __repr__(self):
+        return "window:%s quota_spent:%d remaining:%s deferred:%d stale_playlists:%d" % (self.window, self.quota_spent, self.get_remaining_quota(), len(self.deferred), len(self.stale_playlists))
+
+    def wrap(self, http):
+        """Return an http object which sends requests via http under this scheduler's retries, circuit breaker and quota accounting."""
+        return ScheduledHttp(http=http, scheduler=self)
+
+    def _roll_window(self):
+        window = get_quota_window()
+        if window != self.window:
+            logging.info("A new quota window %s has begun, after %d units spent in %s.", window, self.quota_spent, self.window)
+            self.window = window
+            self.quota_spent = 0
+            self.quota_exceeded = False
+
+    def get_remaining_quota(self):
+        """Estimated quota units left in the current window - None if not known (no daily_quota, and not yet exceeded)."""
+        with self._lock:
+            self._roll_window()
+            if self.quota_exceeded:
+                return 0
+            if self.daily_quota is None:
+                return None
+            return max(0, self.daily_quota - self.quota_spent)
+
+    def record_cost(self, quota_units):
+        with self._lock:
+            self._roll_window()
+            self.quota_spent += quota_units
+            if time.time() - self._last_save_time > SAVE_INTERVAL_SECONDS:
+                self.save_state()
+
+    def record_quota_exceeded(self):
+        with self._lock:
+            self._roll_window()
+            if not self.quota_exceeded:
+                logging.warning("YouTube reports the quota exceeded, after an estimated %d units spent in %s.", self.quota_spent, self.window)
+            self.quota_exceeded = True
+            self.save_state()
+
+    def check_request(self):
+        """Raise if no request should be sent now.
+
+        :raises CircuitOpenError:
+        :raises QuotaExhaustedError: If YouTube reported the quota of the current window exceeded.
+        """
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("Not sending requests for now, after %d consecutive failures." % self.circuit_breaker.consecutive_failures)
+        with self._lock:
+            self._roll_window()
+            quota_exceeded = self.quota_exceeded
+        if quota_exceeded:
+            raise QuotaExhaustedError("The quota of %s is exceeded." % self.window)
+
+    def _can_afford(self, quota_units, priority, remaining):
+        if remaining is None:
+            return True
+        reserve = self.low_priority_reserve if priority >= PRIORITY_LOW else 0
+        return remaining - quota_units >= reserve
+
+    def admit(self, requests):
+        """Decide which of requests to send now, deferring the others (see :py:meth:defer). The quota goes to higher priority requests first.
+
+        :param requests: A list of (request, priority) pairs, in the order they are to be sent. request is an HttpRequest, as from api_service.
+        :return: A list of booleans - whether each request may be sent now.
+        :raises QuotaExhaustedError: If a PRIORITY_HIGH request can not be afforded. No request is deferred then.
+        """
+        with self._lock:
+            remaining = self.get_remaining_quota()
+            admitted = [False] * len(requests)
+            for index in sorted(range(len(requests)), key=lambda index: requests[index][1]):
+                request, priority = requests[index]
+                quota_units = _get_request_cost(uri=request.uri, method=request.method, body=request.body)
+                if self._can_afford(quota_units=quota_units, priority=priority, remaining=remaining):
+                    admitted[index] = True
+                    if remaining is not None:
+                        remaining -= quota_units
+                elif priority <= PRIORITY_HIGH:
+                    raise QuotaExhaustedError("%s %s needs %d quota units, but only %d remain in %s." % (request.method, request.uri, quota_units, remaining, self.window))
+            for (request, priority), is_admitted in zip(requests, admitted):
+                if not is_admitted:
+                    self._defer(request=request, priority=priority)
+            if not all(admitted):
+                self.save_state()
+            return admitted
+
+    def execute(self, request, priority=PRIORITY_NORMAL):
+        """Execute request now, or defer it if the quota left does not allow for its priority.
+
+        :return: The response, or None if deferred.
+        """
+        if not self.admit([(request, priority)])[0]:
+            return None
+        return request.execute()
+
+    def defer(self, request, priority=PRIORITY_NORMAL):
+        """Remember request to send in a later quota window - unless an identical request is deferred already, or it is positional (see :py:meth:mark_playlist_stale)."""
+        with self._lock:
+            self._defer(request=request, priority=priority)
+            self.save_state()
+
+    def _defer(self, request, priority):
+        request_key = _get_deferred_key(request.__dict__)
+        if request_key in self._deferred_keys:
+            return
+        api_method = get_api_method(uri=request.uri, method=request.method)
+        if _is_positional(request.__dict__):
+            logging.info("Dropping positional %s (priority %d) rather than deferring it: %s", api_method, priority, request.body)
+            return
+        logging.info("Deferring %s (priority %d) to the next quota window: %s", api_method, priority, request.body)
+        self.deferred.append({'priority': priority, 'description': api_method, 'request': request.to_json()})
+        self._deferred_keys.add(request_key)
+
+    def mark_playlist_stale(self, playlist_id, video_ids):
+        """Remember that playlist_id should hold video_ids, in order - for when some of its positional edits could not be sent now. See :py:meth:pop_stale_playlists ."""
+        with self._lock:
+            logging.info("Marking playlist %s stale, to be re-planned in a later window.", playlist_id)
+            self.stale_playlists[playlist_id] = list(video_ids)
+            self.save_state()
+
+    def pop_stale_playlists(self):
+        """Forget and return the stale playlists (as a dict from playlist id to video ids), for the caller to re-plan - which marks them stale again if need be."""
+        with self._lock:
+            stale_playlists, self.stale_playlists = self.stale_playlists, {}
+            self.save_state()
+            return stale_playlists
+
+    def run_deferred(self, http):
+        """Send deferred requests - by priority, then oldest first - while the quota allows.
+
+        Call this at the start of a run, before new work (which might otherwise be undone by older deferred requests).
+        :param http: The http object to send them with, eg. :py:attr:video_curation.youtube_client.Channel.http_pool .
+        :return: The number of requests sent. Those which failed are logged, and kept for a later run - up to max_deferred_failures times.
+        """
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import HttpRequest
+        from googleapiclient.model import JsonModel
+        with self._lock:
+            entries = sorted(self.deferred, key=lambda entry: entry['priority'])
+        num_sent = 0
+        for entry in entries:
+            request = HttpRequest.from_json(entry['request'], http, JsonModel().response)
+            request_key = _get_deferred_key(request.__dict__)
+            with self._lock:
+                if not self._can_afford(quota_units=_get_request_cost(uri=request.uri, method=request.method, body=request.body), priority=entry['priority'], remaining=self.get_remaining_quota()):
+                    break
+                self.deferred.remove(entry)
+                self._deferred_keys.discard(request_key)
+            try:
+                request.execute()
+            except (QuotaExhaustedError, CircuitOpenError, HttpError) as e:
+                if isinstance(e, HttpError) and not _has_reason(e.content, QUOTA_EXCEEDED_REASONS):
+                    entry['failures'] = entry.get('failures', 0) + 1
+                    if entry['failures'] >= self.max_deferred_failures:
+                        logging.error("Deferred %s failed %d times, dropping it: %s", entry['description'], entry['failures'], e)
+                    else:
+                        logging.warning("Deferred %s failed, keeping it for a later run: %s", entry['description'], e)
+                        with self._lock:
+                            self.deferred.append(entry)
+                            self._deferred_keys.add(request_key)
+                    continue
+                logging.warning("Not sending deferred requests for now: %s", e)
+                with self._lock:
+                    self.deferred.insert(0, entry)
+                    self._deferred_keys.add(request_key)
+                break
+            num_sent += 1
+        logging.info("Sent %d deferred requests; %d remain.", num_sent, len(self.deferred))
+        self.save_state()
+        return num_sent
+
+    def save_state(self):
+        """Write quota accounting, deferred requests and stale playlists to self.state_path, if any."""
+        if self.state_path is None:
+            return
+        with self._lock:
+            state = {'window': self.window, 'quota_spent': self.quota_spent, 'quota_exceeded': self.quota_exceeded, 'deferred': self.deferred, 'stale_playlists': self.stale_playlists}
+            temp_path = self.state_path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(state, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.state_path)
+            self._last_save_time = time.time()
+
+    def save_state_at_exit(self):
+        atexit.register(self.save_state)
+
+
+class ScheduledHttp(object):
+    """Wraps an http object, sending every request under a :py:class:RequestScheduler .
+
+    Requests failing with RETRIABLE_STATUSES, a rate limit error or a connection error are retried (with backoff) up to max_retries times, after which the last response is returned (or the error raised) as usual. Upload chunks are not retried here, since :py:func:video_curation.youtube_client._resumable_upload first asks the server which bytes it got.
+    """
+    def __init__(self, http, scheduler):
+        self.http = http
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        # Let googleapiclient find credentials, timeout etc. of the wrapped http object.
+        return getattr(self.http, name)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        import httplib2
+        retriable_exceptions = (httplib2.HttpLib2Error, http.client.HTTPException, OSError)
+        api_method = get_api_method(uri=uri, method=method)
+        max_retries = 0 if api_method.endswith(":upload") or hasattr(body, "read") else self.scheduler.max_retries
+        attempt = 0
+        while True:
+            self.scheduler.check_request()
+            try:
+                resp, content = self.http.request(uri, method=method, body=body, headers=headers, **kwargs)
+            except retriable_exceptions as e:
+                self.scheduler.circuit_breaker.record_failure()
+                if attempt >= max_retries:
+                    raise
+                error = e
+            else:
+                is_rate_limited = resp.status == 403 and _has_reason(content, RATE_LIMIT_REASONS)
+                if resp.status in RETRIABLE_STATUSES or is_rate_limited:
+                    self.scheduler.circuit_breaker.record_failure()
+                else:
+                    self.scheduler.circuit_breaker.record_success()
+                    # YouTube charges for invalid requests too.
+                    self.scheduler.record_cost(_get_request_cost(uri=uri, method=method, body=body))
+                    if (resp.status == 403 or api_method == "batch") and _has_reason(content, QUOTA_EXCEEDED_REASONS):
+                        self.scheduler.record_quota_exceeded()
+                if attempt >= max_retries or not (resp.status in RETRIABLE_STATUSES or is_rate_limited):
+                    return resp, content
+                error = "%d" % resp.status
+            sleep_seconds = get_backoff_seconds(attempt, base_seconds=self.scheduler.backoff_seconds, max_seconds=self.scheduler.max_backoff_seconds)
+            logging.warning("%s failed (%s), retrying in %.1f seconds.", api_method, error, sleep_seconds)
+            time.sleep(sleep_seconds)
+            attempt += 1
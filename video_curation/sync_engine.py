@@ -0,0 +1,246 @@
+"""Bring a channel to a declared end state: which local files become which videos with what metadata, in which playlists and order.
+
+A project describes a :py:class:DesiredState. :py:meth:SyncEngine.plan reads the channel once and computes a :py:class:SyncPlan of uploads, metadata updates and playlist edits; :py:meth:SyncEngine.apply executes it - uploads first (concurrently), since playlists may refer to the uploaded videos, then batched metadata updates, then playlist creations and edits. Nothing is ever deleted except playlist items.
+
+Example usage: :py:meth:curation_projects.rgveda.RgvedaRepo.get_desired_state .
+"""
+import logging
+
+from video_curation import playlist_reconciliation, upload_pool, youtube_client
+
+# Index names under which the engine keys videos and playlists of the channel.
+VIDEO_KEY_INDEX = "sync_engine_video_key"
+PLAYLIST_KEY_INDEX = "sync_engine_playlist_key"
+
+
+class DesiredVideo(object):
+    """A video as it should be. Metadata attributes which are None are left as they are."""
+    def __init__(self, key, title, description=None, tags=None, category_id=None, privacy=None, filepath=None):
+        """
+
+        :param key: Identifies the video, as the engine's video_key_function does for videos at YouTube.
+        :param title:
+        :param description:
+        :param tags:
+        :param category_id:
+        :param privacy:
+        :param filepath: The local file to upload if there is no such video yet.
+        """
+        self.key = key
+        self.title = title
+        self.description = description
+        self.tags = tags
+        self.category_id = category_id
+        self.privacy = privacy
+        self.filepath = filepath
+
+    def __repr__(self):
+        return "key:%s title:%s" % (self.key, self.title)
+
+    def get_metadata(self):
+        """A dict of the :py:class:video_curation.youtube_client.YtVideo attributes to set."""
+        metadata = {'title': self.title, 'description': self.description, 'tags': self.tags, 'category_id': self.category_id, 'privacy': self.privacy}
+        return dict([(attribute, value) for (attribute, value) in metadata.items() if value is not None])
+
+
+class DesiredPlaylist(object):
+    """A playlist as it should be: its metadata and the keys of its videos, in order."""
+    def __init__(self, key, title, video_keys, description="", tags=None, privacy='public'):
+        self.key = key
+        self.title = title
+        self.video_keys = video_keys
+        self.description = description
+        self.tags = tags or []
+        self.privacy = privacy
+
+    def __repr__(self):
+        return "key:%s title:%s" % (self.key, self.title)
+
+
+class DesiredState(object):
+    def __init__(self, videos=(), playlists=()):
+        self.videos = list(videos)
+        self.playlists = list(playlists)
+
+
+class SyncPlan(object):
+    """The write calls needed to reach a :py:class:DesiredState.
+
+    - uploads: :py:class:DesiredVideo objects without a video at YouTube.
+    - metadata_updates: (YtVideo, metadata dict, changed parts) tuples.
+    - playlist_creations: :py:class:DesiredPlaylist objects without a playlist at YouTube.
+    - playlist_updates: (Playlist, DesiredPlaylist) pairs whose metadata differ.
+    - playlist_edits: (DesiredPlaylist, PlaylistEditPlan) pairs. Videos yet to be uploaded appear as "pending:<key>" ids.
+    - missing: keys of videos which are in some desired playlist, but neither at YouTube nor uploadable.
+    """
+    def __init__(self):
+        self.uploads = []
+        self.metadata_updates = []
+        self.playlist_creations = []
+        self.playlist_updates = []
+        self.playlist_edits = []
+        self.missing = []
+
+    def __len__(self):
+        return sum(self.get_call_counts().values())
+
+    def get_call_counts(self):
+        """The number of write calls by API method. Each upload is counted once, though large files take several chunk requests."""
+        counts = {'videos.insert': len(self.uploads),
+                  'videos.update': len(self.metadata_updates),
+                  'playlists.insert': len(self.playlist_creations),
+                  'playlists.update': len(self.playlist_updates),
+                  'playlistItems.delete': sum(len(edit_plan.deletes) for (_, edit_plan) in self.playlist_edits),
+                  'playlistItems.insert': sum(len(edit_plan.get_inserts()) for (_, edit_plan) in self.playlist_edits),
+                  'playlistItems.update': sum(len(edit_plan.get_moves()) for (_, edit_plan) in self.playlist_edits)}
+        return dict([(method, count) for (method, count) in counts.items() if count > 0])
+
+    def describe(self):
+        """A human readable account of this plan."""
+        lines = ["Plan with %d write calls: %s" % (len(self), self.get_call_counts())]
+        lines.extend(["Upload %s from %s" % (video, video.filepath) for video in self.uploads])
+        lines.extend(["Update %s of %s: %s" % (parts, video, metadata) for (video, metadata, parts) in self.metadata_updates])
+        lines.extend(["Create playlist %s" % playlist for playlist in self.playlist_creations])
+        lines.extend(["Update playlist %s to %s" % (playlist, desired_playlist) for (playlist, desired_playlist) in self.playlist_updates])
+        lines.extend(["Edit playlist %s: %s" % (desired_playlist, edit_plan) for (desired_playlist, edit_plan) in self.playlist_edits])
+        if len(self.missing) > 0:
+            lines.append("Missing videos: %s" % self.missing)
+        return "\n".join(lines)
+
+
+def _get_changed_parts(video, metadata):
+    """The parts of video which setting metadata would change at YouTube, without touching video."""
+    desired_video = youtube_client.YtVideo(id=video.id, title=video.title, description=video.description, tags=video.tags, category_id=video.category_id,
+                                           privacy=video.privacy, upload_status=video.upload_status)
+    for attribute, value in metadata.items():
+        setattr(desired_video, attribute, value)
+    desired_video.remote_metadata = video.remote_metadata
+    return desired_video.get_changed_parts()
+
+
+class SyncEngine(object):
+    def __init__(self, channel, video_key_function, playlist_key_function, batch_size=youtube_client.DEFAULT_BATCH_SIZE, num_workers=4,
+                 session_store=None, bandwidth_limiter=None, prefetch_concurrency=8):
+        """
+
+        :param channel: A :py:class:video_curation.youtube_client.Channel .
+        :param video_key_function: Maps a YtVideo to its key (see :py:attr:DesiredVideo.key), or None.
+        :param playlist_key_function: Maps a Playlist to its key (see :py:attr:DesiredPlaylist.key), or None.
+        :param batch_size: For metadata updates and playlist edits.
+        :param num_workers: Concurrent uploads.
+        :param session_store: See :py:class:video_curation.upload_pool.UploadPool .
+        :param bandwidth_limiter: See :py:class:video_curation.upload_pool.UploadPool .
+        :param prefetch_concurrency: Concurrent playlist item listings while planning.
+        """
+        self.channel = channel
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.session_store = session_store
+        self.bandwidth_limiter = bandwidth_limiter
+        self.prefetch_concurrency = prefetch_concurrency
+        self.channel.add_index_key(name=VIDEO_KEY_INDEX, key_function=video_key_function)
+        self.channel.add_index_key(name=PLAYLIST_KEY_INDEX, key_function=playlist_key_function)
+
+    def read(self):
+        """The one read pass: uploaded videos (incrementally) and playlists."""
+        self.channel.set_uploaded_videos(incremental=True)
+        self.channel.set_playlists()
+
+    def _get_video(self, key):
+        videos = self.channel.video_index.get(VIDEO_KEY_INDEX, key)
+        return videos[0] if len(videos) > 0 else None
+
+    def _get_playlist(self, key):
+        playlists = self.channel.playlist_index.get(PLAYLIST_KEY_INDEX, key)
+        return playlists[0] if len(playlists) > 0 else None
+
+    def plan(self, desired_state):
+        """Compute a :py:class:SyncPlan against the channel as last read (see :py:meth:read). Lists the items of the desired playlists which exist, concurrently.
+
+        Videos whose upload failed or was rejected are not indexed by the channel, so their desired videos are uploaded afresh.
+        """
+        plan = SyncPlan()
+        uploadable_keys = set()
+        for desired_video in desired_state.videos:
+            video = self._get_video(desired_video.key)
+            if video is None:
+                if desired_video.filepath is not None:
+                    plan.uploads.append(desired_video)
+                    uploadable_keys.add(desired_video.key)
+                continue
+            metadata = desired_video.get_metadata()
+            parts = _get_changed_parts(video=video, metadata=metadata)
+            if len(parts) > 0:
+                plan.metadata_updates.append((video, metadata, parts))
+
+        playlists = [self._get_playlist(desired_playlist.key) for desired_playlist in desired_state.playlists]
+        self.channel.prefetch(playlists=[playlist for playlist in playlists if playlist is not None], concurrency=self.prefetch_concurrency)
+        missing_keys = set()
+        for desired_playlist, playlist in zip(desired_state.playlists, playlists):
+            if playlist is None:
+                plan.playlist_creations.append(desired_playlist)
+            elif (playlist.title, playlist.description or "", list(playlist.tags or [])) != (desired_playlist.title, desired_playlist.description or "", list(desired_playlist.tags)):
+                plan.playlist_updates.append((playlist, desired_playlist))
+            video_ids = []
+            for key in desired_playlist.video_keys:
+                video = self._get_video(key)
+                if video is not None:
+                    video_ids.append(video.id)
+                elif key in uploadable_keys:
+                    video_ids.append("pending:%s" % key)
+                else:
+                    missing_keys.add(key)
+            edit_plan = playlist_reconciliation.plan_playlist_edits(items=[] if playlist is None else playlist.items, video_ids=video_ids)
+            if len(edit_plan) > 0:
+                plan.playlist_edits.append((desired_playlist, edit_plan))
+        plan.missing = sorted(missing_keys)
+        return plan
+
+    def apply(self, plan):
+        """Execute plan: uploads, then metadata updates, then playlist creations, updates and edits.
+
+        :return: The :py:class:video_curation.upload_pool.UploadJob objects of the uploads. Playlists skip videos whose upload failed.
+        """
+        jobs = [upload_pool.UploadJob(video=youtube_client.YtVideo(title=desired_video.title, description=desired_video.description, tags=desired_video.tags,
+                                                                   category_id=desired_video.category_id or 1, privacy=desired_video.privacy or 'public',
+                                                                   api_service=self.channel.api_service),
+                                      filepath=desired_video.filepath)
+                for desired_video in plan.uploads]
+        if len(jobs) > 0:
+            upload_pool.UploadPool(http_factory=self.channel.new_http, num_workers=self.num_workers, session_store=self.session_store,
+                                   bandwidth_limiter=self.bandwidth_limiter).upload(jobs=jobs)
+            for job in jobs:
+                if job.status == 'done':
+                    self.channel.index_video(job.video)
+
+        if len(plan.metadata_updates) > 0:
+            self.channel.set_video_metadatas(video_metadatas=dict([(video.id, metadata) for (video, metadata, parts) in plan.metadata_updates]), batch_size=self.batch_size)
+
+        for desired_playlist in plan.playlist_creations:
+            playlist = youtube_client.Playlist(api_service=self.channel.api_service, title=desired_playlist.title, description=desired_playlist.description,
+                                               tags=desired_playlist.tags, privacy=desired_playlist.privacy)
+            playlist.add_to_youtube()
+            self.channel.index_playlist(playlist)
+        for playlist, desired_playlist in plan.playlist_updates:
+            playlist.title = desired_playlist.title
+            playlist.description = desired_playlist.description
+            playlist.tags = list(desired_playlist.tags)
+            playlist.sync_metadata_to_youtube()
+            self.channel.index_playlist(playlist)
+        for desired_playlist, edit_plan in plan.playlist_edits:
+            # Recomputed with the ids of the uploaded videos.
+            video_ids = [video.id for video in [self._get_video(key) for key in desired_playlist.video_keys] if video is not None]
+            self._get_playlist(desired_playlist.key).set_videos(video_ids=video_ids, batch_size=self.batch_size)
+        return jobs
+
+    def sync(self, desired_state, dry_run=False):
+        """Read the channel, plan, log the plan and (unless dry_run) apply it.
+
+        :return: The plan.
+        """
+        self.read()
+        plan = self.plan(desired_state=desired_state)
+        logging.info(plan.describe())
+        if not dry_run:
+            self.apply(plan)
+        return plan
@@ -0,0 +1,237 @@
+"""Upload many videos to YouTube concurrently.
+
+Example usage: :py:meth:curation_projects.rgveda.RgvedaRepo.upload_mandala_videos .
+"""
+import collections
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+
+# Throughput is measured over progress reports from this many recent seconds.
+THROUGHPUT_WINDOW_SECONDS = 60
+
+
+class UploadJob(object):
+    """A (:py:class:video_curation.youtube_client.YtVideo, filepath) pair to be uploaded, along with its progress and result."""
+    def __init__(self, video, filepath, priority=0):
+        """
+
+        :param video:
+        :param filepath:
+        :param priority: Jobs with smaller values are started first, and get bandwidth first.
+        """
+        self.video = video
+        self.filepath = filepath
+        self.priority = priority
+        self.size = os.path.getsize(filepath)
+        self.bytes_uploaded = 0
+        self.status = 'pending'
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+        # (time, bytes_uploaded) pairs.
+        self._progress_samples = collections.deque()
+
+    def __repr__(self):
+        return "%s %s status:%s uploaded:%d/%d" % (self.video, self.filepath, self.status, self.bytes_uploaded, self.size)
+
+    def get_duration(self):
+        if self.start_time is None:
+            return None
+        return (self.end_time or time.time()) - self.start_time
+
+    def _record_progress(self, bytes_uploaded):
+        now = time.time()
+        self.bytes_uploaded = bytes_uploaded
+        self._progress_samples.append((now, bytes_uploaded))
+        while len(self._progress_samples) > 2 and self._progress_samples[0][0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self._progress_samples.popleft()
+
+    def get_throughput(self):
+        """Bytes per second over the last THROUGHPUT_WINDOW_SECONDS (or since the start), None if unknown."""
+        if self.status != 'uploading' or self.start_time is None:
+            return None
+        samples = list(self._progress_samples)
+        if len(samples) < 2:
+            samples = [(self.start_time, 0)] + samples
+        (start_time, start_bytes), (end_time, end_bytes) = samples[0], samples[-1]
+        if end_time <= start_time or end_bytes <= start_bytes:
+            return None
+        return (end_bytes - start_bytes) / (end_time - start_time)
+
+    def get_eta(self):
+        """Estimated seconds until this job finishes uploading, None if unknown."""
+        if self.status in ['done', 'failed']:
+            return 0
+        throughput = self.get_throughput()
+        if throughput is None:
+            return None
+        return (self.size - self.bytes_uploaded) / throughput
+
+
+class UploadPool(object):
+    """A priority queue of upload jobs, run by up to num_workers resumable uploads at once.
+
+    httplib2 connections are not thread-safe, so every worker thread uploads via its own authorized http object (made by http_factory), while sharing the request-building api_service of the videos.
+
+    Jobs may be submitted while others run - a job with a smaller priority value starts as soon as a worker frees up, and, given a bandwidth_limiter, gets bandwidth ahead of the backlog from its first chunk on. Urgent jobs (with a negative priority) also have num_reserved_workers workers of their own, so they start at once even while the backlog keeps every other worker busy.
+    """
+    def __init__(self, credentials=None, num_workers=4, http_factory=None, progress_callback=None, session_store=None, bandwidth_limiter=None, num_reserved_workers=1):
+        """
+
+        :param credentials: Used to authorize per-worker http objects. Typically :py:attr:video_curation.youtube_client.Channel.credentials .
+        :param num_workers:
+        :param http_factory: A callable returning a new http object, such as :py:meth:video_curation.youtube_client.Channel.new_http . Defaults to an AuthorizedHttp over credentials.
+        :param progress_callback: Called with this pool whenever some job makes progress.
+        :param session_store: An optional :py:class:video_curation.upload_sessions.UploadSessionStore, via which interrupted uploads are resumed.
+        :param bandwidth_limiter: An optional :py:class:video_curation.bandwidth.BandwidthLimiter, which every chunk of every job passes through.
+        :param num_reserved_workers: Workers, besides the num_workers, which run only urgent jobs.
+        """
+        self.session_store = session_store
+        self.bandwidth_limiter = bandwidth_limiter
+        if http_factory is None:
+            def http_factory():
+                import google_auth_httplib2
+                from googleapiclient.http import build_http
+                return google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+        self.http_factory = http_factory
+        self.num_workers = num_workers
+        self.num_reserved_workers = num_reserved_workers
+        self.progress_callback = progress_callback
+        self.jobs = []
+        self._thread_local = threading.local()
+        self._lock = threading.Lock()
+        # Signalled when jobs are queued or finished.
+        self._condition = threading.Condition(self._lock)
+        # A heap of (priority, sequence number, job).
+        self._pending_jobs = []
+        self._sequence = itertools.count()
+        self._workers = []
+        self._stopping = False
+
+    def _get_http(self):
+        if not hasattr(self._thread_local, "http"):
+            self._thread_local.http = self.http_factory()
+        return self._thread_local.http
+
+    def get_progress(self):
+        """Return (bytes_uploaded, total_bytes, finished_jobs, total_jobs) over all jobs."""
+        with self._lock:
+            bytes_uploaded = sum(job.bytes_uploaded for job in self.jobs)
+            total_bytes = sum(job.size for job in self.jobs)
+            finished_jobs = len([job for job in self.jobs if job.status in ['done', 'failed']])
+            return bytes_uploaded, total_bytes, finished_jobs, len(self.jobs)
+
+    def get_throughput(self):
+        """Bytes per second, summed over the jobs being uploaded."""
+        with self._lock:
+            return sum(job.get_throughput() or 0 for job in self.jobs if job.status == 'uploading')
+
+    def get_eta(self):
+        """Estimated seconds until all queued jobs are uploaded at the current throughput, None if unknown."""
+        throughput = self.get_throughput()
+        if throughput == 0:
+            return None
+        with self._lock:
+            return sum(job.size - job.bytes_uploaded for job in self.jobs if job.status in ['pending', 'uploading']) / throughput
+
+    def _report_progress(self, job, bytes_uploaded):
+        with self._lock:
+            job._record_progress(bytes_uploaded)
+        if self.progress_callback is not None:
+            self.progress_callback(self)
+
+    def _run_job(self, job):
+        job.status = 'uploading'
+        job.start_time = time.time()
+
+        def chunk_throttle(chunksize, bytes_remaining):
+            if self.bandwidth_limiter is None:
+                return chunksize
+            return self.bandwidth_limiter.shape_chunk(chunksize=chunksize, bytes_remaining=bytes_remaining, priority=job.priority)
+        try:
+            job.video.initialize_upload(filepath=job.filepath, http=self._get_http(), progress_callback=lambda bytes_uploaded: self._report_progress(job, bytes_uploaded), session_store=self.session_store, chunk_throttle=chunk_throttle)
+            job.status = 'done'
+        except Exception as e:
+            logging.error("Failed to upload %s: %s", job.filepath, e)
+            job.error = e
+            job.status = 'failed'
+        job.end_time = time.time()
+        bytes_uploaded, total_bytes, finished_jobs, total_jobs = self.get_progress()
+        logging.info("Finished %d/%d uploads, %.1f/%.1f MB", finished_jobs, total_jobs, bytes_uploaded / 1e6, total_bytes / 1e6)
+        return job
+
+    def _has_job_for(self, urgent_only):
+        return len(self._pending_jobs) > 0 and (not urgent_only or self._pending_jobs[0][0] < 0)
+
+    def _work(self, urgent_only=False):
+        while True:
+            with self._condition:
+                while not self._has_job_for(urgent_only) and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                job = heapq.heappop(self._pending_jobs)[2]
+            self._run_job(job)
+            with self._condition:
+                self._condition.notify_all()
+
+    def start(self):
+        """Start the worker threads, which then run submitted jobs until :py:meth:stop is called."""
+        with self._condition:
+            if len(self._workers) > 0:
+                return
+            self._stopping = False
+            self._workers = [threading.Thread(target=self._work, name="upload-worker-%d" % index, daemon=True) for index in range(self.num_workers)]
+            self._workers.extend([threading.Thread(target=self._work, args=(True,), name="upload-reserved-worker-%d" % index, daemon=True) for index in range(self.num_reserved_workers)])
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        """Let the workers finish their current jobs and exit. Jobs not yet started stay queued."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            workers = self._workers
+        for worker in workers:
+            worker.join()
+        with self._condition:
+            self._workers = []
+
+    def submit(self, job):
+        """Queue job, to be run by the workers (see :py:meth:start) in priority order."""
+        with self._condition:
+            self.jobs.append(job)
+            heapq.heappush(self._pending_jobs, (job.priority, next(self._sequence), job))
+            self._condition.notify_all()
+        return job
+
+    def wait(self, jobs):
+        """Block until all jobs are done or failed."""
+        with self._condition:
+            while any(job.status not in ['done', 'failed'] for job in jobs):
+                self._condition.wait()
+
+    def upload(self, jobs):
+        """Upload all jobs, num_workers at a time, in priority order.
+
+        Starts the workers if they are not running yet (and then stops them once done).
+        :param jobs: A list of :py:class:UploadJob objects.
+        :return: The same jobs, with status ('done' or 'failed'), error and video.id set.
+        """
+        jobs = list(jobs)
+        started_workers = len(self._workers) == 0
+        self.start()
+        for job in jobs:
+            self.submit(job)
+        self.wait(jobs)
+        if started_workers:
+            self.stop()
+        failed_jobs = [job for job in jobs if job.status == 'failed']
+        if len(failed_jobs) > 0:
+            logging.warning("%d uploads failed: %s", len(failed_jobs), failed_jobs)
+        return jobs
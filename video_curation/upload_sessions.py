@@ -0,0 +1,107 @@
+"""Persistence and chunk sizing for resumable uploads.
+
+Example usage: :py:meth:video_curation.youtube_client.YtVideo.initialize_upload .
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+# Chunk sizes must be multiples of this (except for the last chunk).
+CHUNK_GRANULARITY = 256 * 1024
+
+
+class ResumableRequestState(object):
+    """Sets the chunk size and the session of a resumable googleapiclient HttpRequest, which offers no public way to do either.
+
+    The only code touching googleapiclient's private upload attributes (resumable._chunksize, _in_error_state) - so that a googleapiclient upgrade which changes them breaks just here, and loudly.
+    """
+    def __init__(self, request):
+        if not hasattr(request.resumable, "_chunksize") or not hasattr(request, "_in_error_state"):
+            raise AttributeError("This googleapiclient version does not support setting the chunk size or session of an upload.")
+        self.request = request
+
+    def set_chunksize(self, chunksize):
+        self.request.resumable._chunksize = chunksize
+
+    def resume(self, session_uri, bytes_confirmed):
+        """Continue the upload session session_uri. The server is first asked for the bytes it got, since bytes_confirmed may lag behind."""
+        self.request.resumable_uri = session_uri
+        self.request.resumable_progress = bytes_confirmed
+        # Makes next_chunk ask the server for the confirmed offset first.
+        self.request._in_error_state = True
+
+    def restart(self):
+        """Drop the session, so that the next chunk starts a new upload from byte 0."""
+        self.request.resumable_uri = None
+        self.request.resumable_progress = 0
+        self.request._in_error_state = False
+
+
+class UploadSessionStore(object):
+    """Remembers resumable upload sessions (session uri, bytes confirmed by the server) in a json file, keyed by file identity (path, size, mtime).
+
+    A later run can thus resume an interrupted upload from the last acknowledged offset. YouTube upload sessions expire after about a week.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.sessions = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.sessions = json.load(f)
+
+    # noinspection PyMethodMayBeStatic
+    def get_file_key(self, filepath):
+        stat = os.stat(filepath)
+        return "%s|%d|%f" % (os.path.abspath(filepath), stat.st_size, stat.st_mtime)
+
+    def _save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.sessions, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
+
+    def get(self, filepath):
+        """Return the stored session dict (session_uri, bytes_confirmed, updated_at) for filepath, or None."""
+        with self._lock:
+            return self.sessions.get(self.get_file_key(filepath))
+
+    def put(self, filepath, session_uri, bytes_confirmed):
+        with self._lock:
+            self.sessions[self.get_file_key(filepath)] = {'session_uri': session_uri, 'bytes_confirmed': bytes_confirmed, 'updated_at': time.time()}
+            self._save()
+
+    def delete(self, filepath):
+        with self._lock:
+            if self.sessions.pop(self.get_file_key(filepath), None) is not None:
+                self._save()
+
+
+class AdaptiveChunkSizer(object):
+    """Picks upload chunk sizes so that a chunk takes about target_seconds at the measured throughput.
+
+    Growth is limited to doubling per chunk; every error halves the chunk size. Sizes are multiples of CHUNK_GRANULARITY, within [minimum, maximum]. googleapiclient reads each chunk into memory, hence the modest default maximum.
+    """
+    def __init__(self, initial=8 * 1024 * 1024, minimum=CHUNK_GRANULARITY, maximum=64 * 1024 * 1024, target_seconds=30):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.chunksize = self._clamp(initial)
+        # Bytes per second over the last chunk.
+        self.throughput = None
+
+    def _clamp(self, chunksize):
+        chunksize = int(chunksize) // CHUNK_GRANULARITY * CHUNK_GRANULARITY
+        return min(max(chunksize, self.minimum), self.maximum)
+
+    def record_success(self, num_bytes, seconds):
+        if num_bytes <= 0:
+            return
+        self.throughput = num_bytes / max(seconds, 1e-3)
+        self.chunksize = self._clamp(min(self.throughput * self.target_seconds, self.chunksize * 2))
+        logging.debug("Throughput %.1f MB/s, next chunk %d bytes", self.throughput / 1e6, self.chunksize)
+
+    def record_error(self):
+        self.chunksize = self._clamp(self.chunksize // 2)
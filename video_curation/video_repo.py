@@ -1,10 +1,11 @@
-import glob
-
-import git
-import itertools
 import logging
 import os
 
+from video_curation.archive_mirror import ArchiveMirror
+from video_curation.content_index import ContentIndex
+from video_curation.mp4_probe import ProbeIndex
+from video_curation.repo_manifest import RepoManifest
+
 for handler in logging.root.handlers[:]:
     logging.root.removeHandler(handler)
 logging.basicConfig(
@@ -19,17 +20,108 @@ class VideoRepo(object):
         - mp4: Containing mp4-s for every "episode" in the repository. 
     """
 
-    def __init__(self, repo_paths, archive_item=None):
-        self.repo_paths = repo_paths
+    def __init__(self, repo_paths, archive_item=None, manifest_path=None, recursive=False):
+        """
 
-        self.base_mp4_file_paths = [item for sublist in
-                                    [sorted(glob.glob(os.path.join(repo_path, "*.mp4"))) for repo_path in
-                                     repo_paths] for item in sublist]
-        titles = [self.get_title_from_path(filepath=filepath) for filepath in self.base_mp4_file_paths]
-        self.title_to_path = dict(zip(titles, self.base_mp4_file_paths))
-        logging.info("Got %d files" % (len(self.base_mp4_file_paths)))
+        :param repo_paths: 
+        :param archive_item: An optional :py:class:video_curation.archive_mirror.ArchiveItem, to mirror the files to - see :py:meth:mirror_to_archive .
+        :param manifest_path: An SQLite file where the file listing is remembered across runs, so that only changed directories are rescanned. If None, the listing is kept in memory.
+        :param recursive: Whether to pick up mp4-s from subdirectories of repo_paths.
+        """
+        self.repo_paths = repo_paths
+        self.recursive = recursive
+        self.manifest = RepoManifest(path=manifest_path)
+        self.content_index = ContentIndex(manifest=self.manifest, roots=repo_paths)
+        self.probe_index = ProbeIndex(manifest=self.manifest, roots=repo_paths)
+        self.rescan()
         self.archive_item = archive_item
 
+    def rescan(self):
+        """Update self.manifest, listing the repo_paths directories which changed since the last scan (in parallel)."""
+        self.manifest.scan(roots=self.repo_paths, title_function=self.get_title_from_path, recursive=self.recursive)
+        logging.info("Got %d files" % (self.manifest.count_files(roots=self.repo_paths)))
+        for title, paths in self.get_title_collisions().items():
+            logging.warning("Title %s is shared by %d files: %s", title, len(paths), paths)
+
+    @property
+    def base_mp4_file_paths(self):
+        return self.manifest.get_paths(roots=self.repo_paths)
+
+    @property
+    def title_to_path(self):
+        """A dict from title to path, loaded from the manifest. For colliding titles (see :py:meth:get_title_collisions), the last path wins."""
+        return dict(self.get_titles_and_paths())
+
+    def get_titles_and_paths(self, title_substring=None):
+        """(title, path) pairs of files, optionally only those whose title contains title_substring."""
+        return self.manifest.get_titles_and_paths(roots=self.repo_paths, title_substring=title_substring)
+
+    def get_paths_for_title(self, title):
+        return self.manifest.get_paths_for_title(title=title, roots=self.repo_paths)
+
+    def get_title_collisions(self):
+        """A dict from every title shared by multiple files to those files' paths."""
+        return self.manifest.get_title_collisions(roots=self.repo_paths)
+
+    def update_content_index(self):
+        """Checksum new and changed files (see :py:class:video_curation.content_index.ContentIndex), and report byte-identical ones."""
+        self.content_index.update()
+        for paths in self.content_index.get_duplicate_groups():
+            logging.warning("Identical files: %s", paths)
+
+    def update_probe_index(self):
+        """Probe new and changed files (see :py:class:video_curation.mp4_probe.ProbeIndex), and report malformed or truncated ones."""
+        self.probe_index.update()
+        for path, error in self.probe_index.get_malformed_paths().items():
+            logging.warning("Malformed file %s: %s", path, error)
+
+    def get_probe(self, path):
+        """Duration, resolution etc. of path - see :py:func:video_curation.mp4_probe.probe_file . Needs :py:meth:update_probe_index ."""
+        return self.probe_index.get_probe(path)
+
+    def get_sound_paths(self, paths):
+        """Drop paths of malformed or truncated files (eg. partial copies), which are not worth uploading. Needs :py:meth:update_probe_index ."""
+        malformed_paths = self.probe_index.get_malformed_paths()
+        for path in paths:
+            if path in malformed_paths:
+                logging.warning("Skipping malformed file %s: %s", path, malformed_paths[path])
+        return [path for path in paths if path not in malformed_paths]
+
+    def get_unique_paths(self, paths, known_checksums=()):
+        """Drop paths whose content is identical to an earlier one, or has one of known_checksums. Needs :py:meth:update_content_index .
+
+        :param paths: 
+        :param known_checksums: Checksums of files which are already dealt with (eg. uploaded).
+        :return: 
+        """
+        seen_checksums = set(known_checksums)
+        unique_paths = []
+        for path in paths:
+            checksum = self.content_index.get_checksum(path)
+            if checksum is not None and checksum in seen_checksums:
+                logging.info("Skipping %s, whose content is already present.", path)
+                continue
+            if checksum is not None:
+                seen_checksums.add(checksum)
+            unique_paths.append(path)
+        return unique_paths
+
+    def mirror_to_archive(self, num_workers=4, state_path=None, dry_run=False, full_rescan=False):
+        """Upload files which are new or changed (by md5) to self.archive_item, under their base names - see :py:class:video_curation.archive_mirror.ArchiveMirror .
+
+        :param num_workers: Concurrent uploads.
+        :param state_path: An optional json file remembering uploaded files across runs.
+        :param dry_run:
+        :param full_rescan: Relist all directories, rather than just those changed since the last scan (by mtime) - for file systems whose directory mtimes can not be trusted. Files modified in place are noticed either way, and unchanged files are not re-hashed.
+        :return: A dict from the name of each failed file to its exception.
+        """
+        if full_rescan:
+            self.manifest.forget_directories()
+        self.rescan()
+        self.update_content_index()
+        files = dict([(os.path.basename(path), (path, self.content_index.get_checksum(path))) for path in self.base_mp4_file_paths])
+        return ArchiveMirror(item=self.archive_item, num_workers=num_workers, state_path=state_path).mirror(files=files, dry_run=dry_run)
+
     # noinspection PyMethodMayBeStatic
     def get_title_from_path(self, filepath):
         return os.path.basename(filepath).replace("_", " ")[:-4]
\ No newline at end of file
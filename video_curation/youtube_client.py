@@ -1,26 +1,245 @@
-"""A wrapper around Youtube API."""
+"""A wrapper around Youtube API.
+
+googleapiclient, httplib2 and curation_utils are imported on first use, so that importing this module (eg. for a job which never reaches YouTube) stays cheap.
+"""
+import functools
 import itertools
+import json
 import logging
+import os
 
 import http.client as httplib
-import random
-
-import httplib2
-import more_itertools
+import sys
+import threading
 import time
 
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
-
-from curation_utils.google import api_helper
-from curation_utils.google.api_helper import get_api_request_dict
+from video_curation import google_api_helper, playlist_reconciliation
+from video_curation.api_stats import ApiStats
+from video_curation.channel_index import ChannelIndex
+from video_curation.playlist_items import PlaylistItems, get_node_index
+from video_curation.request_scheduler import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, RequestScheduler, get_backoff_seconds
+from video_curation.upload_sessions import AdaptiveChunkSizer, ResumableRequestState
 
 ok_upload_status = ['uploaded', 'processed']
 
+# Pass as fields to read methods to get complete resources, rather than the default partial responses.
+ALL_FIELDS = "*"
+
+
+def get_api_request_dict(properties):
+    """See curation_utils.google.api_helper.get_api_request_dict ."""
+    from curation_utils.google.api_helper import get_api_request_dict
+    return get_api_request_dict(properties)
+
+
+def get_chunks(values, size):
+    """Consecutive slices of values, of length size (but for the last)."""
+    return [values[start:start + size] for start in range(0, len(values), size)]
+
+
+def execute_request(request, priority=PRIORITY_NORMAL):
+    """Execute an api_service request via the :py:class:video_curation.request_scheduler.RequestScheduler of its :py:class:HttpPool, if any - which may defer it to the next quota window.
+
+    :param request:
+    :param priority: One of the PRIORITY_* constants of :py:mod:video_curation.request_scheduler .
+    :return: The response, or None if deferred.
+    """
+    scheduler = getattr(request.http, "scheduler", None)
+    if scheduler is None:
+        return request.execute()
+    return scheduler.execute(request, priority=priority)
+
+
+def get_fields_mask(part, part_fields):
+    """A fields mask (for a partial response) selecting, of every item, its kind, etag and id, and for every requested part, the fields listed in part_fields.
+
+    :param part: The part parameter of the request, eg. "snippet,status".
+    :param part_fields: A dict from part to the fields read from it, eg. :py:attr:YtVideo.PART_FIELDS . Parts missing here are requested whole.
+    :return: Eg. "etag,nextPageToken,items(kind,etag,id,snippet(title,description))".
+    """
+    item_fields = ['kind', 'etag', 'id']
+    for part_name in [part_name.strip() for part_name in part.split(",")]:
+        if part_name in part_fields:
+            item_fields.append("%s(%s)" % (part_name, ",".join(part_fields[part_name])))
+        else:
+            item_fields.append(part_name)
+    return "etag,nextPageToken,items(%s)" % ",".join(item_fields)
+
+
+def get_fields_parameter(fields, part, part_fields):
+    """The fields parameter to send: by default a mask derived from part_fields, None (ie. omitted) for ALL_FIELDS."""
+    if fields is None:
+        return get_fields_mask(part=part, part_fields=part_fields)
+    if fields == ALL_FIELDS:
+        return None
+    return fields
+
+
+class UploadError(Exception):
+    """Raised when an upload fails for good. A persisted upload session (if any) is retained, so that a later run may resume it."""
+
+
+# Number of requests grouped into one multi-part batch request by :py:class:BatchExecutor.
+DEFAULT_BATCH_SIZE = 50
+
+
+class HttpPool(object):
+    """A thread-safe http object, via which an api_service (and so all model objects holding it) may be used from many threads at once.
+
+    httplib2 objects are not thread-safe, so each thread sends its requests through its own http object - made by http_factory on the thread's first request, and kept (with its keep-alive connections) for later ones.
+    The http objects share credentials, which are refreshed once for all of them when expired.
+    """
+    def __init__(self, http_factory, credentials=None, scheduler=None):
+        """
+
+        :param http_factory: A callable returning a new http object, such as :py:meth:Channel.new_http .
+        :param credentials: The credentials the http objects are authorized with, if any.
+        :param scheduler: The :py:class:video_curation.request_scheduler.RequestScheduler which the http objects send requests under, if any - see :py:func:execute_request .
+        """
+        self.http_factory = http_factory
+        self.credentials = credentials
+        self.scheduler = scheduler
+        self._thread_local = threading.local()
+        self._lock = threading.Lock()
+        self._https = []
+
+    def __len__(self):
+        """The number of http objects made so far."""
+        return len(self._https)
+
+    def __getattr__(self, name):
+        # Let googleapiclient find timeout etc. of the underlying http objects.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get_http(), name)
+
+    def get_http(self):
+        """The http object of the calling thread."""
+        http = getattr(self._thread_local, "http", None)
+        if http is None:
+            http = self.http_factory()
+            self._thread_local.http = http
+            with self._lock:
+                self._https.append(http)
+        return http
+
+    def _refresh_credentials(self):
+        """Refresh expired credentials up front, under a lock - rather than have every thread's http object refresh them on its own."""
+        if self.credentials is None or self.credentials.valid:
+            return
+        with self._lock:
+            if not self.credentials.valid:
+                import google_auth_httplib2
+                from googleapiclient.http import build_http
+                self.credentials.refresh(google_auth_httplib2.Request(build_http()))
+                logging.info("Refreshed credentials, valid until %s.", self.credentials.expiry)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self._refresh_credentials()
+        return self.get_http().request(uri, method=method, body=body, headers=headers, **kwargs)
+
+    def close(self):
+        """Close the connections of all http objects."""
+        with self._lock:
+            https = self._https
+            self._https = []
+        for http in https:
+            close = getattr(http, "close", None)
+            if close is not None:
+                close()
+        self._thread_local = threading.local()
+
+
+class BatchExecutor(object):
+    """Groups api_service requests into multi-part batch requests.
+
+    Requests are sent in batches of batch_size. For every request, on_success(response) or on_failure(exception) is called in the order in which the requests were added. Failures are also logged and collected in self.failures.
+    If batch_size is None, every request is executed as soon as it is added, and errors are raised as usual.
+    Requests deferred to the next quota window by the :py:class:video_curation.request_scheduler.RequestScheduler (see :py:func:execute_request) get neither callback, and are collected in self.deferred.
+    
+    Can be used as a context manager - pending requests are sent on exit.
+    """
+    def __init__(self, api_service, batch_size=DEFAULT_BATCH_SIZE):
+        self.api_service = api_service
+        self.batch_size = batch_size
+        self.failures = []
+        self.deferred = []
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, request, on_success=None, on_failure=None, priority=PRIORITY_NORMAL):
+        if self.batch_size is None:
+            response = execute_request(request, priority=priority)
+            if response is None:
+                self.deferred.append(request)
+            elif on_success is not None:
+                on_success(response)
+            return
+        self._pending.append((request, on_success, on_failure, priority))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Send all pending requests."""
+        pending, self._pending = self._pending, []
+        scheduler = getattr(pending[0][0].http, "scheduler", None) if len(pending) > 0 else None
+        if scheduler is not None:
+            admitted = scheduler.admit([(request, priority) for (request, _, _, priority) in pending])
+            self.deferred.extend([entry[0] for (entry, is_admitted) in zip(pending, admitted) if not is_admitted])
+            pending = [entry for (entry, is_admitted) in zip(pending, admitted) if is_admitted]
+        if len(pending) == 0:
+            return
+
+        def callback(request_id, response, exception):
+            request, on_success, on_failure, _ = pending[int(request_id)]
+            if exception is None:
+                if on_success is not None:
+                    on_success(response)
+            else:
+                logging.error("Batched request %s %s failed: %s", request.method, request.uri, exception)
+                self.failures.append((request, exception))
+                if on_failure is not None:
+                    on_failure(exception)
+
+        batch = self.api_service.new_batch_http_request(callback=callback)
+        for index, (request, _, _, _) in enumerate(pending):
+            batch.add(request, request_id=str(index))
+        logging.info("Sending a batch of %d requests.", len(pending))
+        batch.execute()
+
+
+# Shared tuples of tags, by value. See _intern_tags.
+_interned_tags = {}
+
+
+def _intern(value):
+    """Share one copy of equal strings (titles, descriptions, privacy and status values repeat across many videos)."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _intern_tags(tags):
+    """A shared tuple of interned tags equal to tags - videos of a series mostly carry the very same tags."""
+    if tags is None:
+        return None
+    tags = tuple([_intern(tag) for tag in tags])
+    return _interned_tags.setdefault(tags, tags)
+
 
 class YtVideo(object):
-    """Represents a YouTube video."""
+    """Represents a YouTube video.
+    
+    Large channels hold many of these, so they are slotted, and the strings and tags read from YouTube are interned (tags being shared tuples).
+    """
+    # The fields of each part read by set_from_yt_metadata - and so requested by default.
+    PART_FIELDS = {'snippet': ['title', 'description', 'tags', 'categoryId'], 'status': ['privacyStatus', 'uploadStatus']}
+    __slots__ = ('id', 'title', 'description', 'tags', 'category_id', 'privacy', 'upload_status', 'api_service', 'etag', '_remote_state')
+
     def __init__(self, id=None, title=None, description=None, tags=None, category_id=1, api_service=None, privacy='public', upload_status='uploaded'):
         self.upload_status = upload_status
         self.category_id = category_id
@@ -30,19 +249,84 @@ class YtVideo(object):
         self.tags = tags
         self.privacy = privacy
         self.api_service = api_service
+        # The etag of the last known state at YouTube - None if unknown, or changed by this object since.
+        self.etag = None
+        # The last known state at YouTube, as a tuple of attribute values (None if unknown) - see the remote_metadata property.
+        self._remote_state = None
+
+    def _get_state(self):
+        return self.id, self.title, self.description, self.tags, self.category_id, self.privacy, self.upload_status
+
+    @property
+    def remote_metadata(self):
+        """The last known state at YouTube, as from to_yt_metadata (None if unknown). See get_changed_parts."""
+        if self._remote_state is None:
+            return None
+        id, title, description, tags, category_id, privacy, upload_status = self._remote_state
+        return {'id': id, 'etag': self.etag,
+                'snippet': {'title': title, 'description': description, 'tags': tags, 'categoryId': category_id},
+                'status': {'privacyStatus': privacy, 'uploadStatus': upload_status}}
+
+    @remote_metadata.setter
+    def remote_metadata(self, yt_metadata):
+        if yt_metadata is None:
+            self._remote_state = None
+            self.etag = None
+            return
+        self.etag = yt_metadata.get('etag')
+        snippet = yt_metadata.get('snippet', {})
+        status = yt_metadata.get('status', {})
+        self._remote_state = (yt_metadata.get('id'), snippet.get('title'), snippet.get('description'), snippet.get('tags'), snippet.get('categoryId'),
+                              status.get('privacyStatus'), status.get('uploadStatus'))
 
     def set_from_yt_metadata(self, yt_metadata):
         """Create and return a YTVideo object"""
         self.id = yt_metadata["id"]
-        self.title = yt_metadata['snippet']['title']
-        self.description = yt_metadata['snippet'].get('description', None)
-        self.tags = yt_metadata['snippet'].get('tags', None)
-        self.category_id = yt_metadata['snippet'].get('categoryId', 1)
+        if 'snippet' in yt_metadata:
+            self.title = _intern(yt_metadata['snippet'].get('title', None))
+            self.description = _intern(yt_metadata['snippet'].get('description', None))
+            self.tags = _intern_tags(yt_metadata['snippet'].get('tags', None))
+            self.category_id = _intern(yt_metadata['snippet'].get('categoryId', 1))
         if 'status' in yt_metadata:
-            self.privacy = yt_metadata['status'].get('privacyStatus', 'public')
-            self.upload_status = yt_metadata['status'].get('uploadStatus', 'uploaded')
+            self.privacy = _intern(yt_metadata['status'].get('privacyStatus', 'public'))
+            self.upload_status = _intern(yt_metadata['status'].get('uploadStatus', 'uploaded'))
             if self.upload_status not in ok_upload_status:
                 logging.warning("Got a strange video %s", yt_metadata)
+        self.etag = yt_metadata.get('etag')
+        self._remote_state = self._get_state()
+
+    def to_yt_metadata(self):
+        """Inverse of :py:meth:set_from_yt_metadata ."""
+        return {'id': self.id,
+                'snippet': {'title': self.title, 'description': self.description, 'tags': self.tags, 'categoryId': self.category_id},
+                'status': {'privacyStatus': self.privacy, 'uploadStatus': self.upload_status}}
+
+    def get_changed_parts(self):
+        """The parts (snippet, status) whose writable fields differ from self.remote_metadata - all of them if the remote state is unknown."""
+        if self.remote_metadata is None:
+            return ['snippet', 'status']
+        local_metadata = _normalize_yt_metadata(self.to_yt_metadata())
+        remote_metadata = _normalize_yt_metadata(self.remote_metadata)
+        return [part for part in ['snippet', 'status'] if local_metadata[part] != remote_metadata[part]]
+
+    def get_update_request(self, parts):
+        """A single videos.update request setting the given parts (eg. ['snippet', 'status']) from this object's attributes."""
+        properties = {'id': self.id}
+        if 'snippet' in parts:
+            properties.update({'snippet.title': self.title,
+                               'snippet.description': self.description,
+                               'snippet.tags[]': self.tags,
+                               'snippet.categoryId': self.category_id})
+        if 'status' in parts:
+            properties['status.privacyStatus'] = self.privacy
+        return self.api_service.videos().update(
+            body=get_api_request_dict(properties),
+            part=",".join(parts)
+        )
+
+    def _fold_update(self, response):
+        self.etag = None
+        self._remote_state = self._get_state()
 
     @classmethod
     def from_id(cls, id, api_service):
@@ -63,18 +347,15 @@ class YtVideo(object):
         """Compare two YtVideo objects"""
         return self.title < other.title
 
-    def initialize_upload(self, filepath):
-        """
-        Upload a new video to YouTube!
-        
-        :param filepath: 
-        :return: 
-        """
+    def get_upload_request(self, filepath, chunksize=-1):
+        """Get a resumable videos.insert request for uploading filepath as this video."""
+        import googleapiclient.http
         body=dict(
             snippet=dict(
                 title=self.title,
                 description=self.description,
-                tags=self.tags
+                tags=self.tags,
+                categoryId=self.category_id
             ),
             status=dict(
                 privacyStatus=self.privacy
@@ -82,7 +363,7 @@ class YtVideo(object):
         )
     
         # Call the API's videos.insert method to create and upload the video.
-        insert_request = self.api_service.videos().insert(
+        return self.api_service.videos().insert(
             part=",".join(body.keys()),
             body=body,
             # The chunksize parameter specifies the size of each chunk of data, in
@@ -90,17 +371,41 @@ class YtVideo(object):
             # reliable connections as fewer chunks lead to faster uploads. Set a lower
             # value for better recovery on less reliable connections.
             #
-            # Setting "chunksize" equal to -1 in the code below means that the entire
+            # Setting "chunksize" equal to -1 means that the entire
             # file will be uploaded in a single HTTP request. (If the upload fails,
-            # it will still be retried where it left off.) This is usually a best
-            # practice, but if you're using Python older than 2.6 or if you're
-            # running on App Engine, you should set the chunksize to something like
-            # 1024 * 1024 (1 megabyte).
-            media_body=MediaFileUpload(filepath, chunksize=-1, resumable=True)
+            # it will still be retried where it left off.) initialize_upload instead
+            # adapts the chunk size to the measured throughput - see
+            # :py:class:video_curation.upload_sessions.AdaptiveChunkSizer .
+            media_body=googleapiclient.http.MediaFileUpload(filepath, chunksize=chunksize, resumable=True)
         )
 
+    def initialize_upload(self, filepath, http=None, progress_callback=None, session_store=None, chunk_sizer=None, chunk_throttle=None):
+        """
+        Upload a new video to YouTube!
+        
+        :param filepath: 
+        :param http: An authorized http object to upload with, in place of the thread's own http object in self.api_service's :py:class:HttpPool - see :py:class:video_curation.upload_pool.UploadPool .
+        :param progress_callback: Called with the number of bytes uploaded so far, after every chunk.
+        :param session_store: An optional :py:class:video_curation.upload_sessions.UploadSessionStore. The upload session is saved there after every chunk, and an upload of the same (unchanged) file interrupted in an earlier run is resumed from the last acknowledged byte.
+        :param chunk_sizer: A :py:class:video_curation.upload_sessions.AdaptiveChunkSizer. A new one by default.
+        :param chunk_throttle: Called as chunk_throttle(chunksize, bytes_remaining) before every chunk, returning the chunk size to use. It may block to limit bandwidth - see :py:meth:video_curation.bandwidth.BandwidthLimiter.shape_chunk .
+        :return: 
+        """
+        if chunk_sizer is None:
+            chunk_sizer = AdaptiveChunkSizer()
+        insert_request = self.get_upload_request(filepath=filepath, chunksize=chunk_sizer.chunksize)
+        scheduler = getattr(insert_request.http, "scheduler", None)
+        if session_store is not None:
+            session = session_store.get(filepath)
+            if session is not None:
+                logging.info("Resuming upload of %s from about byte %d", filepath, session['bytes_confirmed'])
+                ResumableRequestState(insert_request).resume(session_uri=session['session_uri'], bytes_confirmed=session['bytes_confirmed'])
+        if scheduler is not None and insert_request.resumable_uri is None:
+            # Raises QuotaExhaustedError, rather than start an upload which YouTube would refuse.
+            scheduler.admit([(insert_request, PRIORITY_HIGH)])
         logging.info("Uploading %s", self)
-        self.id = _resumable_upload(insert_request)
+        self.id = _resumable_upload(insert_request, http=http, progress_callback=progress_callback, session_store=session_store, filepath=filepath, chunk_sizer=chunk_sizer, chunk_throttle=chunk_throttle)
+        self._remote_state = self._get_state()
         logging.info("Uploaded %s", self)
 
     def sync_metadata_to_youtube(self):
@@ -115,28 +420,36 @@ class YtVideo(object):
                       'snippet.categoryId': self.category_id
                       }
         resource = get_api_request_dict(properties)
-        response = self.api_service.videos().update(
+        request = self.api_service.videos().update(
             body=resource,
             part='snippet'
-        ).execute()
+        )
+        response = execute_request(request, priority=PRIORITY_NORMAL)
         logging.info(response)
 
     def set_youtube_privacy(self):
-        """Update YouTube privacy setting for this video."""
+        """Update YouTube privacy setting for this video - or defer that, if the quota runs low."""
         properties = {'id': self.id,
                       'status.privacyStatus': self.privacy,
                       }
         resource = get_api_request_dict(properties)
-        response = self.api_service.videos().update(
+        request = self.api_service.videos().update(
             body=resource,
             part='status'
-        ).execute()
+        )
+        response = execute_request(request, priority=PRIORITY_LOW)
         logging.info(response)
 
-    def sync_from_youtube(self, part='snippet,status'):
+    def sync_from_youtube(self, part='snippet,status', fields=None):
+        """Set attributes from YouTube.
+        
+        :param part: 
+        :param fields: A fields mask, for a lean projection. By default, just what :py:meth:set_from_yt_metadata reads. Attributes of parts left out of the response are not touched, while those of returned parts which are left out become None.
+        """
         response = self.api_service.videos().list(
             part=part,
-            id=self.id
+            id=self.id,
+            fields=get_fields_parameter(fields=fields, part=part, part_fields=YtVideo.PART_FIELDS)
         ).execute()
         self.set_from_yt_metadata(yt_metadata=response["items"][0])
 
@@ -147,15 +460,66 @@ class YtVideo(object):
         logging.info(response)
 
 
+def _normalize_yt_metadata(yt_metadata):
+    """The writable fields of yt_metadata (as from :py:meth:YtVideo.to_yt_metadata), with equivalent empty values and category ids made equal."""
+    snippet = yt_metadata.get('snippet', {})
+    return {'snippet': {'title': snippet.get('title') or "", 'description': snippet.get('description') or "",
+                        'tags': list(snippet.get('tags') or []), 'categoryId': str(snippet.get('categoryId', 1))},
+            'status': {'privacyStatus': yt_metadata.get('status', {}).get('privacyStatus')}}
+
+
+def push_video_metadatas(videos, batch_size=DEFAULT_BATCH_SIZE):
+    """Update at YouTube just those videos whose attributes differ from their remote_metadata, with one videos.update (of all changed parts) per video, sent in batches.
+
+    Each videos.update costs 50 quota units whatever the number of parts, so re-applying unchanged metadata costs nothing. Updates of just the privacy are sent with PRIORITY_LOW - see :py:func:execute_request .
+    :param videos: :py:class:YtVideo objects whose attributes hold the desired metadata.
+    :param batch_size: 
+    :return: The videos which were updated. Failed (or deferred) updates are logged, and their videos keep their old remote_metadata, so that they are retried on the next push.
+    """
+    updated_videos = []
+    with BatchExecutor(api_service=videos[0].api_service if len(videos) > 0 else None, batch_size=batch_size) as batch:
+        for video in videos:
+            parts = video.get_changed_parts()
+            if len(parts) == 0:
+                continue
+            logging.info("Updating %s of %s", parts, video)
+            batch.add(video.get_update_request(parts=parts), on_success=functools.partial(_fold_video_update, video=video, updated_videos=updated_videos),
+                      priority=PRIORITY_LOW if parts == ['status'] else PRIORITY_NORMAL)
+    logging.info("Updated %d of %d videos.", len(updated_videos), len(videos))
+    return updated_videos
+
+
+def _fold_video_update(response, video, updated_videos):
+    video._fold_update(response)
+    updated_videos.append(video)
+
+
 class PlaylistItem(object):
+    # The fields of each part read by from_metadata - and so requested by default.
+    PART_FIELDS = {'snippet': ['playlistId', 'position', 'title', 'resourceId/videoId']}
+    # _node is set while the item is in a :py:class:video_curation.playlist_items.PlaylistItems .
+    __slots__ = ('api_service', 'video_id', 'item_id', '_position', 'title', 'playlist_id', '_node')
+
     def __init__(self, api_service, video_id, playlist_id, title=None, item_id=None, position=0):
         self.api_service = api_service
         self.video_id = video_id
         self.item_id = item_id
-        self.position = position
+        self._position = position
+        self._node = None
         self.title = title
         self.playlist_id = playlist_id
 
+    @property
+    def position(self):
+        """The index of this item in the items of its playlist, if it is in them (see :py:class:video_curation.playlist_items.PlaylistItems) - else the position it was made with."""
+        if self._node is not None:
+            return get_node_index(self._node)
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        self._position = position
+
     def __repr__(self):
         return "video_id:%s position:%s" % (self.video_id, self.position)
 
@@ -177,8 +541,8 @@ class PlaylistItem(object):
             logging.error(metadata)
         # metadata['snippet']['position']
         position = metadata['snippet']['position']
-        playlist_id = metadata['snippet']['playlistId']
-        title = metadata['snippet']['title']
+        playlist_id = _intern(metadata['snippet']['playlistId'])
+        title = _intern(metadata['snippet']['title'])
         self = PlaylistItem(video_id=video_id, playlist_id=playlist_id, item_id=item_id, position=position, title=title, api_service=api_service)
         return self
 
@@ -189,12 +553,40 @@ class PlaylistItem(object):
                 'snippet.resourceId.videoId': self.video_id,
                 'snippet.position': self.position}
 
+    def to_yt_metadata(self):
+        """Inverse of :py:meth:from_metadata ."""
+        return {'id': self.item_id,
+                'snippet': {'playlistId': self.playlist_id, 'position': self.position, 'title': self.title, 'resourceId': {'kind': 'youtube#video', 'videoId': self.video_id}}}
+
+    def to_resource(self):
+        """Request body for playlistItems insert/update calls.
+        
+        Unlike get_api_request_dict(self.to_metadata()), this retains position 0.
+        """
+        resource = get_api_request_dict(self.to_metadata())
+        resource['snippet']['position'] = self.position
+        return resource
+
 
 class Playlist(object):
     """
     Represents a YouTube playlist.
     """
-    def __init__(self, api_service, title, id=None, description="", tags=None, privacy='public'):
+    # The fields of each part read by from_metadata - and so requested by default.
+    PART_FIELDS = {'snippet': ['title', 'description', 'tags'], 'status': ['privacyStatus']}
+    __slots__ = ('id', 'title', 'description', 'tags', 'privacy', 'api_service', 'yt_metadata', '_items')
+
+    def __init__(self, api_service, title, id=None, description="", tags=None, privacy='public', sync_items=False):
+        """
+        
+        :param api_service: 
+        :param title: 
+        :param id: 
+        :param description: 
+        :param tags: 
+        :param privacy: 
+        :param sync_items: If True, list the items of this (existing) playlist right away, rather than on first access of self.items.
+        """
         if tags is None:
             tags = []
         self.id = id
@@ -203,9 +595,27 @@ class Playlist(object):
         self.tags = tags.copy()
         self.privacy = privacy
         self.api_service = api_service
-        self.items = []
-        if id is not None:
+        # The raw metadata this was made from, if asked for - see from_metadata.
+        self.yt_metadata = None
+        # None until listed - see the items property.
+        self._items = None if id is not None else PlaylistItems()
+        if id is not None and sync_items:
+            self.sync_items_from_youtube()
+
+    @property
+    def items(self):
+        """The :py:class:PlaylistItem objects of this playlist, in order, as a :py:class:video_curation.playlist_items.PlaylistItems . Listed from YouTube on first access (or by :py:meth:Channel.prefetch)."""
+        if self._items is None:
             self.sync_items_from_youtube()
+        return self._items
+
+    @items.setter
+    def items(self, items):
+        """Set the items from any sequence of :py:class:PlaylistItem objects, in order."""
+        self._items = items if isinstance(items, PlaylistItems) else PlaylistItems(items)
+
+    def items_loaded(self):
+        return self._items is not None
 
     def __repr__(self):
         return "id:%s title:%s" % (self.id, self.title)
@@ -213,95 +623,197 @@ class Playlist(object):
     def __lt__(self, other):
         return self.title < other.title
 
-    def _sync_positions_yt(self):
-        for index, item in enumerate(self.items):
-            if item.position != index:
-                item.position = index
-                resource = get_api_request_dict(item.to_metadata())
-                response = self.api_service.playlistItems().insert(
-                    body=resource,
-                    part='snippet'
-                ).execute()
-                logging.info(response)
+    def deduplicate(self, key=lambda item:item.video_id, batch_size=DEFAULT_BATCH_SIZE):
+        """Delete all but the first item of every key (by default, of every video) - all deletes computed up front, and sent together.
 
-    def deduplicate(self, key=lambda item:item.video_id):
-        sorted_items = sorted(self.items, key=key)
-        for key, items_iterator in itertools.groupby(sorted_items, key=key):
-            items = list(items_iterator)
-            if len(items) > 0:
-                logging.info("Found duplicates for key %s : %s", key, items)
-                for item in items[1:]:
-                    self.delete_item(item)
+        :param key:
+        :param batch_size: See :py:meth:delete_items .
+        :return: The items deleted (or whose deletion failed or was deferred).
+        """
+        items_to_delete = self.items.get_duplicates(key=key)
+        logging.info("Found %d duplicates in %s: %s", len(items_to_delete), self, items_to_delete)
+        self.delete_items(items=items_to_delete, batch_size=batch_size)
+        return items_to_delete
 
-    def sort(self, key=lambda item: item.title):
-        self.items.sort(key=key)
-        self._sync_positions_yt()
+    def sort(self, key=lambda item: item.title, batch_size=None):
+        """Sort items at YouTube, moving as few items as possible."""
+        video_ids = [item.video_id for item in sorted(self.items, key=key)]
+        self.apply_edit_plan(plan=playlist_reconciliation.plan_playlist_edits(items=self.items, video_ids=video_ids), batch_size=batch_size)
 
-    # https://developers.google.com/youtube/v3/docs/playlistItems#resource
-    def add_video_yt(self, video_id, position=0):
-        """Insert a video into this playlist. Update YouTube as well."""
-        properties = {'snippet.playlistId': self.id,
-                      'snippet.resourceId.kind': 'youtube#video',
-                      'snippet.resourceId.videoId': video_id,
-                      'snippet.position': position}
-        resource = get_api_request_dict(properties)
-        response = self.api_service.playlistItems().insert(
+    def _get_add_video_request(self, video_id, position=0):
+        """An insert request for video_id at position - or, if position is None, at the end of the playlist."""
+        resource = PlaylistItem(api_service=self.api_service, video_id=video_id, playlist_id=self.id, position=position or 0).to_resource()
+        if position is None:
+            del resource['snippet']['position']
+        return self.api_service.playlistItems().insert(
             body=resource,
             part='snippet'
-        ).execute()
+        )
+
+    def _fold_added_item(self, response, position):
         logging.info(response)
+        position = min(position, len(self.items))
         response['snippet']['position'] = position
         item = PlaylistItem.from_metadata(response, api_service=self.api_service)
         self.items.insert(position, item)
         return item
 
-    def add_videos(self, video_ids):
-        """Add multiple videos to this playlist. Update YouTube as well."""
-        [self.add_video_yt(video_id=video_id, position=position) for position, video_id in enumerate(video_ids)]
+    # https://developers.google.com/youtube/v3/docs/playlistItems#resource
+    def add_video_yt(self, video_id, position=0):
+        """Insert a video into this playlist. Update YouTube as well.
+
+        :return: The new :py:class:PlaylistItem - or None if the request was not sent (see :py:func:execute_request).
+        """
+        request = self._get_add_video_request(video_id=video_id, position=position)
+        response = execute_request(request, priority=PRIORITY_HIGH)
+        if response is None:
+            self._mark_stale(request, video_ids=self.get_video_ids()[:position] + [video_id] + self.get_video_ids()[position:])
+            return None
+        return self._fold_added_item(response, position=position)
+
+    def _mark_stale(self, request, video_ids):
+        """Have a positional request which was not sent (see :py:func:video_curation.request_scheduler._is_positional) re-planned later - with video_ids as the target order - via the scheduler of request, if any. See :py:meth:Channel.run_deferred_requests ."""
+        scheduler = getattr(request.http, "scheduler", None)
+        if scheduler is not None:
+            scheduler.mark_playlist_stale(playlist_id=self.id, video_ids=video_ids)
+
+    def add_videos(self, video_ids, batch_size=None):
+        """Add multiple videos to the top of this playlist, in order. Update YouTube as well.
+
+        :param video_ids: 
+        :param batch_size: Passed on to :py:meth:apply_edit_plan - so insertions into an empty playlist are batched.
+        """
+        self.apply_edit_plan(plan=playlist_reconciliation.plan_playlist_edits(items=self.items, video_ids=list(video_ids) + self.get_video_ids()), batch_size=batch_size)
+
+    def _append_videos(self, video_ids, batch_size):
+        """Append videos to the end of this playlist, by batch requests of batch_size. Update YouTube as well.
+
+        Batched requests may be applied in any order, so the order of these videos among themselves is not guaranteed. Items are added to self.items at the positions YouTube reports (which later appends do not shift); failures are logged and skipped.
+        """
+        responses = []
+        with BatchExecutor(api_service=self.api_service, batch_size=batch_size) as batch:
+            for video_id in video_ids:
+                batch.add(self._get_add_video_request(video_id=video_id, position=None), on_success=responses.append, priority=PRIORITY_HIGH)
+        for response in sorted(responses, key=lambda response: response['snippet'].get('position', 0)):
+            self._fold_added_item(response, position=response['snippet'].get('position', len(self.items)))
+        
+    def set_videos(self, video_ids, batch_size=None):
+        """Make this playlist contain exactly video_ids, in that order. Update YouTube with the fewest writes.
         
-    def set_videos(self, video_ids):
-        if self.get_video_ids() != video_ids:
-            self.clear_items()
-            self.add_videos(video_ids=video_ids)
+        :param video_ids: 
+        :param batch_size: Passed on to :py:meth:apply_edit_plan.
+        :return: The applied :py:class:video_curation.playlist_reconciliation.PlaylistEditPlan.
+        """
+        plan = playlist_reconciliation.plan_playlist_edits(items=self.items, video_ids=list(video_ids))
+        logging.info("Reconciling %s: %s", self, plan)
+        self.apply_edit_plan(plan=plan, batch_size=batch_size)
+        return plan
 
-    def delete_item(self, item):
-        response = self.api_service.playlistItems().delete(id=item.item_id).execute()
+    def _fold_placed_item(self, response, item, position):
+        logging.info(response)
+        self.items.move(item, position)
+
+    def apply_edit_plan(self, plan, batch_size=None):
+        """Apply a :py:class:video_curation.playlist_reconciliation.PlaylistEditPlan computed against self.items.
+
+        :param plan: 
+        :param batch_size: If not None, send the deletions, and the insertions after every existing item (plan.num_appends - eg. all of them when building a playlist afresh), as batch requests of this size. Those insertions are sent without positions, as appends; since batched requests may be applied in any order, any appended items which land out of order are then moved into place.
+        Other inserts and moves are always sent one by one, since each position depends on the previous placements having been applied.
+        Moves are sent with PRIORITY_LOW (see :py:func:execute_request). Positional edits are never deferred: if any are not sent, later items may land off their planned positions, and the playlist is marked stale, to be re-planned towards plan.video_ids in a later quota window.
+        """
+        self.delete_items(items=plan.deletes, batch_size=batch_size, target_video_ids=plan.video_ids)
+        placements = plan.placements
+        num_appends = plan.num_appends if batch_size is not None and plan.num_appends > 1 else 0
+        unsent_request = None
+        # Each placement position assumes that the previous ones are already applied.
+        for position, video_id, item in placements[:len(placements) - num_appends]:
+            if item is None:
+                self.add_video_yt(video_id=video_id, position=position)
+            else:
+                resource = PlaylistItem(api_service=self.api_service, video_id=item.video_id, playlist_id=self.id, item_id=item.item_id, position=position).to_resource()
+                request = self.api_service.playlistItems().update(body=resource, part='snippet')
+                response = execute_request(request, priority=PRIORITY_LOW)
+                if response is not None:
+                    self._fold_placed_item(response, item=item, position=position)
+                else:
+                    unsent_request = request
+        if unsent_request is not None:
+            self._mark_stale(unsent_request, video_ids=plan.video_ids)
+        if num_appends > 0:
+            self._append_videos(video_ids=plan.video_ids[-num_appends:], batch_size=batch_size)
+            correction_plan = playlist_reconciliation.plan_playlist_edits(items=self.items, video_ids=plan.video_ids)
+            if len(correction_plan) > 0:
+                logging.info("Appends to %s landed out of order, correcting: %s", self, correction_plan)
+                self.apply_edit_plan(plan=correction_plan)
+
+    def _fold_deleted_item(self, response, item):
         logging.info(response)
-        position = self.items.index(item)
         self.items.remove(item)
-        for index, item in enumerate(self.items[position:]):
-            item.position = index
+
+    def delete_item(self, item):
+        self.delete_items(items=[item])
+
+    def delete_items(self, items, batch_size=None, target_video_ids=None):
+        """Delete multiple items from this playlist. Update YouTube as well.
+
+        :param items: 
+        :param batch_size: If not None, send the deletions as batch requests of this size. Items whose deletion failed are retained in self.items.
+        :param target_video_ids: The order to re-plan towards (see :py:meth:apply_edit_plan) if some deletions are not sent for lack of quota - by default, the remaining items in their current order.
+        """
+        items = list(items)
+        requests = [self.api_service.playlistItems().delete(id=item.item_id) for item in items]
+        with BatchExecutor(api_service=self.api_service, batch_size=batch_size) as batch:
+            for item, request in zip(items, requests):
+                batch.add(request, on_success=functools.partial(self._fold_deleted_item, item=item))
+        if len(batch.deferred) > 0:
+            if target_video_ids is None:
+                unsent_items = [item for (item, request) in zip(items, requests) if any(request is deferred_request for deferred_request in batch.deferred)]
+                target_video_ids = [item.video_id for item in self.items if item not in unsent_items]
+            self._mark_stale(batch.deferred[0], video_ids=target_video_ids)
 
     # https://developers.google.com/youtube/v3/docs/playlistItems#resource
     def delete_video(self, video_id):
         """Delete some video from this playlist. Update YouTube as well."""
-        items_to_delete = list(filter(lambda item: item.video_id == video_id, self.items))
-        for item in items_to_delete:
+        for item in self.items.get_items_by_video_id(video_id):
             self.delete_item(item)
 
-    def sync_items_from_youtube(self):
-        """
+    def sync_items_from_youtube(self, incremental=False, fields=None):
+        """Set self.items from YouTube.
         
+        :param incremental: If True, stop paging at the first item already in self.items, and prepend the newer items. This suits playlists where new items appear at the top, like the uploads playlist. Removed items are not noticed.
+        :param fields: A fields mask. By default, just what :py:meth:PlaylistItem.from_metadata reads.
+        :return: The newly fetched items.
         """
+        known_item_ids = set([item.item_id for item in self._items or []]) if incremental else set()
         playlistitems_list_request = self.api_service.playlistItems().list(
             playlistId=self.id,
             part='snippet',
-            maxResults=50
+            maxResults=50,
+            fields=get_fields_parameter(fields=fields, part='snippet', part_fields=PlaylistItem.PART_FIELDS)
         )
         item_metadatas = []
         while playlistitems_list_request:
             playlistitems_list_response = playlistitems_list_request.execute()
-            item_metadatas.extend(playlistitems_list_response['items'])
+            page_item_metadatas = playlistitems_list_response['items']
+            new_item_metadatas = list(itertools.takewhile(lambda metadata: metadata['id'] not in known_item_ids, page_item_metadatas))
+            item_metadatas.extend(new_item_metadatas)
+            if len(new_item_metadatas) < len(page_item_metadatas):
+                break
             playlistitems_list_request = self.api_service.playlistItems().list_next(
                 playlistitems_list_request, playlistitems_list_response)
 
         item_metadatas.sort(key=lambda item: item['snippet']['position'])
-        self.items = [PlaylistItem.from_metadata(metadata=metadata, api_service=self.api_service) for metadata in item_metadatas]
+        new_items = [PlaylistItem.from_metadata(metadata=metadata, api_service=self.api_service) for metadata in item_metadatas]
+        if incremental:
+            logging.info("Got %d new items for %s", len(new_items), self)
+            self.items = new_items + list(self._items or [])
+        else:
+            self.items = new_items
+        return new_items
 
-    def clear_items(self):
+    def clear_items(self, batch_size=None):
         logging.info("Clearing %d items: %s", len(self.items), self.items)
-        for item in self.items.copy():
-            self.delete_item(item=item)
+        self.delete_items(items=list(self.items), batch_size=batch_size)
 
     def sync_metadata_to_youtube(self):
         """Set metadata info in YouTube."""
@@ -311,10 +823,11 @@ class Playlist(object):
                       'snippet.tags[]': self.tags
                       }
         resource = get_api_request_dict(properties)
-        response = self.api_service.playlists().update(
+        request = self.api_service.playlists().update(
             body=resource,
             part='snippet'
-        ).execute()
+        )
+        response = execute_request(request, priority=PRIORITY_NORMAL)
         logging.info(response)
 
     def add_to_youtube(self):
@@ -330,24 +843,34 @@ class Playlist(object):
             )
         )
 
-        playlists_insert_response = self.api_service.playlists().insert(
+        playlists_insert_request = self.api_service.playlists().insert(
             part='snippet,status',
             body=body
-        ).execute()
+        )
+        playlists_insert_response = execute_request(playlists_insert_request, priority=PRIORITY_HIGH)
         self.id = playlists_insert_response['id']
         logging.info('New playlist ID: %s' % self.id)
 
-    def get_videos(self, part="snippet,status"):
+    def get_videos(self, part="snippet,status", video_ids=None, fields=None):
+        """Get :py:class:YtVideo objects for items in this playlist.
+        
+        :param part: 
+        :param video_ids: If given, get only these videos.
+        :param fields: A fields mask, for a lean projection. By default, just what :py:meth:YtVideo.set_from_yt_metadata reads.
+        :return: 
+        """
         videos = []
         if part=="snippet":
             videos = [item.get_video() for item in self.items]
         else:
-            video_ids = self.get_video_ids()
-            id_chunks = more_itertools.chunked(video_ids, 50)
+            if video_ids is None:
+                video_ids = self.get_video_ids()
+            id_chunks = get_chunks(list(video_ids), 50)
             for id_chunk in id_chunks:
                 response = self.api_service.videos().list(
                     part=part,
-                    id=",".join(id_chunk)
+                    id=",".join(id_chunk),
+                    fields=get_fields_parameter(fields=fields, part=part, part_fields=YtVideo.PART_FIELDS)
                 ).execute()
                 videos.extend([YtVideo.from_yt_metadata(yt_metadata=yt_metadata, api_service=self.api_service) for yt_metadata in response["items"]])
         return videos
@@ -359,45 +882,186 @@ class Playlist(object):
         return [video for video in self.get_videos() if video.upload_status in ok_upload_status]
 
     @classmethod
-    def from_metadata(cls, yt_metadata, api_service=None):
-        """Construct a :py:class:Playlist object from YouTube metadata."""
+    def from_metadata(cls, yt_metadata, api_service=None, sync_items=False, keep_metadata=False):
+        """Construct a :py:class:Playlist object from YouTube metadata.
+        
+        :param keep_metadata: If True, retain yt_metadata as self.yt_metadata.
+        """
         id = yt_metadata['id']
-        title = yt_metadata['snippet']['title']
+        title = yt_metadata['snippet'].get('title', None)
         description = yt_metadata['snippet'].get('description', None)
         tags = yt_metadata['snippet'].get('tags', None)
-        category_id = yt_metadata['snippet'].get('categoryId', 1)
         api_service = api_service
         privacy = 'public'
         if 'status' in yt_metadata:
-            privacy = yt_metadata['status'].get('privacy', "public")
-        self = Playlist(id=id, title=title, description=description, tags=tags, privacy=privacy, api_service=api_service)
-        self.yt_metadata = yt_metadata
+            privacy = yt_metadata['status'].get('privacyStatus', "public")
+        self = Playlist(id=id, title=title, description=description, tags=tags, privacy=privacy, api_service=api_service, sync_items=sync_items)
+        if keep_metadata:
+            self.yt_metadata = yt_metadata
         return self
 
     def get_video_ids(self):
-        return set([item.video_id for item in self.items])
+        return [item.video_id for item in self.items]
 
 
 class Channel(object):
     """Represents a YouTube channel.
     
     """
-    def __init__(self, service_account_file=None, token_file_path=None, client_secret_file=None):
+    def __init__(self, service_account_file=None, token_file_path=None, client_secret_file=None, metadata_cache=None, sync_state_path=None, api_stats=None, http_factory=None, index_keys=None, max_concurrency=None, scheduler=None):
         """
         
         Note: Passing service_account_file does not seem to work as intended.
         :param service_account_file:      
         :param token_file_path: 
         :param client_secret_file: 
+        :param metadata_cache: An optional :py:class:video_curation.metadata_cache.MetadataCache, via which reads are served.
+        :param sync_state_path: An optional json file where the uploads playlist items and videos are remembered across runs, for :py:meth:set_uploaded_videos (incremental=True).
+        :param api_stats: An :py:class:video_curation.api_stats.ApiStats object recording all requests sent to YouTube. A new one is made by default.
+        :param http_factory: A callable returning a new http object to talk to YouTube with, in place of one authorized with the above credentials (eg. an offline stand-in in tests).
+        :param index_keys: A dict from index name to a key function, by which self.video_index and self.playlist_index index videos and playlists. More may be added via :py:meth:add_index_key .
+        :param max_concurrency: If not None, read videos and playlists with up to this many concurrent requests, via :py:class:video_curation.async_youtube_client.AsyncChannel .
+        :param scheduler: A :py:class:video_curation.request_scheduler.RequestScheduler, under which all requests are sent (with retries), and writes deferred once the quota runs low. A new one (without a daily quota) by default.
         """
+        self.http_factory = http_factory
+        if api_stats is None:
+            api_stats = ApiStats()
+        self.api_stats = api_stats
+        if scheduler is None:
+            scheduler = RequestScheduler()
+        self.scheduler = scheduler
+        self.metadata_cache = metadata_cache
+        self.sync_state_path = sync_state_path
+        # Video id to YtVideo, for every video in self.uploads_playlist (including those still being processed).
+        self.uploads_videos = {}
+        self._uploads_items_from_sync_state = False
         self._set_authenticated_service(service_account_file=service_account_file, token_file_path=token_file_path, client_secret_file=client_secret_file)
+        self.async_channel = None
+        if max_concurrency is not None:
+            # Imported here since async_youtube_client builds on this module.
+            from video_curation.async_youtube_client import AsyncChannel
+            self.async_channel = AsyncChannel(channel=self, max_concurrency=max_concurrency)
         self.uploads_playlist = self.get_uploads_playlist()
         self.uploaded_vids = None
         self.playlists = []
+        # Rebuilt on every sync, and kept up to date via index_video and index_playlist.
+        self.video_index = ChannelIndex(key_functions=index_keys)
+        self.playlist_index = ChannelIndex(key_functions=index_keys)
+
+    def set_uploaded_videos(self, incremental=False, fields=None):
+        """Set self.uploaded_vids.
+        
+        :param incremental: If True, only fetch items added to the uploads playlist since the last sync (remembered in self.sync_state_path across runs), and only fetch their videos, those which were still being processed, and those edited elsewhere since (see :py:meth:_get_changed_video_ids). Deleted videos are only noticed by a full sync.
+        :param fields: A fields mask for the videos, for a lean projection. By default, just what :py:meth:YtVideo.set_from_yt_metadata reads.
+        """
+        if incremental and len(self.uploads_videos) > 0:
+            new_items = self.uploads_playlist.sync_items_from_youtube(incremental=True)
+            stale_video_ids = [item.video_id for item in new_items] + [video.id for video in self.uploads_videos.values() if video.upload_status not in ok_upload_status]
+            stale_video_ids += self._get_changed_video_ids(videos=[video for video in self.uploads_videos.values() if video.upload_status in ok_upload_status])
+            videos = self._get_uploads_videos(video_ids=stale_video_ids, fields=fields)
+            self.uploads_videos.update(dict([(video.id, video) for video in videos]))
+        elif self.async_channel is not None and self._uploads_items_from_sync_state:
+            # Relist the items, fetching the videos of every page meanwhile.
+            self.uploads_videos = self.async_channel.run(self.async_channel.sync_playlist_items_and_videos(playlist=self.uploads_playlist, fields=fields))
+            self._uploads_items_from_sync_state = False
+        else:
+            if self._uploads_items_from_sync_state:
+                self.uploads_playlist.sync_items_from_youtube()
+                self._uploads_items_from_sync_state = False
+            self.uploads_videos = dict([(video.id, video) for video in self._get_uploads_videos(video_ids=self.uploads_playlist.get_video_ids(), fields=fields)])
+        videos = [self.uploads_videos[video_id] for video_id in self.uploads_playlist.get_video_ids() if video_id in self.uploads_videos]
+        self.uploaded_vids = [video for video in videos if video.upload_status in ok_upload_status]
+        self.video_index.set_items(self.uploaded_vids)
+        self.save_sync_state()
+
+    def add_index_key(self, name, key_function):
+        """Index videos and playlists by key_function too (unless an index of that name exists). See :py:class:video_curation.channel_index.ChannelIndex ."""
+        self.video_index.add_key(name=name, key_function=key_function)
+        self.playlist_index.add_key(name=name, key_function=key_function)
+
+    def index_video(self, video):
+        """(Re)index a video just uploaded or edited, adding it to self.uploaded_vids if new."""
+        if video.id not in self.uploads_videos:
+            self.uploads_videos[video.id] = video
+            if self.uploaded_vids is not None and video.upload_status in ok_upload_status:
+                self.uploaded_vids.append(video)
+        self.video_index.add(video)
+
+    def index_playlist(self, playlist):
+        """(Re)index a playlist just added or edited, adding it to self.playlists if new."""
+        if playlist.id not in self.playlist_index.items:
+            self.playlists.append(playlist)
+        self.playlist_index.add(playlist)
+
+    def _get_changed_video_ids(self, videos, batch_size=DEFAULT_BATCH_SIZE):
+        """Ids of those videos whose etag at YouTube differs from their own (or who have none) - ie. which changed since they were read.
+
+        Lists just ids and etags (of the same parts that :py:meth:Playlist.get_videos reads, which etags depend on), 50 videos per request, in batches of batch_size requests. Videos which are not listed, or whose requests fail, are taken to be unchanged.
+        """
+        etags = {}
 
-    def set_uploaded_videos(self):
-        """Set self.uploaded_vids."""
-        self.uploaded_vids = self.uploads_playlist.get_uploaded()
+        def record_etags(response):
+            etags.update([(item['id'], item.get('etag')) for item in response.get('items', [])])
+        with BatchExecutor(api_service=self.api_service, batch_size=batch_size) as batch:
+            for id_chunk in get_chunks([video.id for video in videos], 50):
+                batch.add(self.api_service.videos().list(part="snippet,status", id=",".join(id_chunk), fields="items(id,etag)"), on_success=record_etags)
+        changed_video_ids = [video.id for video in videos if video.id in etags and (video.etag is None or etags[video.id] != video.etag)]
+        logging.info("%d of %d known videos changed at YouTube.", len(changed_video_ids), len(videos))
+        return changed_video_ids
+
+    def _get_uploads_videos(self, video_ids, fields=None):
+        if self.async_channel is None:
+            return self.uploads_playlist.get_videos(video_ids=video_ids, fields=fields)
+        return self.async_channel.run(self.async_channel.get_videos(video_ids=video_ids, fields=fields))
+
+    def set_video_metadatas(self, video_metadatas, batch_size=DEFAULT_BATCH_SIZE):
+        """Set the desired metadata of many uploaded videos, sending only real changes - see :py:func:push_video_metadatas .
+        
+        :param video_metadatas: A dict from video id to a dict of desired :py:class:YtVideo attributes among title, description, tags, category_id and privacy.
+        :param batch_size: 
+        :return: The videos which were updated.
+        """
+        videos = []
+        for video_id, metadata in video_metadatas.items():
+            video = self.uploads_videos[video_id]
+            for attribute, value in metadata.items():
+                setattr(video, attribute, value)
+            videos.append(video)
+        updated_videos = push_video_metadatas(videos=videos, batch_size=batch_size)
+        for video in updated_videos:
+            self.index_video(video)
+        self.save_sync_state()
+        return updated_videos
+
+    def save_sync_state(self):
+        """Remember the uploads playlist items and videos (as last seen at YouTube) in self.sync_state_path, if any."""
+        if self.sync_state_path is None:
+            return
+        state = {'uploads_playlist_id': self.uploads_playlist.id,
+                 'items': [item.to_yt_metadata() for item in self.uploads_playlist.items],
+                 'videos': [video.remote_metadata or video.to_yt_metadata() for video in self.uploads_videos.values()]}
+        temp_path = self.sync_state_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp_path, self.sync_state_path)
+
+    def _load_sync_state(self, playlist):
+        """Set items of the uploads playlist and self.uploads_videos from self.sync_state_path.
+        
+        :return: False if there was no usable state.
+        """
+        if self.sync_state_path is None or not os.path.exists(self.sync_state_path):
+            return False
+        with open(self.sync_state_path) as f:
+            state = json.load(f)
+        if state['uploads_playlist_id'] != playlist.id:
+            logging.warning("Ignoring sync state for a different uploads playlist: %s", state['uploads_playlist_id'])
+            return False
+        playlist.items = [PlaylistItem.from_metadata(metadata=metadata, api_service=self.api_service) for metadata in state['items']]
+        self.uploads_videos = dict([(metadata['id'], YtVideo.from_yt_metadata(yt_metadata=metadata, api_service=self.api_service)) for metadata in state['videos']])
+        logging.info("Loaded %d items and %d videos from %s", len(playlist.items), len(self.uploads_videos), self.sync_state_path)
+        self._uploads_items_from_sync_state = True
+        return True
 
     def delete_rejected_videos(self, dry_run=True):
         for video in self.uploads_playlist.get_videos():
@@ -408,7 +1072,7 @@ class Channel(object):
         self.set_uploaded_videos()
 
     def _set_authenticated_service(self, service_account_file=None, token_file_path=None, client_secret_file=None):
-        """ Set self.api_service, via which all communication with YouTube happens.
+        """ Set self.api_service, via which all communication with YouTube happens - from any thread, over self.http_pool .
         
         Note: Passing service_account_file does not seem to work as intended.
         :param service_account_file:      
@@ -418,15 +1082,57 @@ class Channel(object):
         scopes = ['https://www.googleapis.com/auth/youtube']
         api_service_name = 'youtube'
         api_version = 'v3'
-        credentials = api_helper.get_credentials(service_account_file=service_account_file, token_file_path=token_file_path, client_secrets_file=client_secret_file, scopes=scopes)
-        self.api_service = build(serviceName=api_service_name, version=api_version, credentials=credentials)
+        credentials = None
+        if self.http_factory is None:
+            credentials = google_api_helper.get_credentials(service_account_file=service_account_file, token_file_path=token_file_path, client_secrets_file=client_secret_file, scopes=scopes)
+        self.credentials = credentials
+        self.http_pool = HttpPool(http_factory=self.new_http, credentials=credentials, scheduler=self.scheduler)
+        self.api_service = google_api_helper.build_service(api_service_name=api_service_name, api_version=api_version, http=self.http_pool)
         logging.info("Done authenticating.")
 
-    def set_playlists(self):
-        """Set self.playlists."""
+    def new_http(self):
+        """Get a new authorized http object for this channel (reading via self.metadata_cache, if any).
+        
+        httplib2 objects are not thread-safe, so every thread talking to YouTube needs its own.
+        Requests which actually reach YouTube (ie. not served from the cache) are sent under self.scheduler, and every attempt is recorded in self.api_stats.
+        """
+        if self.http_factory is not None:
+            http = self.http_factory()
+        else:
+            import google_auth_httplib2
+            from googleapiclient.http import build_http
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=build_http())
+        http = self.scheduler.wrap(self.api_stats.wrap(http))
+        if self.metadata_cache is not None:
+            http = self.metadata_cache.wrap(http)
+        return http
+
+    def run_deferred_requests(self):
+        """Send requests deferred (in earlier quota windows) by self.scheduler, as far as the quota allows. Best called before any new work.
+
+        Then re-plans the playlists which the scheduler marked stale (for their positional edits are never deferred) - see :py:meth:Playlist.set_videos .
+        :return: The number of deferred requests sent.
+        """
+        num_sent = self.scheduler.run_deferred(http=self.http_pool)
+        for playlist_id, video_ids in self.scheduler.pop_stale_playlists().items():
+            playlist = Playlist(api_service=self.api_service, title=None, id=playlist_id)
+            logging.info("Re-planning stale %s.", playlist)
+            playlist.set_videos(video_ids=video_ids, batch_size=DEFAULT_BATCH_SIZE)
+        return num_sent
+
+    def set_playlists(self, fields=None):
+        """Set self.playlists. Their items are listed on first access - or, many at once, via :py:meth:prefetch .
+        
+        :param fields: A fields mask for the playlists. By default, just what :py:meth:Playlist.from_metadata reads.
+        """
+        if self.async_channel is not None:
+            self.playlists = self.async_channel.run(self.async_channel.get_playlists(with_items=False, fields=fields))
+            self.playlist_index.set_items(self.playlists)
+            return
         request = self.api_service.playlists().list(mine=True,
                                           part='snippet, status',
-                                          maxResults=50
+                                          maxResults=50,
+                                          fields=get_fields_parameter(fields=fields, part='snippet, status', part_fields=Playlist.PART_FIELDS)
                                           )
         self.playlists = []
         while request:
@@ -440,7 +1146,26 @@ class Channel(object):
 
             request = self.api_service.playlists().list_next(
                 request, response)
+        self.playlist_index.set_items(self.playlists)
+
+    def prefetch(self, playlists=None, concurrency=8):
+        """List the items of many playlists concurrently.
         
+        :param playlists: Defaults to self.playlists. Playlists whose items are already listed are skipped.
+        :param concurrency: The number of listings at once.
+        """
+        if playlists is None:
+            playlists = self.playlists
+        playlists = [playlist for playlist in playlists if not playlist.items_loaded()]
+        if len(playlists) == 0:
+            return
+        logging.info("Prefetching items of %d playlists.", len(playlists))
+        from video_curation.async_youtube_client import AsyncChannel
+        async_channel = AsyncChannel(channel=self, max_concurrency=concurrency)
+        try:
+            async_channel.run(async_channel.sync_playlists_items(playlists))
+        finally:
+            async_channel.client.close()
 
     def get_uploads_playlist(self):
         """Get the uploads playlist for this channel."""
@@ -449,27 +1174,42 @@ class Channel(object):
         # authenticated user's channel.
         channels_response = self.api_service.channels().list(
             mine=True,
-            part='contentDetails'
+            part='contentDetails',
+            fields='items(id,contentDetails/relatedPlaylists/uploads)'
         ).execute()
     
         for channel in channels_response['items']:
             # From the API response, extract the playlist ID that identifies the list
             # of videos uploaded to the authenticated user's channel.
-            return Playlist(id=channel['contentDetails']['relatedPlaylists']['uploads'], api_service=self.api_service, title="Uploads", description="", tags=[])
+            playlist = Playlist(id=channel['contentDetails']['relatedPlaylists']['uploads'], api_service=self.api_service, title="Uploads", description="", tags=[], sync_items=False)
+            if not self._load_sync_state(playlist=playlist):
+                playlist.sync_items_from_youtube()
+            return playlist
         return None
 
 
-def _resumable_upload(insert_request):
-    """ This method implements an exponential backoff strategy to resume a failed upload. Called from :py:class:YtVideo.
+def _resumable_upload(insert_request, http=None, progress_callback=None, session_store=None, filepath=None, chunk_sizer=None, chunk_throttle=None):
+    """ This method implements an exponential backoff strategy (see :py:func:video_curation.request_scheduler.get_backoff_seconds) to resume a failed upload. Called from :py:class:YtVideo.
+
+    Upload chunks are retried only here (not by :py:class:video_curation.request_scheduler.ScheduledHttp), since a resumed upload first asks the server which bytes it got.
     
     :param insert_request: 
-    :return: 
+    :param http: If not None, used in place of the http object insert_request was built with.
+    :param progress_callback: Called with the number of bytes uploaded so far, after every chunk.
+    :param session_store: If not None, the session of this upload of filepath is saved there after every chunk, and deleted on completion.
+    :param filepath: 
+    :param chunk_sizer: If not None, sets the size of every chunk.
+    :param chunk_throttle: If not None, called as chunk_throttle(chunksize, bytes_remaining) before every chunk, returning the chunk size to use.
+    :return: The id of the uploaded video.
     """
+    import httplib2
+    from googleapiclient.errors import HttpError
+
     # Explicitly tell the underlying HTTP transport library not to retry, since
     # we are handling retry logic ourselves.
     httplib2.RETRIES = 1
     
-    # Maximum number of times to retry before giving up.
+    # Maximum number of times to retry (in a row) before giving up.
     MAX_RETRIES = 10
     
     # Always retry when these exceptions are raised.
@@ -481,22 +1221,50 @@ def _resumable_upload(insert_request):
     # Always retry when an apiclient.errors.HttpError with one of these status
     # codes is raised.
     RETRIABLE_STATUS_CODES = [500, 502, 503, 504]
+    # A resumed session which the server no longer knows yields one of these.
+    EXPIRED_SESSION_STATUS_CODES = [404, 410]
+    request_state = ResumableRequestState(insert_request)
     response = None
-    error = None
     retry = 0
     while response is None:
+        error = None
         try:
             logging.info("Uploading file...")
-            status, response = insert_request.next_chunk()
+            if chunk_sizer is not None:
+                request_state.set_chunksize(chunk_sizer.chunksize)
+            if chunk_throttle is not None:
+                bytes_remaining = insert_request.resumable.size() - insert_request.resumable_progress
+                chunksize = insert_request.resumable.chunksize()
+                request_state.set_chunksize(chunk_throttle(max(bytes_remaining, 1) if chunksize == -1 else chunksize, bytes_remaining))
+            progress_before = insert_request.resumable_progress
+            start_time = time.time()
+            status, response = insert_request.next_chunk(http=http)
+            if chunk_sizer is not None:
+                chunk_sizer.record_success(num_bytes=insert_request.resumable_progress - progress_before, seconds=time.time() - start_time)
+            retry = 0
+            if response is None and session_store is not None:
+                session_store.put(filepath=filepath, session_uri=insert_request.resumable_uri, bytes_confirmed=insert_request.resumable_progress)
+            if progress_callback is not None:
+                progress_callback(insert_request.resumable_progress if response is None else insert_request.resumable.size())
+            if response is None:
+                continue
+            if session_store is not None:
+                session_store.delete(filepath=filepath)
             if 'id' in response:
                 logging.info("Video id '%s' was successfully uploaded." % response['id'])
                 return response['id']
             else:
-                exit("The upload failed with an unexpected response: %s" % response)
+                raise UploadError("The upload failed with an unexpected response: %s" % response)
         except HttpError as e:
             if e.resp.status in RETRIABLE_STATUS_CODES:
                 error = "A retriable HTTP error %d occurred:\n%s" % (e.resp.status,
                                                                      e.content)
+            elif e.resp.status in EXPIRED_SESSION_STATUS_CODES and insert_request.resumable_uri is not None:
+                logging.warning("Upload session %s has expired. Restarting the upload.", insert_request.resumable_uri)
+                request_state.restart()
+                if session_store is not None:
+                    session_store.delete(filepath=filepath)
+                continue
             else:
                 raise
         except RETRIABLE_EXCEPTIONS as e:
@@ -504,11 +1272,12 @@ def _resumable_upload(insert_request):
 
         if error is not None:
             logging.error(error)
+            if chunk_sizer is not None:
+                chunk_sizer.record_error()
             retry += 1
             if retry > MAX_RETRIES:
-                exit("No longer attempting to retry.")
+                raise UploadError("No longer attempting to retry.")
 
-            max_sleep = 2 ** retry
-            sleep_seconds = random.random() * max_sleep
+            sleep_seconds = get_backoff_seconds(retry)
             logging.info("Sleeping %f seconds and then retrying..." % sleep_seconds)
             time.sleep(sleep_seconds)